@@ -0,0 +1,68 @@
+"""
+Compare `PickleEncoder` and `BinaryEncoder` on encode/decode throughput and wire size.
+
+Run from the repository root:
+```sh
+python3 -m benchmarks.encoding_benchmark [cycle_length] [repetitions]
+```
+"""
+
+import sys
+import timeit
+
+from src.private_billing.core import (
+    CycleContext,
+    Data,
+    HidingContext,
+    Int64ToFloatConvertor,
+    SharedMaskGenerator,
+    vector,
+)
+from src.private_billing.message_encoding import BinaryEncoder
+from src.private_billing.messages import ContextMessage, DataMessage, HiddenDataMessage
+from src.private_billing.server import PickleEncoder, TCPAddress
+
+
+def build_messages(cycle_length: int) -> dict:
+    address = TCPAddress("localhost", 5555)
+    data = Data(1, 0, vector.new(cycle_length, 1.5), vector.new(cycle_length, -2.5))
+    cyc = CycleContext(
+        0,
+        cycle_length,
+        vector.new(cycle_length, 0.21),
+        vector.new(cycle_length, 0.05),
+        vector.new(cycle_length, 0.11),
+    )
+    hc = HidingContext(cycle_length, SharedMaskGenerator(Int64ToFloatConvertor(6, 4)))
+    hd = data.hide(hc)
+
+    # Repeatedly deserializing the same relinearization key within one process is
+    # refused by OpenFHE, so leave out the public hiding context.
+    hd.phc = None
+    return {
+        "DataMessage": DataMessage(address, data),
+        "ContextMessage": ContextMessage(address, cyc),
+        "HiddenDataMessage": HiddenDataMessage(address, hd),
+    }
+
+
+def bench(encoder, msg, repetitions: int) -> tuple[int, float, float]:
+    enc = encoder.encode(msg)
+    encode_time = timeit.timeit(lambda: encoder.encode(msg), number=repetitions)
+    decode_time = timeit.timeit(lambda: encoder.decode(enc), number=repetitions)
+    return len(enc), repetitions / encode_time, repetitions / decode_time
+
+
+if __name__ == "__main__":
+    args = sys.argv + [None] * 2
+    cycle_length = int(args[1] or 672)
+    repetitions = int(args[2] or 20)
+
+    print(f"{'message':<18} {'encoder':<14} {'bytes':>10} {'enc/s':>10} {'dec/s':>10}")
+    for name, msg in build_messages(cycle_length).items():
+        for encoder in (PickleEncoder, BinaryEncoder):
+            size, enc_rate, dec_rate = bench(encoder, msg, repetitions)
+            print(
+                f"{name:<18} {encoder.__name__:<14} {size:>10} "
+                f"{enc_rate:>10.1f} {dec_rate:>10.1f}"
+            )
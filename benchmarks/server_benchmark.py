@@ -0,0 +1,77 @@
+"""
+Compare the blocking REP runtime (`RequestReplyServer`) to the asyncio ROUTER
+runtime (`AsyncRequestReplyServer`) on concurrent requests.
+
+Every request is handled by a handler that waits `handler_ms` milliseconds,
+standing in for I/O done while handling. Clients keep all requests in flight
+at once.
+
+Run from the repository root:
+```sh
+python3 -m benchmarks.server_benchmark [requests] [handler_ms]
+```
+"""
+
+import asyncio
+import sys
+from threading import Thread
+import time
+
+from src.private_billing.server import (
+    AsyncRequestReplyServer,
+    Message,
+    PickleEncoder,
+    RequestReplyServer,
+    TCPAddress,
+)
+
+
+class RepServer(RequestReplyServer):
+    handler_time: float = 0.0
+
+    def _handle(self, msg: Message) -> None:
+        time.sleep(self.handler_time)
+        self.reply(msg)
+
+
+class RouterServer(AsyncRequestReplyServer):
+    handler_time: float = 0.0
+
+    async def _handle(self, msg: Message) -> Message:
+        await asyncio.sleep(self.handler_time)
+        return msg
+
+
+def bench(server, port: int, requests: int, handler_time: float) -> float:
+    server.handler_time = handler_time
+    thread = Thread(target=server.start, args=(port, 100))
+    thread.start()
+
+    target = TCPAddress("localhost", port)
+    client = RequestReplyServer(PickleEncoder, window=requests)
+    client.send("warmup", target)
+
+    started = time.perf_counter()
+    futures = [client.send_frames_async([PickleEncoder.encode(i)], target) for i in range(requests)]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - started
+
+    server.terminate()
+    thread.join()
+    client.connections.close()
+    return requests / elapsed
+
+
+if __name__ == "__main__":
+    args = sys.argv + [None] * 2
+    requests = int(args[1] or 200)
+    handler_time = float(args[2] or 5) / 1000
+
+    print(f"{'runtime':<24} {'req/s':>10}")
+    for port, server in (
+        (5590, RepServer(PickleEncoder)),
+        (5591, RouterServer(PickleEncoder)),
+    ):
+        rate = bench(server, port, requests, handler_time)
+        print(f"{type(server).__bases__[0].__name__:<24} {rate:>10.1f}")
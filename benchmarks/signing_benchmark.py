@@ -0,0 +1,36 @@
+"""
+Measure sign and verify throughput per signature scheme.
+
+Run from the repository root:
+```sh
+python3 -m benchmarks.signing_benchmark [message_size] [repetitions]
+```
+"""
+
+import os
+import sys
+import timeit
+
+from src.private_billing.server.signing import SIGNATURE_SCHEMES, Signer
+
+
+if __name__ == "__main__":
+    args = sys.argv + [None] * 2
+    message_size = int(args[1] or 1024)
+    repetitions = int(args[2] or 1000)
+
+    msg = os.urandom(message_size)
+    print(f"{'scheme':<10} {'sign/s':>10} {'verify/s':>10}")
+    for scheme in SIGNATURE_SCHEMES:
+        signer = Signer(schemes=(scheme,))
+        tpk = signer.get_transferable_public_key()
+        signature = signer.sign(msg)
+
+        sign_time = timeit.timeit(lambda: signer.sign(msg), number=repetitions)
+        verify_time = timeit.timeit(
+            lambda: Signer.verify(msg, signature, tpk), number=repetitions
+        )
+        print(
+            f"{scheme:<10} {repetitions / sign_time:>10.0f} "
+            f"{repetitions / verify_time:>10.0f}"
+        )
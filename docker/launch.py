@@ -1,6 +1,6 @@
 import os
 from src.private_billing.server import TCPAddress
-from src.private_billing import launch_core, launch_edge
+from src.private_billing import launch_core, launch_core_host, launch_edge
 
 if __name__ == "__main__":
     server_type = os.environ.get("SERVER_TYPE")
@@ -13,11 +13,31 @@ if __name__ == "__main__":
     match server_type:
         case "edge":
             cyc_len = os.environ.get("CYCLE_LENGTH", 672)
-            launch_edge(edge_address, cyc_len)
+            onboarding_window = os.environ.get("ONBOARDING_WINDOW")
+            if onboarding_window is not None:
+                onboarding_window = float(onboarding_window)
+            publish_port = os.environ.get("PUBLISH_PORT")
+            if publish_port is not None:
+                publish_port = int(publish_port)
+            launch_edge(edge_address, cyc_len, onboarding_window, publish_port)
         case "core":
             core_host = os.environ.get("CORE_HOST", "0.0.0.0")
             core_port = os.environ.get("CORE_PORT", 5556)
             server_address = TCPAddress(core_host, core_port)
-            launch_core(server_address, edge_address)
+            bill_port = os.environ.get("BILL_PORT")
+            if bill_port is not None:
+                bill_port = int(bill_port)
+            bill_key = os.environ.get("BILL_KEY")
+            if bill_key is not None:
+                bill_key = bytes.fromhex(bill_key)
+            bill_host = os.environ.get("BILL_HOST", "localhost")
+            launch_core(server_address, edge_address, bill_port, bill_key, bill_host)
+        case "core_host":
+            core_host = os.environ.get("CORE_HOST", "0.0.0.0")
+            core_port = os.environ.get("CORE_PORT", 5556)
+            server_address = TCPAddress(core_host, core_port)
+            households = int(os.environ.get("HOUSEHOLDS", 1))
+            names = [f"household-{i}" for i in range(households)]
+            launch_core_host(server_address, edge_address, names)
         case _:
             raise ValueError(f"{server_type} is invalid type")
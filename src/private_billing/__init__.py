@@ -1,5 +1,6 @@
 from .core import Bill, CycleID, Data, HiddenData, HiddenBill
-from .core_server import CoreServer, launch_core
+from .core_server import CoreServer, launch_core, open_bill
+from .core_host import CoreHost, launch_core_host
 from .edge_server import EdgeServer, launch_edge
 from .messages import Message
 from .log import logger
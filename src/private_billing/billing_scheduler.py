@@ -0,0 +1,219 @@
+from dataclasses import dataclass
+from enum import IntEnum
+import inspect
+import math
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional
+
+from .core import CycleID
+from .log import full_stack, logger
+
+
+class BillingPriority(IntEnum):
+    """Priority of a billing run, lower runs first."""
+
+    LIVE = 0
+    BACKFILL = 1
+
+
+@dataclass
+class BillingRun:
+    """
+    Scheduled billing run of a cycle.
+
+    :param cycle_id: cycle to bill
+    :param priority: priority of the run
+    :param deadline: time (monotonic) by which the run should be done
+    :param triggered_at: time of the first trigger of this run
+    :param not_before: time before which the run may not start, to coalesce triggers
+    :param triggers: number of triggers coalesced into this run
+    :param started_at: time the run started, if it did
+    :param finished_at: time the run finished, if it did
+    :param failed: whether the run raised an exception
+    """
+
+    cycle_id: CycleID
+    priority: BillingPriority
+    deadline: float
+    triggered_at: float
+    not_before: float
+    triggers: int = 1
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    failed: bool = False
+
+    @property
+    def queue_time(self) -> Optional[float]:
+        """Seconds between the first trigger and the start of the run."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.triggered_at
+
+    @property
+    def run_time(self) -> Optional[float]:
+        """Seconds the run took."""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def sort_key(self) -> tuple:
+        return (self.priority, self.deadline, self.triggered_at)
+
+
+class BillingScheduler:
+    """
+    Schedules billing runs on a dedicated pool of workers.
+
+    Runs are ordered by priority, live cycles before backfill, and then by
+    deadline. Triggers for a cycle that is already queued are coalesced into
+    the queued run. Each run is delayed by `debounce` seconds after its first
+    trigger, such that a burst of triggers results in a single run. A trigger
+    for a cycle that is being billed queues one follow-up run.
+
+    :param run: function billing a cycle. Bound methods are held weakly, such
+    that the scheduler does not keep the server owning it alive.
+    :param workers: number of worker threads. If 0, runs execute right away,
+    in the triggering thread.
+    :param debounce: seconds to wait for more triggers before starting a run.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[CycleID], None],
+        workers: int = 1,
+        debounce: float = 0.0,
+    ) -> None:
+        self._run = weakref.WeakMethod(run) if inspect.ismethod(run) else lambda: run
+        self.workers = workers
+        self.debounce = debounce
+
+        self.queued: Dict[CycleID, BillingRun] = {}
+        self.running: Dict[CycleID, BillingRun] = {}
+        self.finished: Dict[CycleID, BillingRun] = {}
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._keep_running = True
+
+    def trigger(
+        self,
+        cycle_id: CycleID,
+        priority: BillingPriority = BillingPriority.LIVE,
+        deadline: Optional[float] = None,
+    ) -> None:
+        """
+        Request billing of `cycle_id`.
+
+        :param cycle_id: cycle to bill
+        :param priority: priority of the run
+        :param deadline: time (monotonic) by which the run should be done, if any
+        """
+        now = time.monotonic()
+        deadline = math.inf if deadline is None else deadline
+        with self._condition:
+            queued = self.queued.get(cycle_id)
+            if queued is not None:
+                queued.priority = min(queued.priority, priority)
+                queued.deadline = min(queued.deadline, deadline)
+                queued.triggers += 1
+                return
+
+            run = BillingRun(cycle_id, priority, deadline, now, now + self.debounce)
+            self.queued[cycle_id] = run
+            self._condition.notify()
+
+        if self.workers == 0:
+            self._run_pending()
+        else:
+            self._ensure_running()
+
+    def close(self) -> None:
+        """Stop the workers, once the runs in progress are done."""
+        with self._condition:
+            self._keep_running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _ensure_running(self) -> None:
+        with self._condition:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work, name=f"billing-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_run(self, now: float) -> tuple[Optional[BillingRun], Optional[float]]:
+        """
+        Pick the next run to start.
+        :returns: the run, or None and the time until a run may start.
+        """
+        startable = [
+            run
+            for run in self.queued.values()
+            if run.not_before <= now and run.cycle_id not in self.running
+        ]
+        if startable:
+            return min(startable, key=BillingRun.sort_key), None
+
+        waiting = [
+            run.not_before - now
+            for run in self.queued.values()
+            if run.cycle_id not in self.running
+        ]
+        return None, min(waiting, default=None)
+
+    def _take_run(self, block: bool) -> Optional[BillingRun]:
+        """Take the next run off the queue, waiting for one if `block`."""
+        with self._condition:
+            while self._keep_running:
+                run, wait_time = self._next_run(time.monotonic())
+                if run is not None:
+                    del self.queued[run.cycle_id]
+                    self.running[run.cycle_id] = run
+                    run.started_at = time.monotonic()
+                    return run
+                if not block and wait_time is None:
+                    return None
+                self._condition.wait(wait_time)
+        return None
+
+    def _work(self) -> None:
+        while (run := self._take_run(block=True)) is not None:
+            self._execute(run)
+
+    def _run_pending(self) -> None:
+        while (run := self._take_run(block=False)) is not None:
+            self._execute(run)
+
+    def _execute(self, run: BillingRun) -> None:
+        try:
+            bill = self._run()
+            if bill is None:
+                raise RuntimeError("owner of the billing scheduler is gone")
+            bill(run.cycle_id)
+        except Exception as e:
+            run.failed = True
+            logger.error(f"billing {run.cycle_id=} failed: {str(e)}")
+            logger.debug(full_stack())
+        finally:
+            run.finished_at = time.monotonic()
+            with self._condition:
+                del self.running[run.cycle_id]
+                self.finished[run.cycle_id] = run
+                self._condition.notify_all()
+
+        logger.info(
+            f"billed {run.cycle_id=} ({run.triggers} triggers): "
+            f"queued {run.queue_time:.3f}s, ran {run.run_time:.3f}s"
+        )
+        if run.finished_at > run.deadline:
+            logger.warning(
+                f"billing {run.cycle_id=} missed its deadline "
+                f"by {run.finished_at - run.deadline:.3f}s"
+            )
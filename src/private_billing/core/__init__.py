@@ -1,9 +1,13 @@
 from .bill import Bill
 from .billing import SharedBilling
+from .billing_pool import BillingPool
+from .hiding_pool import HidingPool
 from .cycle import CycleID, CycleContext, SharedCycleData, ClientID
 from .data import Data
+from .data_accumulator import DataAccumulator
 from .hidden_bill import HiddenBill
 from .hidden_data import HiddenData
 from .hiding import HidingContext, PublicHidingContext
+from .meter_store import MeterStore
 from .masking import SharedMaskGenerator, Int64Convertor, Int64ToFloatConvertor, SEED
 from .utils import vector, Flag
@@ -1,3 +1,7 @@
+from __future__ import annotations
+from typing import Iterator, Optional, Tuple
+
+from .billing_pool import BillingPool
 from .hidden_bill import HiddenBill
 from .cycle import CycleContext, CycleID, ClientID
 from .data import HiddenData
@@ -6,9 +10,13 @@ from .data import HiddenData
 class SharedBilling:
     """
     Component computing the peer-to-peer bills.
+
+    :param pool: pool of worker processes to compute bills on.
+    If None, bills are computed in this process, one client at a time.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, pool: Optional[BillingPool] = None) -> None:
+        self.pool = pool
         self.client_data: dict[CycleID, dict[ClientID, HiddenData]] = {}
         self.cycle_contexts: dict[CycleID, CycleContext] = {}
         self.clients: set[ClientID] = set()
@@ -57,6 +65,18 @@ class SharedBilling:
         ready for.
         :return: map of clients and their bills
         """
+        return dict(self.iter_bills(cid))
+
+    def iter_bills(self, cid: CycleID) -> Iterator[Tuple[ClientID, HiddenBill]]:
+        """
+        Compute bills for all clients, for a given cycle, yielding each bill
+        as soon as it is computed.
+
+        :param cid: cycle to compute bills for
+        :raises ValueError: when asked to perform billing for a round it is not
+        ready for.
+        :return: iterator over clients and their bills
+        """
         if not self.is_ready(cid):
             raise ValueError(f"cannot run billing for cycle {cid}")
 
@@ -71,11 +91,12 @@ class SharedBilling:
         scd = HiddenData.unmask_data(included_cycle_data)
         scd.check_validity(cyc)
 
-        bills = {}
-        for c, data in cycle_data.items():
-            bills[c] = data.compute_hidden_bill(scd, cyc)
+        if self.pool is not None:
+            yield from self.pool.compute_bills(cycle_data, scd, cyc)
+            return
 
-        return bills
+        for c, data in cycle_data.items():
+            yield c, data.compute_hidden_bill(scd, cyc)
 
     def is_ready(self, cid: CycleID) -> bool:
         """
@@ -0,0 +1,152 @@
+from __future__ import annotations
+import multiprocessing
+from multiprocessing.pool import Pool
+from multiprocessing.shared_memory import SharedMemory
+import os
+import pickle
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .cycle import CycleContext, ClientID, SharedCycleData
+from .hidden_bill import HiddenBill
+from .hidden_data import HiddenData
+
+Span = Tuple[int, int]
+Shard = List[Tuple[ClientID, Span]]
+
+
+class BillingPool:
+    """
+    Computes hidden bills on a pool of worker processes.
+
+    Per cycle, the serialized hidden data of all clients, and the billing plan
+    (shared cycle data and cycle context), are written to a single shared
+    memory block once. Workers read their share of clients straight from that
+    block, and keep the plan for as long as they work on the same cycle.
+    Bills are yielded as soon as their shard of clients is done.
+
+    Each worker is limited to `threads_per_process` OpenMP threads, such that
+    the workers together do not oversubscribe the available cores.
+
+    :param processes: number of worker processes, defaults to the number of cores.
+    :param threads_per_process: number of OpenMP threads per worker process,
+    defaults to an equal share of the cores.
+    :param shard_size: number of clients handed to a worker at once.
+    """
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        threads_per_process: Optional[int] = None,
+        shard_size: int = 8,
+    ) -> None:
+        cores = os.cpu_count() or 1
+        self.processes = processes or cores
+        self.threads_per_process = threads_per_process or max(1, cores // self.processes)
+        self.shard_size = shard_size
+        self._pool: Optional[Pool] = None
+
+    def compute_bills(
+        self,
+        cycle_data: Dict[ClientID, HiddenData],
+        scd: SharedCycleData,
+        cyc: CycleContext,
+    ) -> Iterator[Tuple[ClientID, HiddenBill]]:
+        """
+        Compute the hidden bills of all clients in `cycle_data`.
+
+        :param cycle_data: hidden data, per client
+        :param scd: shared cycle data
+        :param cyc: cycle context
+        :return: iterator over clients and their bills, in order of completion
+        """
+        plan = pickle.dumps((scd, cyc))
+        data = {client: hd.serialize() for client, hd in cycle_data.items()}
+
+        # Lay out plan and data in one shared memory block
+        size = len(plan) + sum(map(len, data.values()))
+        shm = SharedMemory(create=True, size=max(size, 1))
+        try:
+            shm.buf[: len(plan)] = plan
+            plan_span = (0, len(plan))
+            spans = []
+            offset = len(plan)
+            for client, serialization in data.items():
+                shm.buf[offset : offset + len(serialization)] = serialization
+                spans.append((client, (offset, len(serialization))))
+                offset += len(serialization)
+            del data
+
+            shards = [
+                (shm.name, plan_span, spans[i : i + self.shard_size])
+                for i in range(0, len(spans), self.shard_size)
+            ]
+            for bills in self.pool.imap_unordered(_compute_shard, shards):
+                for client, bill in bills:
+                    yield client, HiddenBill.deserialize(bill)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    @property
+    def pool(self) -> Pool:
+        """Worker pool, started on first use."""
+        if self._pool is None:
+            self._pool = self._start_pool()
+        return self._pool
+
+    def _start_pool(self) -> Pool:
+        """Start the worker processes."""
+        return spawn_pool(self.processes, self.threads_per_process)
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def spawn_pool(processes: int, threads_per_process: int) -> Pool:
+    """
+    Start a pool of `processes` worker processes, each limited to
+    `threads_per_process` OpenMP threads.
+
+    Workers are spawned rather than forked, such that they do not inherit
+    the OpenMP state of this process, and pick up the thread limit.
+    """
+    previous = os.environ.get("OMP_NUM_THREADS")
+    os.environ["OMP_NUM_THREADS"] = str(threads_per_process)
+    try:
+        return multiprocessing.get_context("spawn").Pool(processes)
+    finally:
+        if previous is None:
+            del os.environ["OMP_NUM_THREADS"]
+        else:
+            os.environ["OMP_NUM_THREADS"] = previous
+
+
+# Billing plan of the cycle a worker is working on, by shared memory block name
+_plans: Dict[str, Tuple[SharedCycleData, CycleContext]] = {}
+
+
+def _compute_shard(
+    task: Tuple[str, Span, Shard]
+) -> List[Tuple[ClientID, bytes]]:
+    """Compute the serialized hidden bills of a shard of clients, in a worker process."""
+    shm_name, (plan_offset, plan_len), shard = task
+    shm = SharedMemory(name=shm_name)
+    try:
+        if shm_name not in _plans:
+            _plans.clear()
+            with shm.buf[plan_offset : plan_offset + plan_len] as plan:
+                _plans[shm_name] = pickle.loads(plan)
+        scd, cyc = _plans[shm_name]
+
+        bills = []
+        for client, (offset, length) in shard:
+            with shm.buf[offset : offset + length] as serialization:
+                hd = HiddenData.deserialize(serialization)
+            bills.append((client, hd.compute_hidden_bill(scd, cyc).serialize()))
+        return bills
+    finally:
+        shm.close()
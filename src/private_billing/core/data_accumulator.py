@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import Dict, Iterator, Tuple
+
+from .cycle import ClientID, CycleID
+from .data import Data
+from .hidden_data import HiddenData
+from .hiding import HidingContext
+from .masking import SEED
+from .utils import vector
+
+ENCRYPTED = (
+    "consumptions",
+    "supplies",
+    "accepted_consumer_flags",
+    "accepted_producer_flags",
+    "positive_deviation_flags",
+)
+MASKED = ("individual_deviations", "p2p_consumer_flags", "p2p_producer_flags")
+
+
+class DataAccumulator:
+    """
+    Data of an open cycle, accumulated slot by slot as meters report.
+
+    The plaintext fields of `Data`, and the masked ones, are kept up to date
+    per reported slot. Hiding the completed cycle then only encrypts.
+
+    Masks are drawn from the seeds known when the cycle was opened. Should the
+    seeds change before the cycle is hidden, the masks are drawn anew.
+
+    :param hc: context to hide the cycle with.
+    :param client: id of the client owning the data.
+    :param cycle_id: id of the cycle being accumulated.
+    """
+
+    def __init__(self, hc: HidingContext, client: ClientID, cycle_id: CycleID) -> None:
+        self.hc = hc
+        self.data = Data(client, cycle_id, vector(), vector())
+        self.fields: Dict[str, vector[float]] = {
+            name: vector() for name in ENCRYPTED + MASKED
+        }
+        self.seeds = self._get_seeds()
+        self.masks: Dict[str, Iterator[float]] = {
+            name: hc.iter_masks(hc.get_masking_iv(cycle_id, name)) for name in MASKED
+        }
+
+    @property
+    def cycle_id(self) -> CycleID:
+        return self.data.cycle_id
+
+    @property
+    def slots(self) -> int:
+        """Number of slots reported so far."""
+        return len(self.data.utilizations)
+
+    @property
+    def is_complete(self) -> bool:
+        return self.slots == self.hc.cycle_length
+
+    def append(self, utilization_promise: float, utilization: float) -> None:
+        """
+        Record the readings of the next slot.
+        :raises ValueError: if all slots of the cycle are reported already.
+        """
+        if self.is_complete:
+            raise ValueError(f"cycle {self.cycle_id} is complete")
+        self.data.utilization_promises.append(utilization_promise)
+        self.data.utilizations.append(utilization)
+
+        # Derive the fields of this slot, as a cycle of one slot
+        slot = Data(
+            None, self.cycle_id, vector([utilization_promise]), vector([utilization])
+        )
+        for name in ENCRYPTED:
+            self.fields[name].extend(getattr(slot, name))
+        for name in MASKED:
+            [value] = getattr(slot, name)
+            self.fields[name].append(value + next(self.masks[name]))
+
+    def hide(self) -> HiddenData:
+        """
+        Hide the completed cycle; equivalent to `Data.hide`.
+        :raises ValueError: if not all slots of the cycle are reported yet.
+        """
+        if not self.is_complete:
+            length = self.hc.cycle_length
+            raise ValueError(f"cycle {self.cycle_id} has {self.slots} of {length} slots")
+        if self._get_seeds() != self.seeds:
+            return self.data.hide(self.hc)
+
+        return HiddenData(
+            self.data.client,
+            self.cycle_id,
+            *(self.hc.encrypt(self.fields[name]) for name in ENCRYPTED),
+            *(self.fields[name] for name in MASKED),
+            self.hc.get_public_hiding_context(),
+        )
+
+    def _get_seeds(self) -> Tuple[Dict[ClientID, SEED], Dict[ClientID, SEED]]:
+        mg = self.hc.mask_generator
+        return dict(mg.owned_seeds), dict(mg.foreign_seeds)
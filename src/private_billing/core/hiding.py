@@ -1,6 +1,7 @@
 from __future__ import annotations
 import math
 import hashlib
+from typing import Iterator
 
 from .serialize import Pickleable
 from .utils import vector
@@ -66,6 +67,15 @@ class HidingContext:
         masks = self.mask_generator.generate_masks(iv, len(values))
         return values + masks
 
+    def iter_masks(self, iv: int) -> Iterator[float]:
+        """
+        Generate the masks `mask` adds, one value at a time.
+
+        :param iv: initialization vector used in random mask sampling.
+        :returns: endless iterator over the masks.
+        """
+        return self.mask_generator.iter_masks(iv)
+
     def encrypt(self, values: vector[float]) -> Ciphertext:
         """Encrypt a list of values"""
         values.pad_to(self.cycle_length)  # pad to proper length
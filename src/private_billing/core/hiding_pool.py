@@ -0,0 +1,152 @@
+from __future__ import annotations
+from collections import deque
+from itertools import islice
+from multiprocessing.pool import AsyncResult, Pool
+from multiprocessing.shared_memory import SharedMemory
+import os
+import pickle
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .billing_pool import Span, spawn_pool
+from .data import Data
+from .hidden_data import HiddenData
+from .hiding import HidingContext, PublicHidingContext
+from .masking import SharedMaskGenerator
+
+
+class HidingPool:
+    """
+    Hides data on a pool of worker processes.
+
+    Per call to `hide`, the public hiding context and the mask generator (the
+    hiding plan) are written to a single shared memory block once. Workers
+    read the plan from that block, and keep the public hiding context for as
+    long as it is in use. Data is handed to the workers in chunks, of which at
+    most `max_in_flight` are being hidden at once, such that hiding a long
+    stream of data takes bounded memory.
+
+    Hidden data is yielded in order of the data. It holds the public hiding
+    context of the caller, rather than the one of the workers, as OpenFHE
+    cannot deserialize keys in the process that generated them.
+
+    :param processes: number of worker processes, defaults to the number of cores.
+    :param threads_per_process: number of OpenMP threads per worker process,
+    defaults to an equal share of the cores.
+    :param chunk_size: number of data objects handed to a worker at once.
+    :param max_in_flight: maximum number of chunks being hidden at once,
+    defaults to twice the number of processes.
+    """
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        threads_per_process: Optional[int] = None,
+        chunk_size: int = 4,
+        max_in_flight: Optional[int] = None,
+    ) -> None:
+        cores = os.cpu_count() or 1
+        self.processes = processes or cores
+        self.threads_per_process = threads_per_process or max(1, cores // self.processes)
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight or 2 * self.processes
+        self._pool: Optional[Pool] = None
+
+    def hide(self, hc: HidingContext, data: Iterable[Data]) -> Iterator[HiddenData]:
+        """
+        Hide all `data` under `hc`.
+
+        :param hc: context to hide the data with.
+        :param data: data to hide, consumed as the workers make progress.
+        :return: iterator over the hidden data, in order of `data`.
+        """
+        phc = hc.get_public_hiding_context()
+        context = phc.serialize()
+        mask_generator = pickle.dumps(hc.mask_generator)
+        key_tag = phc.public_key.GetKeyTag()
+
+        # Lay out the plan in one shared memory block
+        shm = SharedMemory(create=True, size=len(context) + len(mask_generator))
+        try:
+            shm.buf[: len(context)] = context
+            shm.buf[len(context) : shm.size] = mask_generator
+            plan = (
+                shm.name,
+                key_tag,
+                (0, len(context)),
+                (len(context), len(mask_generator)),
+            )
+
+            data = iter(data)
+            pending: Deque[AsyncResult] = deque()
+            while True:
+                # Keep the workers busy, up to the in-flight limit
+                while len(pending) < self.max_in_flight:
+                    chunk = list(islice(data, self.chunk_size))
+                    if not chunk:
+                        break
+                    pending.append(self.pool.apply_async(_hide_chunk, ((plan, chunk),)))
+                if not pending:
+                    return
+
+                for serialization in pending.popleft().get():
+                    hd = HiddenData.deserialize(serialization)
+                    hd.phc = phc
+                    yield hd
+        finally:
+            shm.close()
+            shm.unlink()
+
+    @property
+    def pool(self) -> Pool:
+        """Worker pool, started on first use."""
+        if self._pool is None:
+            self._pool = spawn_pool(self.processes, self.threads_per_process)
+        return self._pool
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+# Public hiding contexts in use by a worker, by key tag, and the mask
+# generator of the plan a worker is working on, by shared memory block name
+_contexts: Dict[str, PublicHidingContext] = {}
+_mask_generators: Dict[str, SharedMaskGenerator] = {}
+
+Plan = Tuple[str, str, Span, Span]
+
+
+def _hide_chunk(task: Tuple[Plan, List[Data]]) -> List[bytes]:
+    """
+    Hide a chunk of data, in a worker process.
+    :returns: the serialized hidden data, without public hiding context.
+    """
+    (shm_name, key_tag, context_span, mg_span), chunk = task
+    shm = SharedMemory(name=shm_name)
+    try:
+        if key_tag not in _contexts:
+            _contexts.clear()
+            offset, length = context_span
+            with shm.buf[offset : offset + length] as context:
+                _contexts[key_tag] = PublicHidingContext.deserialize(context)
+        if shm_name not in _mask_generators:
+            _mask_generators.clear()
+            offset, length = mg_span
+            with shm.buf[offset : offset + length] as mask_generator:
+                _mask_generators[shm_name] = pickle.loads(mask_generator)
+    finally:
+        shm.close()
+
+    # Encrypt under the public context, and mask with the plan's generator
+    phc = _contexts[key_tag]
+    phc.mask_generator = _mask_generators[shm_name]
+
+    hidden = []
+    for data in chunk:
+        hd = data.hide(phc)
+        hd.phc = None
+        hidden.append(hd.serialize())
+    return hidden
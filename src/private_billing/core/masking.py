@@ -1,6 +1,7 @@
 from .utils import vector
 from .cycle import ClientID
 from abc import ABC
+from typing import Iterator
 import math
 from numpy.random import PCG64
 import secrets
@@ -128,6 +129,23 @@ class SharedMaskGenerator:
 
         return masks
 
+    def iter_masks(self, iv: int) -> Iterator[float]:
+        """
+        Generate the masks of `generate_masks`, one at a time.
+
+        :param iv: initialization vector for the randomness.
+        :returns: endless iterator over the masks.
+        """
+        owned = [PCG64(s + iv) for s in self.owned_seeds.values()]
+        foreign = [PCG64(s + iv) for s in self.foreign_seeds.values()]
+        while True:
+            mask = 0
+            for pcg in owned:
+                mask += self.convertor.convert_from_int64(pcg.random_raw())
+            for pcg in foreign:
+                mask -= self.convertor.convert_from_int64(pcg.random_raw())
+            yield mask
+
     def unmask(self, vals: list[vector]) -> vector:
         return sum(vals[1:], vals[0])
 
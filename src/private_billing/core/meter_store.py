@@ -0,0 +1,126 @@
+from __future__ import annotations
+import os
+from typing import Dict, Iterable, Iterator, Optional
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+from .cycle import ClientID, CycleID
+from .data import Data
+from .utils import vector
+
+CYCLE_IDS = "cycle_ids.npy"
+COLUMNS = ("utilization_promises", "utilizations")
+
+FLOAT_DTYPE = np.dtype("<f8")
+CYCLE_ID_DTYPE = np.dtype("<i8")
+
+
+class MeterStore:
+    """
+    Columnar store of meter data, for bulk replay and backfill.
+
+    A store is a directory holding one `.npy` file per column: the cycle ids,
+    and the utilization promises and utilizations as (cycle, slot) matrices.
+    The matrices are memory-mapped, such that opening a store reads only the
+    cycle ids, and reading a cycle touches only its own rows.
+
+    :param path: directory of the store.
+    :param client: client to attribute the data to, if any.
+    """
+
+    def __init__(self, path: str, client: Optional[ClientID] = None) -> None:
+        self.path = path
+        self.client = client
+        self.cycle_ids = np.load(os.path.join(path, CYCLE_IDS))
+        self.columns = {
+            column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r")
+            for column in COLUMNS
+        }
+        self.index: Dict[CycleID, int] = {
+            cycle_id: row for row, cycle_id in enumerate(self.cycle_ids.tolist())
+        }
+
+    @property
+    def cycle_length(self) -> int:
+        return self.columns["utilizations"].shape[1]
+
+    def __len__(self) -> int:
+        return len(self.cycle_ids)
+
+    def __contains__(self, cycle_id: CycleID) -> bool:
+        return cycle_id in self.index
+
+    def __iter__(self) -> Iterator[Data]:
+        return map(self._get_row, range(len(self)))
+
+    def get(self, cycle_id: CycleID) -> Data:
+        """
+        Get the data of cycle `cycle_id`.
+        :raises KeyError: if the store holds no data for the cycle.
+        """
+        return self._get_row(self.index[cycle_id])
+
+    def read(self, start: CycleID, stop: CycleID) -> Iterator[Data]:
+        """Iterate over the data of the stored cycles in [`start`, `stop`), in order."""
+        for cycle_id in sorted(self.index):
+            if start <= cycle_id < stop:
+                yield self._get_row(self.index[cycle_id])
+
+    def _get_row(self, row: int) -> Data:
+        # Rows are views on the mapped files; only conversion to a vector copies
+        return Data(
+            self.client,
+            int(self.cycle_ids[row]),
+            vector(self.columns["utilization_promises"][row].tolist()),
+            vector(self.columns["utilizations"][row].tolist()),
+        )
+
+    @staticmethod
+    def create(
+        path: str,
+        cycle_ids: ArrayLike,
+        utilization_promises: ArrayLike,
+        utilizations: ArrayLike,
+        client: Optional[ClientID] = None,
+    ) -> MeterStore:
+        """
+        Create a store at `path` from columns, e.g., of a meter export.
+
+        :param cycle_ids: id per cycle, unique.
+        :param utilization_promises: promises per cycle and slot.
+        :param utilizations: utilizations per cycle and slot.
+        :raises ValueError: if the cycle ids are not unique, or the columns
+        are not of shape (cycles, slots).
+        """
+        cycle_ids = np.asarray(cycle_ids, dtype=CYCLE_ID_DTYPE)
+        columns = {
+            "utilization_promises": np.asarray(utilization_promises, dtype=FLOAT_DTYPE),
+            "utilizations": np.asarray(utilizations, dtype=FLOAT_DTYPE),
+        }
+        if cycle_ids.ndim != 1 or len(np.unique(cycle_ids)) != len(cycle_ids):
+            raise ValueError("cycle ids must be unique")
+        shape = columns["utilizations"].shape
+        for column in columns.values():
+            if column.ndim != 2 or column.shape != shape or shape[0] != len(cycle_ids):
+                raise ValueError(f"columns must be of shape ({len(cycle_ids)}, slots)")
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, CYCLE_IDS), cycle_ids)
+        for name, column in columns.items():
+            np.save(os.path.join(path, f"{name}.npy"), column)
+        return MeterStore(path, client)
+
+    @staticmethod
+    def from_data(
+        path: str, data: Iterable[Data], client: Optional[ClientID] = None
+    ) -> MeterStore:
+        """Create a store at `path` holding all `data`."""
+        data = list(data)
+        return MeterStore.create(
+            path,
+            [d.cycle_id for d in data],
+            [d.utilization_promises for d in data],
+            [d.utilizations for d in data],
+            client,
+        )
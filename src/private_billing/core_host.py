@@ -0,0 +1,118 @@
+from multiprocessing.pool import ThreadPool
+from typing import Dict, List, Optional
+
+from .core_server import CoreServer
+from .network import PeerToPeerBillingBaseServer
+from .server import (
+    Encoder,
+    Envelope,
+    HostedAddress,
+    LaneDispatcher,
+    MalformedEnvelopeException,
+    PickleEncoder,
+    RequestReplyServer,
+    TCPAddress,
+)
+from .log import logger
+
+
+class CoreHost(RequestReplyServer):
+    """
+    Host of many core servers, one per household, behind a single socket.
+
+    The hosted cores each have their own identity, keys and hiding context,
+    yet share the context, socket and outbound connections of the host, as
+    well as its decode pool and executor lanes. Messages are routed to the
+    core named as recipient in their envelope.
+
+    :param address: address to host the cores at.
+    :param encoder: encoder used by all hosted cores.
+    :param decode_workers: number of threads to verify and decode messages on.
+    :param lanes: executor lanes to handle messages on, shared by all cores.
+    """
+
+    def __init__(
+        self,
+        address: TCPAddress = TCPAddress("localhost", 5555),
+        encoder: Encoder = PickleEncoder,
+        decode_workers: int = 4,
+        lanes: Optional[LaneDispatcher] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(encoder, **kwargs)
+        self.address = address
+        self.lanes = lanes or PeerToPeerBillingBaseServer.get_default_lanes()
+        self.decode_pool = ThreadPool(processes=decode_workers)
+        self.cores: Dict[str, CoreServer] = {}
+
+    def add_core(self, name: str, **kwargs) -> CoreServer:
+        """
+        Host a new core server, at address `name` within this host.
+        :param kwargs: further arguments to the core server.
+        """
+        core = CoreServer(
+            HostedAddress(self.address, name),
+            self.encoder,
+            host=self,
+            lanes=self.lanes,
+            decode_pool=self.decode_pool,
+            **kwargs,
+        )
+        self.cores[name] = core
+        return core
+
+    def start(self, edge: TCPAddress, interval: int = 1000) -> None:
+        for core in self.cores.values():
+            core.open_channels()
+        try:
+            self.connect(edge)
+            super().start(self.address, interval)
+        finally:
+            for core in self.cores.values():
+                core.close_channels()
+
+    def connect(self, edge: TCPAddress) -> None:
+        """Send the connect requests of all hosted cores to `edge`, concurrently."""
+        pending = [
+            core.send_async(core.get_connect_message(), edge)
+            for core in self.cores.values()
+        ]
+        for request in pending:
+            request.result()
+
+    def _handle_frames(self, frames: List[bytes]) -> None:
+        """
+        Route the raw frames of an incoming message to the core it is for.
+
+        Only the envelope header is parsed. Messages must be enveloped and name
+        the core they are for as recipient: bare messages, malformed envelopes
+        and messages for unknown cores are rejected.
+        """
+        if not Envelope.is_envelope(frames):
+            logger.warning("received bare message, which names no hosted core")
+            return self.reject()
+        try:
+            envelope = Envelope.from_frames(frames)
+        except MalformedEnvelopeException as e:
+            logger.warning(f"rejecting malformed envelope: {e}")
+            return self.reject()
+
+        core = self.cores.get(envelope.recipient)
+        if core is None:
+            logger.warning(f"received message for unknown core {envelope.recipient}")
+            return self.reject()
+        core.handle_envelope(envelope)
+
+def launch_core_host(
+    server_address: TCPAddress, edge: TCPAddress, names: List[str]
+) -> None:
+    """
+    Launch a host of core servers
+    :param server_address: address to host the cores at
+    :param edge: information on edge to connect to network
+    :param names: names of the cores to host, one per household
+    """
+    host = CoreHost(server_address)
+    for name in names:
+        host.add_core(name)
+    host.start(edge)
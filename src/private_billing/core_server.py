@@ -1,38 +1,108 @@
-from typing import Dict
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from itertools import islice
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Sized
 from .network import (
     PeerToPeerBillingBaseServer,
     NodeInfo,
     no_verification_required,
     replies,
 )
-from .server import TCPAddress
+from .server import (
+    Delivery,
+    Encoder,
+    PickleEncoder,
+    Publisher,
+    TCPAddress,
+    decrypt,
+    encrypt,
+    fan_out,
+)
 from .core import (
     Bill,
     CycleID,
     CycleContext,
     Data,
+    DataAccumulator,
     HiddenData,
     HidingContext,
+    HidingPool,
     Int64ToFloatConvertor,
     SharedMaskGenerator,
 )
 from .messages import (
+    BatchResultMessage,
     BillMessage,
+    ContextBatchMessage,
     ContextMessage,
     HiddenBillMessage,
     ConnectMessage,
+    DataBatchMessage,
     DataMessage,
     GetBillMessage,
+    HiddenDataBatchMessage,
     HiddenDataMessage,
     BillingMessageType,
     BillingMessageType,
+    RosterCompleteMessage,
+    RosterMessage,
     SeedMessage,
+    SlotDataMessage,
     UserType,
 )
+from .log import logger
+
+
+@dataclass
+class IngestionProgress:
+    """
+    Progress of a bulk ingestion.
+
+    :param hidden: number of data objects hidden so far.
+    :param delivered: number of hidden data objects accepted by all edges.
+    :param failed: number of hidden data objects not accepted by some edge,
+    after all retries.
+    :param retried: number of times a hidden data object was sent again.
+    :param total: number of data objects to ingest, if known.
+    """
+
+    hidden: int = 0
+    delivered: int = 0
+    failed: int = 0
+    retried: int = 0
+    total: Optional[int] = None
 
 
 class CoreServer(PeerToPeerBillingBaseServer):
 
+    def __init__(
+        self,
+        address=TCPAddress("localhost", 5555),
+        encoder: Encoder = PickleEncoder,
+        bill_port: Optional[int] = None,
+        bill_key: Optional[bytes] = None,
+        bill_host: str = "localhost",
+        hiding_pool: Optional[HidingPool] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(address, encoder, **kwargs)
+
+        # Workers to hide data on in bulk ingestion, if any
+        self.hiding_pool = hiding_pool
+
+        # Channel to publish revealed bills to the household, if any. Unlike
+        # the publish channel, it is not announced to peers. Bills are private
+        # to the household, hence the channel is only opened with a key shared
+        # with the household apps, to encrypt the bills with.
+        if bill_port is not None and bill_key is None:
+            raise ValueError("a bill channel requires a bill key")
+        self.bill_port = bill_port
+        self.bill_key = bill_key
+        self.bill_host = bill_host
+        self.bill_publisher: Optional[Publisher] = None
+
     def __post_init__(self) -> None:
         super().__post_init__()
 
@@ -41,6 +111,7 @@ class CoreServer(PeerToPeerBillingBaseServer):
         self.hc: HidingContext = None
         self.contexts: Dict[CycleID, CycleContext] = {}
         self.bills: Dict[CycleID, Bill] = {}
+        self.open_cycles: Dict[CycleID, DataAccumulator] = {}
 
     @property
     def role(self) -> UserType:
@@ -55,30 +126,64 @@ class CoreServer(PeerToPeerBillingBaseServer):
             BillingMessageType.DATA: self.handle_data,
             BillingMessageType.HIDDEN_BILL: self.handle_hidden_bill,
             BillingMessageType.CYCLE_CONTEXT: self.handle_cycle_context,
+            BillingMessageType.ROSTER_COMPLETE: self.handle_roster_complete,
+            BillingMessageType.DATA_BATCH: self.handle_data_batch,
+            BillingMessageType.CYCLE_CONTEXT_BATCH: self.handle_context_batch,
+            BillingMessageType.SLOT_DATA: self.handle_slot_data,
         }
 
     def start(self, edge: TCPAddress, interval=1000) -> None:
         # Send connect request to edge server
-        connect_msg = ConnectMessage(
-            self.address, self.pk, self.role, self.network_members, self.billing_state
-        )
-        self.send(connect_msg, edge)
+        self.send(self.get_connect_message(), edge)
 
         # Start server
         return super().start(interval)
 
+    def open_channels(self) -> None:
+        super().open_channels()
+        if self.bill_port is not None:
+            self.bill_publisher = Publisher(
+                self.context, self.bill_port, host=self.bill_host
+            )
+
+    def close_channels(self) -> None:
+        super().close_channels()
+        if self.bill_publisher is not None:
+            self.bill_publisher.close()
+            self.bill_publisher = None
+
     ### Connect Message
 
     @no_verification_required
     def handle_connect(self, msg: ConnectMessage, origin: NodeInfo) -> None:
         super().handle_connect(msg, origin)
+        self.init_hiding_context(msg.billing_state)
+
+        # Send seed message to connecting peer, as now registered
+        self.try_send_seed(self.get_node_info(origin.address))
 
-        cycle_length = msg.billing_state.get("cycle_length")
+    def init_hiding_context(self, billing_state: Dict) -> None:
+        """Set up the hiding context, once the cycle length is known."""
+        cycle_length = billing_state.get("cycle_length")
         if cycle_length and not self.hc:
             self.hc = HidingContext(cycle_length, self.mg)
 
-        # Send seed message to connecting peer
-        self.try_send_seed(origin)
+    ### Onboarding
+
+    @no_verification_required
+    def handle_roster(self, msg: RosterMessage, origin: NodeInfo) -> None:
+        super().handle_roster(msg, origin)
+        self.init_hiding_context(msg.billing_state)
+
+    def handle_roster_complete(
+        self, msg: RosterCompleteMessage, origin: NodeInfo
+    ) -> None:
+        """
+        All cores hold the roster, hence send seeds to the cores that joined.
+        Cores that joined earlier get their seeds in reply to ours.
+        """
+        joined = set(msg.joined)
+        self.send_seeds(node for node in self.network_cores if node.address in joined)
 
     ### Seed Exchange
 
@@ -100,9 +205,34 @@ class CoreServer(PeerToPeerBillingBaseServer):
 
     def send_seed(self, member: NodeInfo) -> None:
         """Send seed to `member`."""
+        self.send_seed_async(member).result()
+
+    def send_seed_async(self, member: NodeInfo) -> Future:
+        """Send seed to `member`, without waiting for the reply."""
         seed = self.mg.get_seed_for_peer(member.id)
         seed_msg = SeedMessage(self.address, seed)
-        self.send(seed_msg, member)
+        return self.send_async(seed_msg, member)
+
+    def send_seeds(self, members: Iterable[NodeInfo]) -> None:
+        """Send seeds to all core `members` that have none yet, concurrently."""
+        targets = [
+            member
+            for member in members
+            if member.role == UserType.CORE
+            and not self.mg.has_owned_seed_for_peer(member.id)
+        ]
+        deliveries = fan_out(
+            self.send_seed_async,
+            targets,
+            self.broadcast_timeout,
+            self.broadcast_parallelism,
+        )
+        for delivery in deliveries.values():
+            if not delivery.ok:
+                logger.warning(
+                    f"failed to send seed to {delivery.target.address}: "
+                    f"{delivery.error!r}"
+                )
 
     ### Forward data
 
@@ -113,6 +243,184 @@ class CoreServer(PeerToPeerBillingBaseServer):
         msg = HiddenDataMessage(self.address, hidden_data)
         self.broadcast(msg, self.network_edges)
 
+    @replies
+    @no_verification_required
+    def handle_data_batch(self, msg: DataBatchMessage, origin: NodeInfo) -> None:
+        """
+        Handle incoming batch of `data` objects, replying the outcome per record.
+        The accepted records are hidden, and forwarded in a single batch.
+        """
+        self.handle_batch(msg.type, msg.data, self.check_data, self.forward_data_batch)
+
+    def check_data(self, data: Data) -> None:
+        """
+        Check `data` can be hidden.
+        :raises ValueError: if hiding is not set up yet, or `data` does not
+        span a cycle.
+        """
+        if self.hc is None:
+            raise ValueError("hiding context is not initialized")
+        length = self.hc.cycle_length
+        if len(data.utilization_promises) != length or len(data.utilizations) != length:
+            raise ValueError(f"data does not span a cycle of {length} slots")
+
+    def forward_data_batch(self, batch: List[Data]) -> None:
+        """Hide all data in `batch`, and broadcast it in a single message."""
+        self.ingest(batch, batch_size=len(batch))
+
+    ### Accumulate data per slot
+
+    @no_verification_required
+    def handle_slot_data(self, msg: SlotDataMessage, origin: NodeInfo) -> None:
+        """Handle incoming readings of the next slots of an open cycle."""
+        self.record_slots(
+            msg.cycle_id, msg.slot, msg.utilization_promises, msg.utilizations
+        )
+
+    def record_slots(
+        self,
+        cycle_id: CycleID,
+        slot: int,
+        utilization_promises: List[float],
+        utilizations: List[float],
+    ) -> None:
+        """
+        Append readings to open cycle `cycle_id`, starting at `slot`.
+        Once all slots are read, the cycle is hidden and forwarded to the edges.
+
+        :raises ValueError: if hiding is not set up yet, or the readings do not
+        continue the cycle.
+        """
+        if self.hc is None:
+            raise ValueError("hiding context is not initialized")
+        if len(utilization_promises) != len(utilizations):
+            raise ValueError("expected a promise and utilization per slot")
+
+        accumulator = self.open_cycles.get(cycle_id)
+        if accumulator is None:
+            accumulator = DataAccumulator(self.hc, self.id, cycle_id)
+        if slot != accumulator.slots:
+            raise ValueError(f"expected readings from slot {accumulator.slots}")
+        if slot + len(utilizations) > self.hc.cycle_length:
+            raise ValueError(f"readings exceed a cycle of {self.hc.cycle_length} slots")
+        self.open_cycles[cycle_id] = accumulator
+
+        for promise, utilization in zip(utilization_promises, utilizations):
+            accumulator.append(promise, utilization)
+
+        if accumulator.is_complete:
+            del self.open_cycles[cycle_id]
+            msg = HiddenDataMessage(self.address, accumulator.hide())
+            self.broadcast(msg, self.network_edges)
+
+    ### Bulk ingestion
+
+    def ingest(
+        self,
+        data: Iterable[Data],
+        batch_size: int = 16,
+        progress: Optional[Callable[[IngestionProgress], None]] = None,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ) -> IngestionProgress:
+        """
+        Hide a range of cycles of `data`, and stream it to the edges in batches.
+
+        Data is hidden on the hiding pool, if any, which keeps hiding ahead
+        while a batch is being delivered. At most `batch_size` hidden data
+        objects, plus the chunks in flight on the pool, are held at once.
+
+        :param data: data to ingest, e.g., read from a file.
+        :param batch_size: number of hidden data objects per message.
+        :param progress: called with the progress after every batch.
+        :param retries: number of times to resend the records an edge rejected,
+        or the batch if it was not delivered.
+        :param backoff: seconds to wait before the first retry, doubling with
+        every retry after.
+        :return: progress at the end of the ingestion.
+        """
+        state = IngestionProgress(
+            total=len(data) if isinstance(data, Sized) else None
+        )
+        hidden_data = self.hide_all(data)
+        while batch := list(islice(hidden_data, batch_size)):
+            state.hidden += len(batch)
+
+            failed = self.deliver_batch(batch, state, retries, backoff)
+            state.delivered += len(batch) - len(failed)
+            state.failed += len(failed)
+
+            logger.info(f"ingested {state.hidden}/{state.total or '?'} data objects")
+            if progress is not None:
+                progress(state)
+        return state
+
+    def deliver_batch(
+        self,
+        batch: List[HiddenData],
+        state: IngestionProgress,
+        retries: int,
+        backoff: float,
+    ) -> Set[int]:
+        """
+        Deliver `batch` to all edges, resending the records an edge rejected,
+        or all records if the batch was not delivered, to that edge only.
+        :return: indices of the records some edge did not accept.
+        """
+        edges = {edge.address: edge for edge in self.network_edges}
+        outstanding = {address: list(range(len(batch))) for address in edges}
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                state.retried += sum(map(len, outstanding.values()))
+                time.sleep(backoff * 2 ** (attempt - 1))
+
+            # Edges that miss the same records are sent the same message
+            groups: Dict[tuple, List[NodeInfo]] = defaultdict(list)
+            for address, records in outstanding.items():
+                groups[tuple(records)].append(edges[address])
+            for records, targets in groups.items():
+                msg = HiddenDataBatchMessage(self.address, [batch[i] for i in records])
+                for address, delivery in self.broadcast(msg, targets).items():
+                    rejected = self.get_rejected(delivery, len(records))
+                    outstanding[address] = [records[i] for i in rejected]
+
+            outstanding = {a: records for a, records in outstanding.items() if records}
+            if not outstanding:
+                break
+        return {i for records in outstanding.values() for i in records}
+
+    def get_rejected(self, delivery: Delivery, size: int) -> List[int]:
+        """
+        Indices of the records of a batch of `size` records that were not
+        accepted, according to the `BatchResultMessage` reply in `delivery`.
+        """
+        if not delivery.ok:
+            logger.warning(f"failed to deliver batch to {delivery.target}")
+            return list(range(size))
+        try:
+            result = self.encoder.decode(delivery.reply)
+        except Exception as e:
+            logger.warning(f"invalid reply to batch from {delivery.target}: {e}")
+            return list(range(size))
+        if not isinstance(result, BatchResultMessage) or len(result.errors) != size:
+            logger.warning(f"unexpected reply to batch from {delivery.target}")
+            return list(range(size))
+
+        rejected = [i for i, error in enumerate(result.errors) if error is not None]
+        for i in rejected:
+            logger.warning(f"{delivery.target} rejected record: {result.errors[i]}")
+        return rejected
+
+    def hide_all(self, data: Iterable[Data]) -> Iterator[HiddenData]:
+        """Hide all `data`, on the hiding pool if any, in order."""
+        if self.hiding_pool is None:
+            yield from map(self.hide_data, data)
+            return
+
+        for hidden_data in self.hiding_pool.hide(self.hc, data):
+            hidden_data.client = self.id
+            yield hidden_data
+
     def hide_data(self, data: Data) -> HiddenData:
         """Convert `Data` to `HiddenData`."""
         hidden_data = data.hide(self.hc)
@@ -126,6 +434,20 @@ class CoreServer(PeerToPeerBillingBaseServer):
         hidden_bill = msg.hidden_bill
         bill = hidden_bill.reveal(self.hc)
         self.bills[bill.cycle_id] = bill
+        self.publish_bill(bill)
+
+    def publish_bill(self, bill: Bill) -> None:
+        """
+        Push `bill` to the household apps subscribed to the bill channel, if any,
+        encrypted under the bill key. Apps that miss a bill can still request
+        it with a `GetBillMessage`.
+        """
+        if self.bill_publisher is None:
+            return
+        msg = BillMessage(self.address, bill)
+        topic = msg.type.value.encode()
+        sealed = encrypt(self.bill_key, self.encoder.encode(msg), topic)
+        self.bill_publisher.publish(topic, [sealed])
 
     ### Handle incoming bill request
 
@@ -133,7 +455,7 @@ class CoreServer(PeerToPeerBillingBaseServer):
     @no_verification_required
     def handle_get_bill(self, msg: GetBillMessage, origin: NodeInfo) -> None:
         bill = self.bills.get(msg.cycle_id, None)
-        self.reply(BillMessage(bill), origin)
+        self.reply(BillMessage(self.address, bill))
 
     ### Handle Cycle Context
 
@@ -142,12 +464,40 @@ class CoreServer(PeerToPeerBillingBaseServer):
         # do not use this
         pass
 
+    @no_verification_required
+    def handle_context_batch(self, msg: ContextBatchMessage, origin: NodeInfo) -> None:
+        # do not use this
+        pass
+
+
+def open_bill(
+    topic: bytes, frames: List[bytes], bill_key: bytes, encoder: Encoder = PickleEncoder
+) -> BillMessage:
+    """
+    Decrypt a bill received on the bill channel of a core.
+    :raises InvalidTag: when the bill was not encrypted under `bill_key`, or
+    tampered with.
+    """
+    return encoder.decode(decrypt(bill_key, frames[0], topic))
+
 
-def launch_core(server_address: TCPAddress, edge: TCPAddress) -> None:
+def launch_core(
+    server_address: TCPAddress,
+    edge: TCPAddress,
+    bill_port: Optional[int] = None,
+    bill_key: Optional[bytes] = None,
+    bill_host: str = "localhost",
+) -> None:
     """
     Launch core server
     :param server_address: address to host this server
     :param edge: information on edge to connect to network
+    :param bill_port: if given, port on which to publish revealed bills.
+    :param bill_key: key shared with the household apps, to encrypt bills with.
+    Required with `bill_port`.
+    :param bill_host: interface on which to publish revealed bills.
     """
-    server = CoreServer(server_address)
+    server = CoreServer(
+        server_address, bill_port=bill_port, bill_key=bill_key, bill_host=bill_host
+    )
     server.start(edge)
@@ -1,26 +1,77 @@
-from typing import Dict
+from concurrent.futures import Future, wait
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-from .network import PeerToPeerBillingBaseServer, NodeInfo, no_verification_required
-from .server import TCPAddress
-from .core import CycleID, CycleContext, SharedBilling, ClientID, HiddenBill
+import zmq
+from .billing_scheduler import BillingPriority, BillingScheduler
+from .network import (
+    PeerToPeerBillingBaseServer,
+    NodeInfo,
+    no_verification_required,
+    replies,
+)
+from .server import Encoder, PickleEncoder, TCPAddress
+from .core import (
+    BillingPool,
+    CycleID,
+    CycleContext,
+    SharedBilling,
+    ClientID,
+    HiddenBill,
+    HiddenData,
+)
 from .messages import (
+    ConnectMessage,
+    ContextBatchMessage,
     ContextMessage,
     HiddenBillMessage,
+    HiddenDataBatchMessage,
     HiddenDataMessage,
     BillingMessageType,
     BillingMessageType,
+    RosterCompleteMessage,
+    RosterMessage,
     UserType,
 )
-from .log import full_stack, logger
+from .log import logger
 
 
 class EdgeServer(PeerToPeerBillingBaseServer):
 
-    def __init__(self, address, cycle_length) -> None:
-        super().__init__(address)
-        self.shared_biller = SharedBilling()
+    def __init__(
+        self,
+        address,
+        cycle_length,
+        encoder: Encoder = PickleEncoder,
+        billing_pool: Optional[BillingPool] = None,
+        billing_workers: int = 1,
+        billing_debounce: float = 0.0,
+        billing_sla: float = 60.0,
+        onboarding_window: Optional[float] = None,
+        publish_port: Optional[int] = None,
+        context: Optional[zmq.Context] = None,
+    ) -> None:
+        super().__init__(address, encoder, publish_port=publish_port, context=context)
+        self.shared_biller = SharedBilling(billing_pool)
+        self.billing_scheduler = BillingScheduler(
+            self.bill_cycle, billing_workers, billing_debounce
+        )
         self.billing_state["cycle_length"] = cycle_length
 
+        # Each cycle is due `billing_sla` seconds after its context arrived,
+        # such that older cycles are billed first
+        self.billing_sla = billing_sla
+        self.cycle_opened: Dict[CycleID, float] = {}
+
+        # Onboarding mode: joins are collected for `onboarding_window` seconds,
+        # and then published to all members in a single roster
+        self.onboarding_window = onboarding_window
+        self.joining: set[TCPAddress] = set()
+        self.roster_version = 0
+        self._roster_timer: Optional[threading.Timer] = None
+        self._onboarding_lock = threading.Lock()
+
     @property
     def role(self) -> UserType:
         return UserType.EDGE
@@ -31,6 +82,8 @@ class EdgeServer(PeerToPeerBillingBaseServer):
             **super().handlers,
             BillingMessageType.HIDDEN_DATA: self.handle_hidden_data,
             BillingMessageType.CYCLE_CONTEXT: self.handle_context_data,
+            BillingMessageType.HIDDEN_DATA_BATCH: self.handle_hidden_data_batch,
+            BillingMessageType.CYCLE_CONTEXT_BATCH: self.handle_context_batch,
         }
 
     ### Connect Message
@@ -41,12 +94,89 @@ class EdgeServer(PeerToPeerBillingBaseServer):
         # Add client for billing
         self.shared_biller.include_client(node.id)
 
+    @no_verification_required
+    def handle_connect(self, msg: ConnectMessage, origin: NodeInfo) -> None:
+        """Handle connect request, collecting joins when onboarding."""
+        if self.onboarding_window is None or origin.address in self.network_members:
+            return super().handle_connect(msg, origin)
+        self.collect_join(msg, origin)
+
+    ### Onboarding
+
+    def collect_join(self, msg: ConnectMessage, origin: NodeInfo) -> None:
+        """
+        Register the sender of `msg`, and the members it announces, without
+        connecting to them. They are published in the roster at the end of the
+        onboarding window, which starts with the first join.
+        """
+        _, learned = self.merge_connect(msg, origin)
+        with self._onboarding_lock:
+            self.joining.update(node.address for node in learned)
+            if self._roster_timer is None:
+                self._roster_timer = threading.Timer(
+                    self.onboarding_window, self.publish_roster
+                )
+                self._roster_timer.daemon = True
+                self._roster_timer.start()
+
+    def publish_roster(self) -> None:
+        """
+        Publish the roster to all members.
+
+        Members that joined during the window receive all members; the others
+        only the changes since the previous roster. Once all members hold the
+        roster, they are told so, such that the cores can exchange seeds with
+        the members that joined without their seeds racing ahead of the roster.
+        """
+        with self._onboarding_lock:
+            if self._roster_timer is not None:
+                self._roster_timer.cancel()
+                self._roster_timer = None
+            joined, self.joining = self.joining, set()
+            since = self.roster_version
+            roster = self.get_roster_message(0)
+            self.roster_version = roster.version
+        if not joined:
+            return
+
+        peers = self.network_peers
+        new = [node for node in peers if node.address in joined]
+        known = [node for node in peers if node.address not in joined]
+        logger.info(f"publishing roster to {len(new)} new and {len(known)} known peers")
+
+        deliveries = self.broadcast(roster, new)
+        update = self.get_roster_message(since)
+        complete = RosterCompleteMessage(self.address, roster.version, list(joined))
+        if known and self.publisher is not None:
+            # Subscribers receive published messages in order of publication
+            self.publish(update)
+            self.publish(complete)
+        elif known:
+            deliveries.update(self.broadcast(update, known))
+
+        # Only the cores that hold the roster can exchange seeds
+        delivered = {address for address, delivery in deliveries.items() if delivery.ok}
+        cores = [node for node in self.network_cores if node.address in delivered]
+        self.broadcast(complete, cores)
+
+    def get_roster_message(self, since: int) -> RosterMessage:
+        """Roster of the changes to the network since version `since`."""
+        delta = self.network_members.changes_since(since)
+        return RosterMessage(
+            self.address,
+            delta.members,
+            self.get_billing_state(),
+            delta.version,
+            delta.digest,
+        )
+
     ### Handle incoming context data
 
     @no_verification_required
     def handle_context_data(self, msg: ContextMessage, origin: NodeInfo) -> None:
         """Handle incoming `CycleContext` data."""
         self.shared_biller.record_contexts(msg.context)
+        self.cycle_opened.setdefault(msg.context.cycle_id, time.monotonic())
         self.try_run_billing(msg.context.cycle_id)
 
         # Forward to all known peers
@@ -55,7 +185,40 @@ class EdgeServer(PeerToPeerBillingBaseServer):
     def broadcast_context_data(self, context: CycleContext) -> None:
         """Broadcast `CycleContext` to all network participants"""
         msg = ContextMessage(self.address, context)
-        self.broadcast(msg, self.network_peers)
+        if self.publisher is not None:
+            self.publish(msg)
+        else:
+            self.broadcast(msg, self.network_peers)
+
+    @replies
+    @no_verification_required
+    def handle_context_batch(self, msg: ContextBatchMessage, origin: NodeInfo) -> None:
+        """Handle incoming batch of `CycleContext`s, replying the outcome per record."""
+        self.handle_batch(
+            msg.type, msg.contexts, CycleContext.check_validity, self.record_contexts
+        )
+
+    def record_contexts(self, contexts: List[CycleContext]) -> None:
+        """
+        Record all `contexts`, and only then schedule billing of their cycles,
+        such that the older cycles among them are billed as backfill.
+        """
+        for context in contexts:
+            self.shared_biller.record_contexts(context)
+            self.cycle_opened.setdefault(context.cycle_id, time.monotonic())
+        for context in contexts:
+            self.try_run_billing(context.cycle_id)
+
+        # Forward to all known peers
+        self.broadcast_context_batch(contexts)
+
+    def broadcast_context_batch(self, contexts: List[CycleContext]) -> None:
+        """Broadcast `contexts` to all network participants, in a single message."""
+        msg = ContextBatchMessage(self.address, contexts)
+        if self.publisher is not None:
+            self.publish(msg)
+        else:
+            self.broadcast(msg, self.network_peers)
 
     ### Handle incoming data
 
@@ -67,43 +230,112 @@ class EdgeServer(PeerToPeerBillingBaseServer):
         # Attempt to start billing process
         self.try_run_billing(msg.data.cycle_id)
 
+    @replies
+    def handle_hidden_data_batch(
+        self, msg: HiddenDataBatchMessage, origin: NodeInfo
+    ) -> None:
+        """Handle incoming batch of `HiddenData`, replying the outcome per record."""
+        self.handle_batch(
+            msg.type, msg.data, self.check_hidden_data, self.record_hidden_data
+        )
+
+    def check_hidden_data(self, data: HiddenData) -> None:
+        """
+        Check `data` belongs to a client included in billing.
+        :raises ValueError: if the client is unknown.
+        """
+        if data.client not in self.shared_biller.clients:
+            raise ValueError(f"unknown client {data.client}")
+
+    def record_hidden_data(self, batch: List[HiddenData]) -> None:
+        """Record all data in `batch`, and then attempt to bill their cycles."""
+        for data in batch:
+            self.shared_biller.record_data(data)
+        for cycle_id in dict.fromkeys(data.cycle_id for data in batch):
+            self.try_run_billing(cycle_id)
+
     ### Perform billing tasks
 
     def try_run_billing(self, cycle_id: CycleID) -> None:
-        """Attempt to run the billing process for the given cycle"""
+        """Schedule the billing process for the given cycle, if it is ready"""
         if self.shared_biller.is_ready(cycle_id):
-            try:
-                logger.info(f"start billing {cycle_id=}...")
-                bills = self.run_billing(cycle_id)
-                self.send_hidden_bills(bills)
-                logger.info(f"finished billing {cycle_id=}")
-            except Exception as e:
-                logger.error(f"billing {cycle_id=} failed: {str(e)}")
-                logger.debug(full_stack())
+            priority = self.get_billing_priority(cycle_id)
+            deadline = self.get_billing_deadline(cycle_id)
+            self.billing_scheduler.trigger(cycle_id, priority, deadline)
         else:
             logger.info(f"not ready for billing {cycle_id=}")
 
-    def run_billing(self, cycle_id: CycleID) -> Dict[ClientID, HiddenBill]:
-        """Run the billing process for the given cycle"""
-        return self.shared_biller.compute_bills(cycle_id)
+    def get_billing_priority(self, cycle_id: CycleID) -> BillingPriority:
+        """Cycles older than the latest known cycle are backfill."""
+        latest_cycle_id = max(self.shared_biller.cycle_contexts, default=cycle_id)
+        if cycle_id < latest_cycle_id:
+            return BillingPriority.BACKFILL
+        return BillingPriority.LIVE
+
+    def get_billing_deadline(self, cycle_id: CycleID) -> float:
+        """Time (monotonic) by which a cycle should be billed."""
+        opened = self.cycle_opened.get(cycle_id, time.monotonic())
+        return opened + self.billing_sla
+
+    def bill_cycle(self, cycle_id: CycleID) -> None:
+        """Run the billing process for the given cycle, and send out the bills."""
+        logger.info(f"start billing {cycle_id=}...")
+        bills = self.run_billing(cycle_id)
+        self.stream_hidden_bills(bills)
+        logger.info(f"finished billing {cycle_id=}")
+
+    def run_billing(self, cycle_id: CycleID) -> Iterator[Tuple[ClientID, HiddenBill]]:
+        """Run the billing process for the given cycle, yielding bills as they are computed."""
+        return self.shared_biller.iter_bills(cycle_id)
 
     def send_hidden_bills(self, bills: Dict[ClientID, HiddenBill]) -> None:
-        """Send `bills` to the proper recipients."""
-        for member in self.network_cores:
-            bill = bills[member.id]
-            self.send_hidden_bill(bill, member)
+        """Send `bills` to the proper recipients, concurrently."""
+        self.stream_hidden_bills(bills.items())
+
+    def stream_hidden_bills(self, bills: Iterable[Tuple[ClientID, HiddenBill]]) -> None:
+        """
+        Send `bills` to the proper recipients.
+
+        Each bill is encoded and sent as soon as it is produced, such that
+        computing the next bills overlaps with sending the previous ones, and
+        bills do not pile up in memory.
+        """
+        pending: Dict[Future, NodeInfo] = {}
+        for client, bill in bills:
+            core = self.network_members.get_by_id(client, UserType.CORE)
+            if core is not None:
+                pending[self.send_hidden_bill(bill, core)] = core
+
+        # Await delivery
+        done, not_done = wait(pending, self.broadcast_timeout)
+        failed = [f for f in done if f.exception() is not None] + list(not_done)
+        for future in failed:
+            logger.warning(f"failed to send bill to {pending[future].address}")
 
-    def send_hidden_bill(self, bill: HiddenBill, target: NodeInfo) -> None:
-        """Send `bill` to `target`."""
+    def send_hidden_bill(self, bill: HiddenBill, target: NodeInfo) -> Future:
+        """Send `bill` to `target`, without waiting for the reply."""
         bill_msg = HiddenBillMessage(self.address, bill)
-        self.send(bill_msg, target)
+        return self.send_async(bill_msg, target)
 
 
-def launch_edge(server_address: TCPAddress, cycle_len: int = 672) -> None:
+def launch_edge(
+    server_address: TCPAddress,
+    cycle_len: int = 672,
+    onboarding_window: Optional[float] = None,
+    publish_port: Optional[int] = None,
+) -> None:
     """
     Launch peer server
     :param server_address: address to host this server
     :param edge: information of network edge to attach to.
+    :param onboarding_window: if given, seconds to collect joins for before
+    publishing them in a single roster.
+    :param publish_port: if given, port on which to publish broadcasts.
     """
-    server = EdgeServer(server_address, cycle_len)
+    server = EdgeServer(
+        server_address,
+        cycle_len,
+        onboarding_window=onboarding_window,
+        publish_port=publish_port,
+    )
     server.start()
@@ -0,0 +1,700 @@
+from __future__ import annotations
+import struct
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+from .core import (
+    Bill,
+    CycleContext,
+    Data,
+    HiddenBill,
+    HiddenData,
+    PublicHidingContext,
+    vector,
+)
+from .core.serialize import (
+    DeserializationOption,
+    OpenFHEDeserializer,
+    OpenFHESerializer,
+)
+from .messages import (
+    BatchResultMessage,
+    BillMessage,
+    BillingMessageType,
+    ConnectMessage,
+    ContextBatchMessage,
+    ContextMessage,
+    DataBatchMessage,
+    DataMessage,
+    GetBillMessage,
+    HiddenBillMessage,
+    HiddenDataBatchMessage,
+    HiddenDataMessage,
+    ReplayMessage,
+    RosterCompleteMessage,
+    RosterMessage,
+    SeedMessage,
+    SlotDataMessage,
+    UserType,
+)
+from .server import (
+    Address,
+    Encoder,
+    HostedAddress,
+    InprocAddress,
+    IPCAddress,
+    Message,
+    TCPAddress,
+    TransferablePublicKey,
+)
+
+
+MAGIC = b"PB"
+FORMAT_VERSION = 3
+
+# Wire tags. These are part of the format: never renumber, only append.
+MESSAGE_TAGS: Dict[BillingMessageType, int] = {
+    BillingMessageType.CONNECT: 1,
+    BillingMessageType.SEED: 2,
+    BillingMessageType.DATA: 3,
+    BillingMessageType.HIDDEN_DATA: 4,
+    BillingMessageType.GET_BILL: 5,
+    BillingMessageType.BILL: 6,
+    BillingMessageType.HIDDEN_BILL: 7,
+    BillingMessageType.CYCLE_CONTEXT: 8,
+    BillingMessageType.ROSTER: 9,
+    BillingMessageType.ROSTER_COMPLETE: 10,
+    BillingMessageType.REPLAY: 11,
+    BillingMessageType.DATA_BATCH: 12,
+    BillingMessageType.HIDDEN_DATA_BATCH: 13,
+    BillingMessageType.CYCLE_CONTEXT_BATCH: 14,
+    BillingMessageType.BATCH_RESULT: 15,
+    BillingMessageType.SLOT_DATA: 16,
+}
+USER_TYPE_TAGS: Dict[UserType, int] = {UserType.EDGE: 1, UserType.CORE: 2}
+TRANSPORT_TAGS: Dict[type, int] = {
+    TCPAddress: 1,
+    IPCAddress: 2,
+    InprocAddress: 3,
+    HostedAddress: 4,
+}
+KEY_ENCODING_TAGS: Dict[Encoding, int] = {
+    Encoding.PEM: 1,
+    Encoding.DER: 2,
+    Encoding.OpenSSH: 3,
+}
+KEY_FORMAT_TAGS: Dict[PublicFormat, int] = {
+    PublicFormat.SubjectPublicKeyInfo: 1,
+    PublicFormat.OpenSSH: 2,
+}
+
+U8 = struct.Struct("<B")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+HEADER = struct.Struct("<2sBB")
+
+FLOAT_DTYPE = np.dtype("<f8")
+
+
+class DecodingException(Exception):
+    pass
+
+
+class BinaryWriter:
+    """Append-only buffer with writers for the primitive field layouts."""
+
+    def __init__(self) -> None:
+        self.parts: list[bytes] = []
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.parts)
+
+    def u8(self, val: int) -> None:
+        self.parts.append(U8.pack(val))
+
+    def u16(self, val: int) -> None:
+        self.parts.append(U16.pack(val))
+
+    def i64(self, val: int) -> None:
+        self.parts.append(I64.pack(val))
+
+    def f64(self, val: float) -> None:
+        self.parts.append(F64.pack(val))
+
+    def blob(self, val: bytes) -> None:
+        """Length-prefixed bytes."""
+        self.parts.append(U32.pack(len(val)))
+        self.parts.append(val)
+
+    def str(self, val: str) -> None:
+        self.blob(val.encode())
+
+    def big_int(self, val: int) -> None:
+        """Arbitrary size, non-negative integer (e.g. 128-bit seeds)."""
+        self.blob(val.to_bytes((val.bit_length() + 7) // 8, "little"))
+
+    def uint64(self, val: int) -> None:
+        """Unsigned 64-bit id, such as a ClientID."""
+        self.parts.append(val.to_bytes(8, "little"))
+
+    def optional(self, val: Any, write: Callable[[Any], None]) -> None:
+        """Presence byte, followed by the value if present."""
+        self.u8(val is not None)
+        if val is not None:
+            write(val)
+
+    def floats(self, vals: vector[float]) -> None:
+        """Float vector, as a raw little-endian float64 array."""
+        self.blob(struct.pack(f"<{len(vals)}d", *vals))
+
+    def address(self, address: Address) -> None:
+        """
+        Transport tag, followed by the interface and port, or path, or name.
+        Hosted addresses hold the interface and port of the host, and the name.
+        """
+        self.u8(TRANSPORT_TAGS[type(address)])
+        match address:
+            case TCPAddress(interface, port):
+                self.str(interface)
+                self.u16(int(port))
+            case HostedAddress(TCPAddress(interface, port), name):
+                self.str(interface)
+                self.u16(int(port))
+                self.str(name)
+            case IPCAddress(path):
+                self.str(path)
+            case InprocAddress(name):
+                self.str(name)
+
+
+class BinaryReader:
+    """Cursor over an encoding, with readers mirroring `BinaryWriter`."""
+
+    def __init__(self, encoding: bytes) -> None:
+        self.view = memoryview(encoding)
+        self.offset = 0
+
+    def _take(self, size: int) -> memoryview:
+        if self.offset + size > len(self.view):
+            raise DecodingException("unexpected end of encoding")
+        chunk = self.view[self.offset : self.offset + size]
+        self.offset += size
+        return chunk
+
+    def _unpack(self, fmt: struct.Struct) -> Any:
+        return fmt.unpack(self._take(fmt.size))[0]
+
+    def u8(self) -> int:
+        return self._unpack(U8)
+
+    def u16(self) -> int:
+        return self._unpack(U16)
+
+    def i64(self) -> int:
+        return self._unpack(I64)
+
+    def f64(self) -> float:
+        return self._unpack(F64)
+
+    def blob(self) -> bytes:
+        return bytes(self._take(self._unpack(U32)))
+
+    def str(self) -> str:
+        return self.blob().decode()
+
+    def big_int(self) -> int:
+        return int.from_bytes(self.blob(), "little")
+
+    def uint64(self) -> int:
+        return int.from_bytes(self._take(8), "little")
+
+    def optional(self, read: Callable[[], Any]) -> Any:
+        return read() if self.u8() else None
+
+    def floats(self) -> vector[float]:
+        raw = self._take(self._unpack(U32))
+        return vector(np.frombuffer(raw, dtype=FLOAT_DTYPE).tolist())
+
+    def address(self) -> Address:
+        transport = _read_tag(self, TRANSPORT_TAGS)
+        if transport is TCPAddress:
+            return TCPAddress(self.str(), self.u16())
+        if transport is HostedAddress:
+            return HostedAddress(TCPAddress(self.str(), self.u16()), self.str())
+        return transport(self.str())
+
+    def check_exhausted(self) -> None:
+        if self.offset != len(self.view):
+            raise DecodingException("trailing bytes after message")
+
+
+class BinaryEncoder(Encoder):
+    """
+    Compact, versioned binary encoding of the billing messages.
+
+    Each encoding starts with a magic, the format version and a message tag,
+    followed by a fixed layout per message type:
+    - ids, cycle ids and ports are fixed-size integers,
+    - float vectors are raw little-endian float64 arrays,
+    - ciphertexts, keys and crypto contexts are length-prefixed blobs.
+
+    Unlike pickle, decoding never executes code from the encoding.
+    The empty reply (`""` or `None`) is encoded as empty bytes.
+    """
+
+    def encode(msg: Any) -> bytes:
+        if msg is None or msg == "":
+            return b""
+        if msg.type not in MESSAGE_TAGS:
+            raise ValueError(f"cannot encode message of type {msg.type}")
+
+        w = BinaryWriter()
+        w.parts.append(HEADER.pack(MAGIC, FORMAT_VERSION, MESSAGE_TAGS[msg.type]))
+        w.optional(msg.reply_address, w.address)
+        ENCODERS[msg.type](w, msg)
+        return w.getvalue()
+
+    def decode(encoding: bytes) -> Any:
+        if len(encoding) == 0:
+            return None
+
+        r = BinaryReader(encoding)
+        magic, version, tag = HEADER.unpack(r._take(HEADER.size))
+        if magic != MAGIC:
+            raise DecodingException("not a binary billing message")
+        if version != FORMAT_VERSION:
+            raise DecodingException(f"unsupported format {version=}")
+        if tag not in DECODERS:
+            raise DecodingException(f"unknown message {tag=}")
+
+        reply_address = r.optional(r.address)
+        msg = DECODERS[tag](r, reply_address)
+        r.check_exhausted()
+        return msg
+
+
+### Field layouts
+
+
+def _write_ciphertext(w: BinaryWriter, ct) -> None:
+    w.optional(ct, lambda ct: w.blob(OpenFHESerializer.serialize(ct)))
+
+
+def _read_ciphertext(r: BinaryReader):
+    return r.optional(
+        lambda: OpenFHEDeserializer.deserialize(
+            r.blob(), DeserializationOption.CIPHERTEXT
+        )
+    )
+
+
+def _write_phc(w: BinaryWriter, phc: PublicHidingContext) -> None:
+    w.i64(phc.cycle_length)
+    for part in OpenFHESerializer.serialize(phc.cc):
+        w.blob(part)
+    w.blob(OpenFHESerializer.serialize(phc.public_key))
+
+
+def _read_phc(r: BinaryReader) -> PublicHidingContext:
+    cycle_length = r.i64()
+    cc_parts = (r.blob(), r.blob(), r.blob())
+    cc = OpenFHEDeserializer.deserialize(cc_parts, DeserializationOption.CRYPTO_CONTEXT)
+    pk = OpenFHEDeserializer.deserialize(r.blob(), DeserializationOption.PUBLIC_KEY)
+
+    # Keep relinearization key around for `activate_keys`
+    phc = PublicHidingContext(cycle_length, cc, pk)
+    phc._relinearization_key_bytes = cc_parts[1]
+    return phc
+
+
+def _write_tpk(w: BinaryWriter, tpk: TransferablePublicKey) -> None:
+    w.blob(tpk.public_key_bytes)
+    w.u8(KEY_ENCODING_TAGS[tpk.encoding])
+    w.u8(KEY_FORMAT_TAGS[tpk.format])
+
+
+def _read_tpk(r: BinaryReader) -> TransferablePublicKey:
+    public_key_bytes = r.blob()
+    encoding = _read_tag(r, KEY_ENCODING_TAGS)
+    format = _read_tag(r, KEY_FORMAT_TAGS)
+    return TransferablePublicKey.from_bytes(public_key_bytes, encoding, format)
+
+
+def _write_role(w: BinaryWriter, role: UserType) -> None:
+    w.u8(USER_TYPE_TAGS[role])
+
+
+def _read_role(r: BinaryReader) -> UserType:
+    return _read_tag(r, USER_TYPE_TAGS)
+
+
+def _read_tag(r: BinaryReader, tags: Dict[Any, int]) -> Any:
+    """Read a u8 tag, and look up the value it stands for."""
+    tag = r.u8()
+    for val, val_tag in tags.items():
+        if val_tag == tag:
+            return val
+    raise DecodingException(f"unknown {tag=}")
+
+
+BILLING_STATE_TAGS = {int: 1, float: 2, str: 3}
+
+
+def _write_billing_state(w: BinaryWriter, state: Dict[str, Any]) -> None:
+    w.i64(len(state))
+    for key, val in state.items():
+        w.str(key)
+        if type(val) not in BILLING_STATE_TAGS:
+            raise ValueError(f"cannot encode billing state {key}={val!r}")
+        w.u8(BILLING_STATE_TAGS[type(val)])
+        {int: w.i64, float: w.f64, str: w.str}[type(val)](val)
+
+
+def _read_billing_state(r: BinaryReader) -> Dict[str, Any]:
+    readers = {1: r.i64, 2: r.f64, 3: r.str}
+    state = {}
+    for _ in range(r.i64()):
+        key = r.str()
+        tag = r.u8()
+        if tag not in readers:
+            raise DecodingException(f"unknown billing state {tag=}")
+        state[key] = readers[tag]()
+    return state
+
+
+### Message layouts
+
+
+def _write_signing_keys(w: BinaryWriter, keys: Dict[str, TransferablePublicKey]) -> None:
+    w.i64(len(keys))
+    for scheme, tpk in keys.items():
+        w.str(scheme)
+        _write_tpk(w, tpk)
+
+
+def _read_signing_keys(r: BinaryReader) -> Dict[str, TransferablePublicKey]:
+    keys = {}
+    for _ in range(r.i64()):
+        scheme = r.str()
+        keys[scheme] = _read_tpk(r)
+    return keys
+
+
+def _write_network_state(
+    w: BinaryWriter, network_state: Dict[Address, Any]
+) -> None:
+    w.i64(len(network_state))
+    for node in network_state.values():
+        w.address(node.address)
+        w.optional(node.pk, lambda pk: _write_tpk(w, pk))
+        w.optional(node.role, lambda role: _write_role(w, role))
+        _write_signing_keys(w, node.signing_keys)
+
+
+def _read_network_state(r: BinaryReader) -> Dict[Address, Any]:
+    from .network import NodeInfo
+
+    network_state = {}
+    for _ in range(r.i64()):
+        address = r.address()
+        node_pk = r.optional(lambda: _read_tpk(r))
+        node_role = r.optional(lambda: _read_role(r))
+        node_keys = _read_signing_keys(r)
+        network_state[address] = NodeInfo(address, node_pk, node_role, node_keys)
+    return network_state
+
+
+def _write_connect(w: BinaryWriter, msg: ConnectMessage) -> None:
+    _write_tpk(w, msg.pk)
+    _write_role(w, msg.role)
+    _write_network_state(w, msg.network_state)
+    _write_billing_state(w, msg.billing_state)
+    _write_signing_keys(w, msg.signing_keys)
+    w.i64(msg.version)
+    w.i64(msg.known_version)
+    w.blob(msg.digest)
+
+
+def _read_connect(r: BinaryReader, reply_address: Address) -> ConnectMessage:
+    pk = _read_tpk(r)
+    role = _read_role(r)
+    network_state = _read_network_state(r)
+    billing_state = _read_billing_state(r)
+    signing_keys = _read_signing_keys(r)
+    version = r.i64()
+    known_version = r.i64()
+    digest = r.blob()
+    return ConnectMessage(
+        reply_address,
+        pk,
+        role,
+        network_state,
+        billing_state,
+        signing_keys,
+        version,
+        known_version,
+        digest,
+    )
+
+
+def _write_roster(w: BinaryWriter, msg: RosterMessage) -> None:
+    _write_network_state(w, msg.network_state)
+    _write_billing_state(w, msg.billing_state)
+    w.i64(msg.version)
+    w.blob(msg.digest)
+
+
+def _read_roster(r: BinaryReader, reply_address: Address) -> RosterMessage:
+    network_state = _read_network_state(r)
+    billing_state = _read_billing_state(r)
+    return RosterMessage(reply_address, network_state, billing_state, r.i64(), r.blob())
+
+
+def _write_roster_complete(w: BinaryWriter, msg: RosterCompleteMessage) -> None:
+    w.i64(msg.version)
+    w.i64(len(msg.joined))
+    for address in msg.joined:
+        w.address(address)
+
+
+def _read_roster_complete(
+    r: BinaryReader, reply_address: Address
+) -> RosterCompleteMessage:
+    version = r.i64()
+    joined = [r.address() for _ in range(r.i64())]
+    return RosterCompleteMessage(reply_address, version, joined)
+
+
+def _write_replay(w: BinaryWriter, msg: ReplayMessage) -> None:
+    w.i64(msg.first)
+    w.i64(msg.last)
+
+
+def _read_replay(r: BinaryReader, reply_address: Address) -> ReplayMessage:
+    return ReplayMessage(reply_address, r.i64(), r.i64())
+
+
+def _write_seed(w: BinaryWriter, msg: SeedMessage) -> None:
+    w.big_int(msg.seed)
+
+
+def _read_seed(r: BinaryReader, reply_address: Address) -> SeedMessage:
+    return SeedMessage(reply_address, r.big_int())
+
+
+def _write_records(
+    w: BinaryWriter, records: List[Any], write: Callable[[BinaryWriter, Any], None]
+) -> None:
+    w.i64(len(records))
+    for record in records:
+        write(w, record)
+
+
+def _read_records(r: BinaryReader, read: Callable[[BinaryReader], Any]) -> List[Any]:
+    return [read(r) for _ in range(r.i64())]
+
+
+def _write_data_record(w: BinaryWriter, data: Data) -> None:
+    w.optional(data.client, w.uint64)
+    w.i64(data.cycle_id)
+    w.floats(data.utilization_promises)
+    w.floats(data.utilizations)
+
+
+def _read_data_record(r: BinaryReader) -> Data:
+    client = r.optional(r.uint64)
+    return Data(client, r.i64(), r.floats(), r.floats())
+
+
+def _write_data(w: BinaryWriter, msg: DataMessage) -> None:
+    _write_data_record(w, msg.data)
+
+
+def _read_data(r: BinaryReader, reply_address: Address) -> DataMessage:
+    return DataMessage(reply_address, _read_data_record(r))
+
+
+def _write_slot_data(w: BinaryWriter, msg: SlotDataMessage) -> None:
+    w.i64(msg.cycle_id)
+    w.i64(msg.slot)
+    w.floats(msg.utilization_promises)
+    w.floats(msg.utilizations)
+
+
+def _read_slot_data(r: BinaryReader, reply_address: TCPAddress) -> SlotDataMessage:
+    return SlotDataMessage(reply_address, r.i64(), r.i64(), r.floats(), r.floats())
+
+
+def _write_data_batch(w: BinaryWriter, msg: DataBatchMessage) -> None:
+    _write_records(w, msg.data, _write_data_record)
+
+
+def _read_data_batch(r: BinaryReader, reply_address: Address) -> DataBatchMessage:
+    return DataBatchMessage(reply_address, _read_records(r, _read_data_record))
+
+
+def _write_hidden_data_record(w: BinaryWriter, hd: HiddenData) -> None:
+    w.optional(hd.client, w.uint64)
+    w.i64(hd.cycle_id)
+    _write_ciphertext(w, hd.consumptions)
+    _write_ciphertext(w, hd.supplies)
+    _write_ciphertext(w, hd.accepted_consumer_flags)
+    _write_ciphertext(w, hd.accepted_producer_flags)
+    _write_ciphertext(w, hd.positive_deviation_flags)
+    w.floats(hd.masked_individual_deviations)
+    w.floats(hd.masked_p2p_consumer_flags)
+    w.floats(hd.masked_p2p_producer_flags)
+    w.optional(hd.phc, lambda phc: _write_phc(w, phc))
+
+
+def _read_hidden_data_record(r: BinaryReader) -> HiddenData:
+    return HiddenData(
+        r.optional(r.uint64),
+        r.i64(),
+        _read_ciphertext(r),
+        _read_ciphertext(r),
+        _read_ciphertext(r),
+        _read_ciphertext(r),
+        _read_ciphertext(r),
+        r.floats(),
+        r.floats(),
+        r.floats(),
+        r.optional(lambda: _read_phc(r)),
+    )
+
+
+def _write_hidden_data(w: BinaryWriter, msg: HiddenDataMessage) -> None:
+    _write_hidden_data_record(w, msg.data)
+
+
+def _read_hidden_data(r: BinaryReader, reply_address: Address) -> HiddenDataMessage:
+    return HiddenDataMessage(reply_address, _read_hidden_data_record(r))
+
+
+def _write_hidden_data_batch(w: BinaryWriter, msg: HiddenDataBatchMessage) -> None:
+    _write_records(w, msg.data, _write_hidden_data_record)
+
+
+def _read_hidden_data_batch(
+    r: BinaryReader, reply_address: Address
+) -> HiddenDataBatchMessage:
+    data = _read_records(r, _read_hidden_data_record)
+    return HiddenDataBatchMessage(reply_address, data)
+
+
+def _write_get_bill(w: BinaryWriter, msg: GetBillMessage) -> None:
+    w.i64(msg.cycle_id)
+
+
+def _read_get_bill(r: BinaryReader, reply_address: Address) -> GetBillMessage:
+    return GetBillMessage(reply_address, r.i64())
+
+
+def _write_bill(w: BinaryWriter, msg: BillMessage) -> None:
+    def write(bill: Bill) -> None:
+        w.i64(bill.cycle_id)
+        w.floats(bill.bill)
+        w.floats(bill.reward)
+
+    w.optional(msg.bill, write)
+
+
+def _read_bill(r: BinaryReader, reply_address: Address) -> BillMessage:
+    bill = r.optional(lambda: Bill(r.i64(), r.floats(), r.floats()))
+    return BillMessage(reply_address, bill)
+
+
+def _write_hidden_bill(w: BinaryWriter, msg: HiddenBillMessage) -> None:
+    hb: HiddenBill = msg.hidden_bill
+    w.i64(hb.cycle_id)
+    _write_ciphertext(w, hb.hidden_bill)
+    _write_ciphertext(w, hb.hidden_reward)
+
+
+def _read_hidden_bill(r: BinaryReader, reply_address: Address) -> HiddenBillMessage:
+    hb = HiddenBill(r.i64(), _read_ciphertext(r), _read_ciphertext(r))
+    return HiddenBillMessage(reply_address, hb)
+
+
+def _write_context_record(w: BinaryWriter, cyc: CycleContext) -> None:
+    w.i64(cyc.cycle_id)
+    w.i64(cyc.cycle_length)
+    w.floats(cyc.retail_prices)
+    w.floats(cyc.feed_in_tarifs)
+    w.floats(cyc.trading_prices)
+
+
+def _read_context_record(r: BinaryReader) -> CycleContext:
+    return CycleContext(r.i64(), r.i64(), r.floats(), r.floats(), r.floats())
+
+
+def _write_context(w: BinaryWriter, msg: ContextMessage) -> None:
+    _write_context_record(w, msg.context)
+
+
+def _read_context(r: BinaryReader, reply_address: Address) -> ContextMessage:
+    return ContextMessage(reply_address, _read_context_record(r))
+
+
+def _write_context_batch(w: BinaryWriter, msg: ContextBatchMessage) -> None:
+    _write_records(w, msg.contexts, _write_context_record)
+
+
+def _read_context_batch(
+    r: BinaryReader, reply_address: Address
+) -> ContextBatchMessage:
+    return ContextBatchMessage(reply_address, _read_records(r, _read_context_record))
+
+
+def _write_batch_result(w: BinaryWriter, msg: BatchResultMessage) -> None:
+    _write_records(w, msg.errors, lambda w, error: w.optional(error, w.str))
+
+
+def _read_batch_result(
+    r: BinaryReader, reply_address: Address
+) -> BatchResultMessage:
+    errors = _read_records(r, lambda r: r.optional(r.str))
+    return BatchResultMessage(reply_address, errors)
+
+
+ENCODERS: Dict[BillingMessageType, Callable[[BinaryWriter, Message], None]] = {
+    BillingMessageType.CONNECT: _write_connect,
+    BillingMessageType.SEED: _write_seed,
+    BillingMessageType.DATA: _write_data,
+    BillingMessageType.HIDDEN_DATA: _write_hidden_data,
+    BillingMessageType.GET_BILL: _write_get_bill,
+    BillingMessageType.BILL: _write_bill,
+    BillingMessageType.HIDDEN_BILL: _write_hidden_bill,
+    BillingMessageType.CYCLE_CONTEXT: _write_context,
+    BillingMessageType.ROSTER: _write_roster,
+    BillingMessageType.ROSTER_COMPLETE: _write_roster_complete,
+    BillingMessageType.REPLAY: _write_replay,
+    BillingMessageType.DATA_BATCH: _write_data_batch,
+    BillingMessageType.HIDDEN_DATA_BATCH: _write_hidden_data_batch,
+    BillingMessageType.CYCLE_CONTEXT_BATCH: _write_context_batch,
+    BillingMessageType.BATCH_RESULT: _write_batch_result,
+    BillingMessageType.SLOT_DATA: _write_slot_data,
+}
+
+DECODERS: Dict[int, Callable[[BinaryReader, Optional[Address]], Message]] = {
+    MESSAGE_TAGS[BillingMessageType.CONNECT]: _read_connect,
+    MESSAGE_TAGS[BillingMessageType.SEED]: _read_seed,
+    MESSAGE_TAGS[BillingMessageType.DATA]: _read_data,
+    MESSAGE_TAGS[BillingMessageType.HIDDEN_DATA]: _read_hidden_data,
+    MESSAGE_TAGS[BillingMessageType.GET_BILL]: _read_get_bill,
+    MESSAGE_TAGS[BillingMessageType.BILL]: _read_bill,
+    MESSAGE_TAGS[BillingMessageType.HIDDEN_BILL]: _read_hidden_bill,
+    MESSAGE_TAGS[BillingMessageType.CYCLE_CONTEXT]: _read_context,
+    MESSAGE_TAGS[BillingMessageType.ROSTER]: _read_roster,
+    MESSAGE_TAGS[BillingMessageType.ROSTER_COMPLETE]: _read_roster_complete,
+    MESSAGE_TAGS[BillingMessageType.REPLAY]: _read_replay,
+    MESSAGE_TAGS[BillingMessageType.DATA_BATCH]: _read_data_batch,
+    MESSAGE_TAGS[BillingMessageType.HIDDEN_DATA_BATCH]: _read_hidden_data_batch,
+    MESSAGE_TAGS[BillingMessageType.CYCLE_CONTEXT_BATCH]: _read_context_batch,
+    MESSAGE_TAGS[BillingMessageType.BATCH_RESULT]: _read_batch_result,
+    MESSAGE_TAGS[BillingMessageType.SLOT_DATA]: _read_slot_data,
+}
@@ -1,10 +1,10 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 from .core import Data, HiddenData, CycleID, HiddenBill, Bill, CycleContext
-from .server import TCPAddress, Signature, Message, MessageType, TransferablePublicKey
+from .server import Address, Message, MessageType, TransferablePublicKey
 
 
 class UserType(Enum):
@@ -26,29 +26,92 @@ class BillingMessageType(MessageType):
     HIDDEN_BILL = "hidden_bill"
     CYCLE_CONTEXT = "cycle_context"
     GET_CYCLE_CONTEXT = "get_cycle_context"
-
-
-@dataclass
-class SignedMessage:
-    message: Message
-    signature: Signature
-
-    def verify(self, pk: TransferablePublicKey) -> bool:
-        pk.verify_signature(self.message, self.signature)
+    ROSTER = "roster"
+    ROSTER_COMPLETE = "roster_complete"
+    REPLAY = "replay"
+    DATA_BATCH = "data_batch"
+    HIDDEN_DATA_BATCH = "hidden_data_batch"
+    CYCLE_CONTEXT_BATCH = "cycle_context_batch"
+    BATCH_RESULT = "batch_result"
+    SLOT_DATA = "slot_data"
 
 
 @dataclass
 class ConnectMessage(Message):
-    pk: bytes
+    """
+    :param network_state: changes to the sender's view of the network, since
+    the version seen by the receiver.
+    :param version: version of the sender's view of the network.
+    :param known_version: version of the receiver's view seen by the sender.
+    :param digest: digest of the sender's view of the network.
+    """
+
+    pk: TransferablePublicKey
     role: UserType
-    network_state: Dict[TCPAddress, bytes]
+    network_state: Dict[Address, Any]
     billing_state: Dict[str, Any]
+    signing_keys: Dict[str, TransferablePublicKey] = field(default_factory=dict)
+    version: int = 0
+    known_version: int = 0
+    digest: bytes = b""
 
     @property
     def type(self) -> MessageType:
         return BillingMessageType.CONNECT
 
 
+@dataclass
+class RosterMessage(Message):
+    """
+    Consolidated view of the network, published at the end of an onboarding window.
+
+    :param network_state: all members, or the changes since the previous
+    roster, for members that received it.
+    :param version: version of the publisher's view of the network.
+    :param digest: digest of the publisher's view of the network.
+    """
+
+    network_state: Dict[Address, Any]
+    billing_state: Dict[str, Any]
+    version: int = 0
+    digest: bytes = b""
+
+    @property
+    def type(self) -> BillingMessageType:
+        return BillingMessageType.ROSTER
+
+
+@dataclass
+class RosterCompleteMessage(Message):
+    """
+    Announces that all members hold the roster of `version`.
+
+    :param joined: addresses of the members that joined with this roster.
+    """
+
+    version: int
+    joined: List[Address] = field(default_factory=list)
+
+    @property
+    def type(self) -> BillingMessageType:
+        return BillingMessageType.ROSTER_COMPLETE
+
+
+@dataclass
+class ReplayMessage(Message):
+    """
+    Requests the published messages with sequence numbers from `first` up to
+    and including `last`, which the sender missed.
+    """
+
+    first: int
+    last: int
+
+    @property
+    def type(self) -> BillingMessageType:
+        return BillingMessageType.REPLAY
+
+
 @dataclass
 class ContextMessage(Message):
     context: CycleContext
@@ -110,3 +173,78 @@ class HiddenBillMessage(Message):
     @property
     def type(self) -> BillingMessageType:
         return BillingMessageType.HIDDEN_BILL
+
+
+@dataclass
+class DataBatchMessage(Message):
+    """Many `Data` records, sent and signed as one message."""
+
+    data: List[Data]
+
+    @property
+    def type(self) -> BillingMessageType:
+        return BillingMessageType.DATA_BATCH
+
+
+@dataclass
+class HiddenDataBatchMessage(Message):
+    """Many `HiddenData` records, sent and signed as one message."""
+
+    data: List[HiddenData]
+
+    @property
+    def type(self) -> BillingMessageType:
+        return BillingMessageType.HIDDEN_DATA_BATCH
+
+
+@dataclass
+class ContextBatchMessage(Message):
+    """Many `CycleContext` records, sent and signed as one message."""
+
+    contexts: List[CycleContext]
+
+    @property
+    def type(self) -> BillingMessageType:
+        return BillingMessageType.CYCLE_CONTEXT_BATCH
+
+
+@dataclass
+class BatchResultMessage(Message):
+    """
+    Reply to a batch, with the outcome per record, in order of the batch.
+
+    :param errors: per record, None if the record was accepted, or the error
+    it was rejected with.
+    """
+
+    errors: List[Optional[str]]
+
+    @property
+    def accepted(self) -> int:
+        """Number of accepted records."""
+        return self.errors.count(None)
+
+    @property
+    def type(self) -> BillingMessageType:
+        return BillingMessageType.BATCH_RESULT
+
+
+@dataclass
+class SlotDataMessage(Message):
+    """
+    Readings of consecutive slots of an open cycle, sent as meters report.
+
+    :param cycle_id: cycle the readings belong to.
+    :param slot: index of the first slot read.
+    :param utilization_promises: promise per slot read.
+    :param utilizations: utilization per slot read.
+    """
+
+    cycle_id: CycleID
+    slot: int
+    utilization_promises: List[float]
+    utilizations: List[float]
+
+    @property
+    def type(self) -> BillingMessageType:
+        return BillingMessageType.SLOT_DATA
@@ -1,35 +1,270 @@
-from dataclasses import dataclass
-from multiprocessing.pool import ThreadPool
-from typing import Callable, Dict, Iterable, Tuple
+from collections.abc import MutableMapping
+from concurrent.futures import Future
+from dataclasses import dataclass, field, replace
+from functools import lru_cache, partial
+from multiprocessing.pool import AsyncResult, ThreadPool
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 import hashlib
+import threading
 
-from .messages import ConnectMessage, BillingMessageType, SignedMessage, UserType
+import zmq
+from .messages import (
+    BatchResultMessage,
+    BillingMessageType,
+    ConnectMessage,
+    ReplayMessage,
+    RosterMessage,
+    UserType,
+)
 from .server import (
+    Address,
+    ECDSA,
+    Address,
+    Delivery,
+    NoSessionKeyException,
     RequestReplyServer,
+    Encoder,
+    Envelope,
+    HostedAddress,
+    MalformedEnvelopeException,
+    Lane,
+    LaneDispatcher,
+    LaneFullException,
     Message,
+    Publisher,
     Signer,
+    Subscriber,
     TransferablePublicKey,
     PickleEncoder,
+    Signature,
     TCPAddress,
+    authenticate,
+    derive_session_key,
+    fan_out,
+    verify_authentication,
 )
 from .log import full_stack, logger
 
 
 @dataclass
 class NodeInfo:
-    address: TCPAddress
+    """
+    :param address: address of the node
+    :param pk: primary public key of the node, which determines its id
+    :param role: network role of the node
+    :param signing_keys: keys the node signs with, per signature scheme,
+    in order of preference. These are also the schemes the node accepts.
+    """
+
+    address: Address
     pk: TransferablePublicKey
     role: UserType
+    signing_keys: Dict[str, TransferablePublicKey] = field(default_factory=dict)
+
+    # Id, and the key it was derived from
+    _id: Optional[Tuple[TransferablePublicKey, int]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def get_verification_key(self, scheme: str) -> Optional[TransferablePublicKey]:
+        """Key to verify this node's signatures under `scheme` with."""
+        return self.signing_keys.get(scheme, self.pk)
 
     @property
     def id(self) -> int:
-        digest = hashlib.sha256(self.pk.public_key_bytes).digest()
-        return int.from_bytes(digest, "little") % pow(2, 64)
+        """Id of the node, derived from its primary public key once."""
+        if self._id is None or self._id[0] is not self.pk:
+            digest = hashlib.sha256(self.pk.public_key_bytes).digest()
+            self._id = (self.pk, int.from_bytes(digest, "little") % pow(2, 64))
+        return self._id[1]
 
     def __hash__(self) -> int:
         return hash((self.address, self.pk, self.role))
 
 
+@lru_cache(maxsize=1024)
+def unknown_node(address: Address) -> NodeInfo:
+    """Placeholder info of a node that is not registered. Must not be modified."""
+    return NodeInfo(address, None, None)
+
+
+@dataclass
+class MembershipDelta:
+    """
+    Changes to a membership registry.
+
+    :param members: members registered or replaced since the base version.
+    :param version: version of the registry including these changes.
+    :param digest: digest of the registry at `version`.
+    """
+
+    members: Dict[TCPAddress, NodeInfo]
+    version: int
+    digest: bytes
+
+
+class MembershipRegistry(MutableMapping):
+    """
+    Known network members, by address.
+
+    Members are indexed by address, and by role and id, such that lookups
+    cost O(1). The views on the other members (`peers`, `edges`, `cores`)
+    are built once, and rebuilt only after membership changes.
+
+    Every change bumps the version of the registry, such that peers can
+    exchange only the changes since the version they last saw. Two registries
+    with equal digests hold members with the same ids. Removals are local,
+    and are not part of the changes.
+
+    :param owner: info of the node owning this registry, which is a member
+    but not a peer.
+    """
+
+    def __init__(self, owner: NodeInfo) -> None:
+        self.owner = owner
+        self.version = 0
+        self._members: Dict[TCPAddress, NodeInfo] = {}
+        self._by_id: Dict[Tuple[UserType, int], NodeInfo] = {}
+        self._views: Dict[Optional[UserType], Tuple[NodeInfo, ...]] = {}
+        self._digest: Optional[bytes] = None
+
+        # Version of the last change per member, in order of change
+        self._changed_at: Dict[TCPAddress, int] = {}
+
+        self._lock = threading.Lock()
+        self.register(owner)
+
+    def register(self, node: NodeInfo) -> None:
+        """Register `node`, replacing any member at the same address."""
+        self[node.address] = node
+
+    def get_node_info(self, address: Address) -> NodeInfo:
+        """Info of the member at `address`, or a placeholder if it is unknown."""
+        node = self._members.get(address)
+        return unknown_node(address) if node is None else node
+
+    def get_by_id(self, node_id: int, role: UserType) -> Optional[NodeInfo]:
+        """Member with id `node_id` and role `role`, if any."""
+        return self._by_id.get((role, node_id))
+
+    @property
+    def digest(self) -> bytes:
+        """Digest of the ids of all members."""
+        if self._digest is None:
+            with self._lock:
+                self._digest = self._compute_digest()
+        return self._digest
+
+    def _compute_digest(self) -> bytes:
+        ids = sorted(node.id for node in self._members.values() if node.pk is not None)
+        return hashlib.sha256(b"".join(i.to_bytes(8, "little") for i in ids)).digest()
+
+    def changes_since(
+        self, version: int, exclude: Collection[TCPAddress] = ()
+    ) -> MembershipDelta:
+        """
+        Changes since `version`.
+
+        :param version: version to get the changes since, 0 for all members.
+        :param exclude: addresses of members to leave out.
+        """
+        with self._lock:
+            members = {}
+            for address, changed_at in reversed(self._changed_at.items()):
+                if changed_at <= version:
+                    break
+                if address not in exclude:
+                    members[address] = self._members[address]
+            if self._digest is None:
+                self._digest = self._compute_digest()
+            return MembershipDelta(members, self.version, self._digest)
+
+    @property
+    def peers(self) -> Tuple[NodeInfo, ...]:
+        """All members, except the owner."""
+        return self._view(None)
+
+    @property
+    def edges(self) -> Tuple[NodeInfo, ...]:
+        """All edge members, except the owner."""
+        return self._view(UserType.EDGE)
+
+    @property
+    def cores(self) -> Tuple[NodeInfo, ...]:
+        """All core members, except the owner."""
+        return self._view(UserType.CORE)
+
+    def _view(self, role: Optional[UserType]) -> Tuple[NodeInfo, ...]:
+        view = self._views.get(role)
+        if view is None:
+            with self._lock:
+                view = tuple(
+                    node
+                    for node in self._members.values()
+                    if node.address != self.owner.address
+                    and (role is None or node.role == role)
+                )
+                self._views[role] = view
+        return view
+
+    def __getitem__(self, address: TCPAddress) -> NodeInfo:
+        return self._members[address]
+
+    def __setitem__(self, address: TCPAddress, node: NodeInfo) -> None:
+        with self._lock:
+            self._unindex(address)
+            self._members[address] = node
+            if node.pk is not None:
+                self._by_id[(node.role, node.id)] = node
+            self.version += 1
+            self._changed_at.pop(address, None)
+            self._changed_at[address] = self.version
+            self._invalidate()
+
+    def __delitem__(self, address: TCPAddress) -> None:
+        with self._lock:
+            self._unindex(address)
+            del self._members[address]
+            del self._changed_at[address]
+            self.version += 1
+            self._invalidate()
+
+    def _invalidate(self) -> None:
+        self._views = {}
+        self._digest = None
+
+    def _unindex(self, address: TCPAddress) -> None:
+        old = self._members.get(address)
+        if old is not None and old.pk is not None:
+            if self._by_id.get((old.role, old.id)) is old:
+                del self._by_id[(old.role, old.id)]
+
+    def __contains__(self, address: object) -> bool:
+        return address in self._members
+
+    def __iter__(self) -> Iterator[TCPAddress]:
+        return iter(self._members)
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+
+def get_recipient(target: Address) -> Optional[str]:
+    """Name of the hosted server at `target` to name in envelopes, if any."""
+    return target.name if isinstance(target, HostedAddress) else None
+
+
 MessageHandler = Callable[[Message, NodeInfo], None]
 
 
@@ -49,26 +284,96 @@ class NoValidSignatureException(Exception):
     pass
 
 
+CONTROL_LANE = "control"
+BILLING_LANE = "billing"
+
+
 class PeerToPeerBillingBaseServer(RequestReplyServer):
     """
     Base server for the PeerToPeer Billing network.
     Implements Network discovery layer.
     """
 
-    def __init__(self, address=TCPAddress("localhost", 5555)) -> None:
-        super().__init__(PickleEncoder)
+    def __init__(
+        self,
+        address=TCPAddress("localhost", 5555),
+        encoder: Encoder = PickleEncoder,
+        decode_workers: int = 4,
+        signature_schemes: Sequence[str] = (ECDSA,),
+        session_authentication: bool = False,
+        lanes: Optional[LaneDispatcher] = None,
+        publish_port: Optional[int] = None,
+        context: Optional[zmq.Context] = None,
+        host: Optional[RequestReplyServer] = None,
+        decode_pool: Optional[ThreadPool] = None,
+    ) -> None:
+        # Servers hosted by another server share its socket and connections
+        if host is None:
+            super().__init__(encoder, context=context)
+        else:
+            super().__init__(
+                encoder,
+                context=host.context,
+                sock=host.sock,
+                connections=host.connections,
+            )
         self.address = address
 
         # Initialize Signer
-        self.signer = Signer()
-        self._node_info = NodeInfo(self.address, self.pk, self.role)
+        self.signer = Signer(schemes=signature_schemes)
+        self._node_info = NodeInfo(
+            self.address, self.pk, self.role, self.signer.get_transferable_public_keys()
+        )
 
         # Add self to network
-        self.network_members = {self.address: self._node_info}
+        self.network_members = MembershipRegistry(self._node_info)
         self.billing_state = {}
 
-        # Setup threadpool to handle incoming requests
-        self.tp = ThreadPool(processes=1)
+        # Session keys, used to authenticate messages with HMAC instead of signatures
+        self.session_authentication = session_authentication
+        self.session_keys: Dict[TCPAddress, bytes] = {}
+        self.session_peers: set[TCPAddress] = set()
+
+        # Version of each peer's view of the network merged by us, and the
+        # last views (ours, theirs) for which we sent a peer changes
+        self.peer_versions: Dict[TCPAddress, int] = {}
+        self.sync_views: Dict[TCPAddress, Tuple[bytes, bytes]] = {}
+
+        # Setup executor lanes to handle incoming requests
+        self.lanes = lanes or self.get_default_lanes()
+
+        # Setup threadpool to verify and decode incoming messages off the receive loop
+        self.decode_pool = decode_pool or ThreadPool(processes=decode_workers)
+
+        # Channel to publish messages to all subscribed peers at once, if any,
+        # and subscriptions to the channels of peers, by peer address
+        self.publish_port = publish_port
+        self.publisher: Optional[Publisher] = None
+        self.subscriptions: Dict[TCPAddress, Subscriber] = {}
+        if publish_port is not None:
+            self.billing_state["publish_port"] = publish_port
+
+    @staticmethod
+    def get_default_lanes() -> LaneDispatcher:
+        """
+        Executor lanes to handle incoming requests on.
+
+        Control messages are handled on a fast lane, such that they are not
+        held up by the heavy FHE work on incoming data and bills. Each lane
+        handles its messages in order of arrival.
+        """
+        return LaneDispatcher(
+            [Lane(CONTROL_LANE), Lane(BILLING_LANE, max_queue=256)],
+            {
+                BillingMessageType.DATA: BILLING_LANE,
+                BillingMessageType.HIDDEN_DATA: BILLING_LANE,
+                BillingMessageType.HIDDEN_BILL: BILLING_LANE,
+                BillingMessageType.DATA_BATCH: BILLING_LANE,
+                BillingMessageType.HIDDEN_DATA_BATCH: BILLING_LANE,
+                BillingMessageType.SLOT_DATA: BILLING_LANE,
+            },
+            CONTROL_LANE,
+        )
 
     @property
     def id(self) -> int:
@@ -90,25 +395,45 @@ class PeerToPeerBillingBaseServer(RequestReplyServer):
         """Message type to handler function map."""
         return {
             BillingMessageType.CONNECT: self.handle_connect,
+            BillingMessageType.ROSTER: self.handle_roster,
+            BillingMessageType.REPLAY: self.handle_replay,
         }
 
     @property
     def network_peers(self) -> Iterable[NodeInfo]:
         """All other nodes in the network."""
-        return set(self.network_members.values()).difference({self._node_info})
+        return self.network_members.peers
 
     @property
     def network_edges(self) -> Iterable[NodeInfo]:
-        """All edge nodes in the network."""
-        return filter(lambda x: x.role == UserType.EDGE, self.network_members.values())
+        """All other edge nodes in the network."""
+        return self.network_members.edges
 
     @property
     def network_cores(self) -> Iterable[NodeInfo]:
-        """All core nodes in the network."""
-        return filter(lambda x: x.role == UserType.CORE, self.network_members.values())
+        """All other core nodes in the network."""
+        return self.network_members.cores
 
     def start(self, interval: int = 1000) -> None:
-        super().start(self.address.port, interval)
+        self.open_channels()
+        try:
+            super().start(self.address, interval)
+        finally:
+            self.close_channels()
+
+    def open_channels(self) -> None:
+        """Open the publish channel, if any."""
+        if self.publish_port is not None:
+            self.publisher = Publisher(self.context, self.publish_port)
+
+    def close_channels(self) -> None:
+        """Close the publish channel, and all subscriptions."""
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+        for subscription in self.subscriptions.values():
+            subscription.close()
+        self.subscriptions = {}
 
     def send(
         self, msg: Message, target: TCPAddress | NodeInfo, sign: bool = True
@@ -120,32 +445,222 @@ class PeerToPeerBillingBaseServer(RequestReplyServer):
         :param target: target to send message to
         :param sign: whether to sign message before sending, defaults to True
         """
+        self.send_async(msg, target, sign).result()
+
+    def send_async(
+        self, msg: Message, target: TCPAddress | NodeInfo, sign: bool = True
+    ) -> Future:
+        """
+        Send `msg` to `target`, without waiting for the reply.
+
+        :param msg: message to send
+        :param target: target to send message to
+        :param sign: whether to sign message before sending, defaults to True
+        :return: future resolving to the raw reply
+        """
         if isinstance(target, NodeInfo):
             target = target.address
         logger.info(f"sending {type(msg)=} to {target=}")
-        if sign:
-            msg = self.sign_msg(msg)
-        super().send(msg, target)
+        node = self.get_node_info(target)
+        session_key = self.get_session_key_for(target)
+        envelope = self.seal(msg, sign, self.select_scheme(node), session_key)
+        envelope.recipient = get_recipient(target)
+        return self.send_frames_async(envelope.to_frames(), target)
+
+    def select_scheme(self, target: NodeInfo) -> str:
+        """Negotiate the signature scheme to use for messages to `target`."""
+        return self.signer.select_scheme(target.signing_keys)
+
+    def seal(
+        self,
+        msg: Message,
+        sign: bool = True,
+        scheme: str = None,
+        session_key: Optional[bytes] = None,
+    ) -> Envelope:
+        """
+        Encode `msg` exactly once and put it in an envelope.
+
+        :param msg: message to seal
+        :param sign: whether to sign the encoded message, defaults to True
+        :param scheme: signature scheme to sign with, defaults to the primary scheme
+        :param session_key: if given, authenticate with this session key instead of signing
+        :return: envelope holding the (signed) encoded message
+        """
+        payload = self.encoder.encode(msg)
+        envelope = Envelope(self.address, payload, message_type=msg.type.value)
+        if sign and session_key:
+            envelope.mac = authenticate(session_key, payload)
+        elif sign:
+            envelope.signature = self.signer.sign(payload, scheme=scheme)
+        return envelope
 
-    def sign_msg(self, msg: Message) -> SignedMessage:
+    def get_session_key_for(self, target: TCPAddress) -> Optional[bytes]:
+        """Session key to authenticate messages to `target` with, if any."""
+        if target not in self.session_peers:
+            return None
+        return self.session_keys.get(target)
+
+    def sign_msg(self, msg: Message) -> Envelope:
         """Sign message before sending."""
-        msg = self.encoder.encode(msg)
-        sig = self.signer.sign(msg)
-        return SignedMessage(msg, sig)
+        return self.seal(msg, sign=True)
+
+    def broadcast(
+        self, msg: Message, targets: Iterable[NodeInfo], sign: bool = True
+    ) -> Dict[TCPAddress, Delivery]:
+        """
+        Broadcast `msg` to `targets`.
+
+        The message is encoded once, and signed at most once per signature
+        scheme in use, such that all targets receive identical payload bytes.
+        Only the cheap session MACs are computed per target.
 
-    def broadcast(self, msg: Message, targets: set[NodeInfo]) -> None:
+        :param msg: message to broadcast
+        :param targets: nodes to broadcast to
+        :param sign: whether to sign message before sending, defaults to True
+        :return: delivery outcome per target address
+        """
         targets = map(lambda x: x.address, targets)
-        return super().broadcast(msg, targets)
+        logger.info(f"broadcasting {type(msg)=}")
+        payload = self.encoder.encode(msg)
+        signatures: Dict[str, Signature] = {}
+
+        def send(target: TCPAddress) -> Future:
+            envelope = Envelope(
+                self.address,
+                payload,
+                message_type=msg.type.value,
+                recipient=get_recipient(target),
+            )
+            session_key = self.get_session_key_for(target)
+            if sign and session_key:
+                envelope.mac = authenticate(session_key, payload)
+            elif sign:
+                scheme = self.select_scheme(self.get_node_info(target))
+                if scheme not in signatures:
+                    signatures[scheme] = self.signer.sign(payload, scheme=scheme)
+                envelope.signature = signatures[scheme]
+            return self.send_frames_async(envelope.to_frames(), target)
+
+        deliveries = fan_out(
+            send, targets, self.broadcast_timeout, self.broadcast_parallelism
+        )
+        for delivery in deliveries.values():
+            if not delivery.ok:
+                logger.warning(
+                    f"failed to deliver {type(msg)=} to {delivery.target}: "
+                    f"{delivery.error!r}"
+                )
+        return deliveries
+
+    def get_handler(self, message_type: BillingMessageType) -> MessageHandler:
+        """Get the handler for messages of type `message_type`."""
+        return self.handlers.get(message_type, self._fallback_handler)
+
+    def requires_verification(self, message_type: BillingMessageType) -> bool:
+        """Whether messages of type `message_type` require a valid signature."""
+        return getattr(self.get_handler(message_type), "require_verification", True)
+
+    def _handle_frames(self, frames: List[bytes]) -> None:
+        """
+        Handle the raw frames of an incoming message.
+
+        Only the envelope header is parsed on the receive loop. Messages whose
+        handler does not reply are acknowledged right away; their signature
+        verification and decoding happen on the decode pool. Handlers run on
+        the lane for their message type, in order of arrival. If that lane is
+        full, the message is rejected with a busy reply.
+        """
+        if not Envelope.is_envelope(frames):
+            return super()._handle_frames(frames)
+        try:
+            envelope = Envelope.from_frames(frames)
+        except MalformedEnvelopeException as e:
+            logger.warning(f"rejecting malformed envelope: {e}")
+            return self.reject()
+        self.handle_envelope(envelope)
+
+    def handle_envelope(self, envelope: Envelope) -> None:
+        """Handle an incoming envelope, see `_handle_frames`."""
+        message_type = self._parse_message_type(envelope.message_type)
+        handler = self.get_handler(message_type)
+        if getattr(handler, "replies", False):
+            return self._handle(envelope)
+
+        try:
+            self.accept_envelope(envelope)
+        except LaneFullException as e:
+            logger.warning(f"lane {str(e)} is full, rejecting {message_type=}")
+            return self.reply_busy()
+        self.reply("")
+
+    def accept_envelope(self, envelope: Envelope) -> None:
+        """
+        Verify and decode `envelope` on the decode pool, and then handle it on
+        the lane for its message type. The handler must not reply.
+        :raises LaneFullException: if the lane for its message type is full.
+        """
+        message_type = self._parse_message_type(envelope.message_type)
+        pending = self.decode_pool.apply_async(self.verify_signature, (envelope,))
+        self.dispatch(message_type, self._handle_decoded, pending, message_type)
+
+    def _handle_decoded(
+        self, pending: AsyncResult, message_type: Optional[BillingMessageType]
+    ) -> None:
+        """
+        Handle a message, once it has been verified and decoded.
+
+        The header of the envelope is not signed, yet decided how the message
+        was acknowledged and on which lane it is handled. Hence, a message whose
+        type differs from the type named in its header is dropped.
+        """
+        msg, has_valid_signature = pending.get()
+        if msg is None:
+            return  # dropped before decoding
+
+        origin = self.get_node_info(msg.reply_address)
+        if msg.type != message_type:
+            logger.error(
+                f"message {type(msg)=} from {origin.address} does not match "
+                f"its header {message_type=}, dropping..."
+            )
+            return
+
+        logger.debug(f"received message {type(msg)=} from {origin.address}")
+
+        handler = self.get_handler(msg.type)
+        requires_validation = getattr(handler, "require_verification", True)
+        if requires_validation and not has_valid_signature:
+            logger.error(
+                f"message {type(msg)=} from {origin=} has invalid signature."
+                "aborting..."
+            )
+            return
+
+        self.execute(handler, msg, origin)
+
+    @staticmethod
+    def _parse_message_type(value: Optional[str]) -> Optional[BillingMessageType]:
+        """Parse the message type named in an envelope header."""
+        try:
+            return BillingMessageType(value)
+        except ValueError:
+            return None
 
     def _handle(self, msg: Message) -> None:
         """Handle an incoming message"""
         # Handle signature
         msg, has_valid_signature = self.verify_signature(msg)
+        if msg is None:
+            # Send required reply to prevent connection problems
+            self.reply("")
+            raise NoValidSignatureException()
+
         origin = self.get_node_info(msg.reply_address)
 
         logger.debug(f"received message {type(msg)=} from {origin.address}")
 
-        handler = self.handlers.get(msg.type, self._fallback_handler)
+        handler = self.get_handler(msg.type)
 
         # Validity check
         requires_validation = getattr(handler, "require_verification", True)
@@ -160,15 +675,17 @@ class PeerToPeerBillingBaseServer(RequestReplyServer):
 
             raise NoValidSignatureException()
 
-        # Send empty reply if applicable
-        handler_replies = getattr(handler, "replies", False)
-        if not handler_replies:
-            self.reply("")
-
-        if handler_replies:
+        if getattr(handler, "replies", False):
             self.execute(handler, msg, origin)
-        else:
-            self.async_execute(handler, msg, origin)
+            return
+
+        # Send empty reply, or a busy reply if the lane is full
+        try:
+            self.dispatch(msg.type, handler, msg, origin)
+        except LaneFullException as e:
+            logger.warning(f"lane {str(e)} is full, rejecting {type(msg)=}")
+            return self.reply_busy()
+        self.reply("")
 
     def execute(self, handler: Callable, *args) -> None:
         """Execute message handler synchronously."""
@@ -178,9 +695,58 @@ class PeerToPeerBillingBaseServer(RequestReplyServer):
             logger.error(str(e))
             logger.debug(full_stack())
 
+    def handle_batch(
+        self,
+        message_type: BillingMessageType,
+        records: List,
+        check: Callable[[Any], None],
+        process: Callable[[List], None],
+    ) -> None:
+        """
+        Handle a batch of records as a unit, and reply the outcome per record.
+
+        Each record is checked on receipt, and rejected if its check raises.
+        The accepted records are then processed together, on the lane for
+        `message_type`. If that lane is full, all records are rejected.
+
+        :param message_type: type of the batch message.
+        :param records: records in the batch.
+        :param check: raises if a record is invalid.
+        :param process: processes the accepted records.
+        """
+        errors: List[Optional[str]] = []
+        for record in records:
+            try:
+                check(record)
+                errors.append(None)
+            except Exception as e:
+                errors.append(repr(e))
+
+        accepted = [record for record, error in zip(records, errors) if error is None]
+        if accepted:
+            try:
+                self.dispatch(message_type, process, accepted)
+            except LaneFullException as e:
+                logger.warning(f"lane {str(e)} is full, rejecting {message_type=}")
+                errors = [error or f"lane {str(e)} is full" for error in errors]
+
+        self.reply(BatchResultMessage(self.address, errors))
+
     def async_execute(self, handler: Callable, *args) -> None:
         """Execute message handler asynchronously."""
-        self.tp.apply_async(self.execute, args=(handler, *args))
+        self.dispatch(None, handler, *args)
+
+    def dispatch(
+        self, message_type: Optional[BillingMessageType], handler: Callable, *args
+    ) -> None:
+        """
+        Execute message handler asynchronously, on the lane for `message_type`.
+
+        Never blocks, such that a busy lane does not hold up the receive loop,
+        nor the other lanes.
+        :raises LaneFullException: if the lane for `message_type` is full.
+        """
+        self.lanes.submit(message_type, self.execute, handler, *args, block=False)
 
     @no_verification_required
     def _fallback_handler(self, msg: Message, origin: NodeInfo) -> None:
@@ -190,52 +756,284 @@ class PeerToPeerBillingBaseServer(RequestReplyServer):
 
     @no_verification_required
     def handle_connect(self, msg: ConnectMessage, origin: NodeInfo) -> None:
-        """Handle connect request."""
-        origin.pk = msg.pk
-        origin.role = msg.role
-
-        # Check network state difference
-        other_network_state = msg.network_state
-        other_address_set = set(other_network_state.keys())
-        known_address_set = set(self.network_members.keys())
-
-        # Register unknown addresses
-        unknown_addresses = other_address_set.difference(known_address_set)
-        for unknown_address in unknown_addresses:
-            # Locally register to unknown network member
-            new_node = other_network_state[unknown_address]
-            self.register_node(new_node)
-
-            # Connect with unknown peer
-            unknown_member = self.get_node_info(unknown_address)
-            self.send_connect(unknown_member)
+        """
+        Handle connect request.
+
+        The request holds the changes to the sender's view of the network since
+        the version of our view it has seen. Members new to us are registered,
+        and we introduce ourselves to them. If the views still differ, the
+        sender gets the changes it has not seen yet.
+        """
+        origin, learned = self.merge_connect(msg, origin)
+        self.follow_publisher(origin, msg.billing_state)
+        delta = msg.network_state
+        in_sync = self.merge_version(origin, msg.version, msg.digest)
+
+        # Introduce ourselves to new members, which likely know what the sender knows
+        for node in learned:
+            if node.address != origin.address:
+                self.send_connect(node, exclude=delta.keys())
+
+        # Send the sender the changes it is missing
+        if not in_sync and self.should_sync(origin, msg.digest):
+            self.send_connect(origin, since=msg.known_version, exclude=delta.keys())
+
+        # The peer knows us, hence we can switch to session authentication
+        knows_us = in_sync or self.address in delta
+        if self.session_authentication and knows_us:
+            self.open_session(origin)
+
+    def merge_connect(
+        self, msg: ConnectMessage, origin: NodeInfo
+    ) -> Tuple[NodeInfo, List[NodeInfo]]:
+        """
+        Register the sender of `msg`, and the members it announces that are unknown.
+        :returns: the info of the sender, and the newly registered members.
+        """
+        origin = replace(
+            origin, pk=msg.pk, role=msg.role, signing_keys=msg.signing_keys
+        )
+        if self.network_members.get(origin.address, origin) != origin:
+            self.register_node(origin)
+        return origin, self.register_unknown(msg.network_state)
+
+    def register_unknown(
+        self, network_state: Dict[TCPAddress, NodeInfo]
+    ) -> List[NodeInfo]:
+        """
+        Register the members in `network_state` that are unknown.
+        :returns: the newly registered members.
+        """
+        learned = [
+            node
+            for address, node in network_state.items()
+            if address not in self.network_members
+        ]
+        for node in learned:
+            self.register_node(node)
+        return learned
+
+    def merge_version(self, origin: NodeInfo, version: int, digest: bytes) -> bool:
+        """
+        Record having merged `version` of the view of `origin`, if our view
+        now equals it, that is, has the same `digest`.
+        :returns: whether the views are equal.
+        """
+        in_sync = self.network_members.digest == digest
+        if in_sync:
+            seen = self.peer_versions.get(origin.address, 0)
+            self.peer_versions[origin.address] = max(seen, version)
+        return in_sync
+
+    @no_verification_required
+    def handle_roster(self, msg: RosterMessage, origin: NodeInfo) -> None:
+        """
+        Handle a roster, published after an onboarding window.
+
+        The view of the network is bootstrapped from the roster, without
+        connecting to each of its members: they all receive the same roster.
+        """
+        self.register_unknown(msg.network_state)
+        self.merge_version(origin, msg.version, msg.digest)
+        self.follow_publisher(origin, msg.billing_state)
+
+    ### Publish channel
+
+    def publish(self, msg: Message) -> int:
+        """
+        Publish `msg` to all subscribed peers at once, signed once.
+        :returns: the sequence number of the message.
+        """
+        logger.info(f"publishing {type(msg)=}")
+        envelope = self.seal(msg)
+        return self.publisher.publish(msg.type.value.encode(), envelope.to_frames())
+
+    def get_billing_state(self) -> Dict[str, Any]:
+        """
+        Billing state to announce to peers. When publishing, it holds the last
+        sequence number published, from which subscribers can detect a gap.
+        """
+        billing_state = dict(self.billing_state)
+        if self.publish_port is not None:
+            sequence = self.publisher.sequence if self.publisher else 0
+            billing_state["publish_sequence"] = sequence
+        return billing_state
+
+    def follow_publisher(self, node: NodeInfo, billing_state: Dict) -> None:
+        """
+        Subscribe to the publish channel of `node`, if it announces one.
+
+        Messages published after the announced sequence number, but before the
+        subscription is connected, are requested as soon as the gap shows.
+        """
+        port = billing_state.get("publish_port")
+        if port is None or node.address in self.subscriptions:
+            return
+        if not isinstance(node.address, TCPAddress):
+            logger.warning(f"cannot follow publish port of {node.address}")
+            return
+        subscription = Subscriber(
+            self.context,
+            TCPAddress(node.address.interface, port),
+            self._handle_published,
+            partial(self.request_replay, node.address),
+            last_sequence=billing_state.get("publish_sequence"),
+        )
+        self.subscriptions[node.address] = subscription
+        subscription.start()
+
+    def _handle_published(
+        self, topic: bytes, sequence: int, frames: List[bytes]
+    ) -> None:
+        """Handle a message received on a subscription, like any other message."""
+        try:
+            self.accept_envelope(Envelope.from_frames(frames))
+        except Exception as e:
+            logger.error(f"published message {sequence=} is invalid: {str(e)}")
+
+    def request_replay(self, publisher: TCPAddress, first: int, last: int) -> None:
+        """Request the published messages `first` up to `last` we missed."""
+        logger.warning(f"missed published messages {first}-{last} of {publisher}")
+        self.send_async(ReplayMessage(self.address, first, last), publisher)
+
+    def handle_replay(self, msg: ReplayMessage, origin: NodeInfo) -> None:
+        """Send published messages missed by `origin` directly to it."""
+        if self.publisher is None:
+            return
+        missed = self.publisher.replay(msg.first, msg.last)
+        if len(missed) < msg.last - msg.first + 1:
+            logger.warning(
+                f"cannot replay all of messages {msg.first}-{msg.last}, "
+                f"as requested by {origin.address}"
+            )
+        for _, frames in missed:
+            envelope = Envelope.from_frames(frames)
+            envelope.recipient = get_recipient(origin.address)
+            self.send_frames_async(envelope.to_frames(), origin.address)
+
+    def should_sync(self, node: NodeInfo, digest: bytes) -> bool:
+        """
+        Whether to send changes to `node`, whose view has `digest`.
+
+        Changes are sent at most once per pair of views, such that peers with
+        conflicting views do not keep exchanging the same changes.
+        """
+        views = (self.network_members.digest, digest)
+        if self.sync_views.get(node.address) == views:
+            return False
+        self.sync_views[node.address] = views
+        return True
+
+    def open_session(self, node: NodeInfo) -> None:
+        """Authenticate future messages to `node` with a shared session key."""
+        if self.get_session_key(node):
+            self.session_peers.add(node.address)
+
+    def get_session_key(self, node: NodeInfo) -> Optional[bytes]:
+        """
+        Get the session key shared with `node`, deriving it if necessary.
+        :returns: the session key, or None when no session key can be derived.
+        """
+        if node.address in self.session_keys:
+            return self.session_keys[node.address]
+
+        peer_key = node.get_verification_key(ECDSA)
+        if not peer_key:
+            return None
+        try:
+            session_key = derive_session_key(self.signer, peer_key)
+        except NoSessionKeyException:
+            return None
+
+        self.session_keys[node.address] = session_key
+        return session_key
 
     def register_node(self, node: NodeInfo) -> None:
         """Locally register `node`."""
         self.network_members[node.address] = node
 
-    def send_connect(self, target: NodeInfo) -> None:
-        """Send ConnectMessage to `target`"""
-        msg = ConnectMessage(
-            self.address, self.pk, self.role, self.network_members, self.billing_state
-        )
+    def send_connect(
+        self, target: NodeInfo, since: int = 0, exclude: Collection[TCPAddress] = ()
+    ) -> None:
+        """
+        Send ConnectMessage to `target`.
+
+        :param target: node to connect to
+        :param since: version of our view `target` has seen, 0 for none
+        :param exclude: addresses of members `target` knows about
+        """
+        msg = self.get_connect_message(since, exclude, target.address)
         self.send(msg, target.address)
 
-    def verify_signature(self, msg: Message) -> Tuple[Message, bool]:
-        """Verify validity of a signed message."""
-        if not isinstance(msg, SignedMessage):
+    def get_connect_message(
+        self,
+        since: int = 0,
+        exclude: Collection[TCPAddress] = (),
+        target: Optional[TCPAddress] = None,
+    ) -> ConnectMessage:
+        """
+        ConnectMessage announcing this server and the changes to its view of
+        the network since version `since`, leaving out the members at `exclude`.
+        The message always holds this server itself.
+        """
+        delta = self.network_members.changes_since(since, exclude)
+        delta.members[self.address] = self._node_info
+        return ConnectMessage(
+            self.address,
+            self.pk,
+            self.role,
+            delta.members,
+            self.get_billing_state(),
+            self.signer.get_transferable_public_keys(),
+            delta.version,
+            self.peer_versions.get(target, 0),
+            delta.digest,
+        )
+
+    def verify_signature(
+        self, msg: Message | Envelope
+    ) -> Tuple[Optional[Message], bool]:
+        """
+        Verify validity of a signed message.
+
+        The signature is checked over the raw payload bytes, using the key of
+        the origin named in the envelope header. Only then is the payload decoded.
+        Messages authenticated with a session MAC count as validly signed.
+        When the handler of the message type named in the header requires
+        verification, a message without valid signature is dropped undecoded.
+
+        :returns: the decoded message, or None if dropped, and signature validity.
+        """
+        if not isinstance(msg, Envelope):
             return msg, False
 
-        # Extract message origin
-        decoded_msg: Message = self.encoder.decode(msg.message)
-        origin = self.get_node_info(decoded_msg.reply_address)
+        # Verify signature (or session MAC) under the key of the claimed origin
+        origin = self.get_node_info(msg.origin)
+        if msg.is_authenticated:
+            session_key = origin.pk and self.get_session_key(origin)
+            has_valid_signature = bool(
+                session_key
+                and verify_authentication(session_key, msg.payload, msg.mac)
+            )
+        else:
+            key = msg.is_signed and origin.get_verification_key(msg.signature.scheme)
+            has_valid_signature = bool(
+                key and key.verify_signature(msg.payload, msg.signature)
+            )
 
-        # Verify signature
-        has_valid_signature = origin.pk and origin.pk.verify_signature(
-            msg.message, msg.signature
-        )
+        message_type = self._parse_message_type(msg.message_type)
+        if not has_valid_signature and self.requires_verification(message_type):
+            logger.error(
+                f"message of {message_type=} from {msg.origin} has invalid "
+                "signature, dropping..."
+            )
+            return None, False
+
+        # Decode, and check the message was sent by the claimed origin
+        decoded_msg: Message = self.encoder.decode(msg.payload)
+        has_valid_signature &= decoded_msg.reply_address == msg.origin
         return (decoded_msg, has_valid_signature)
 
-    def get_node_info(self, address: TCPAddress) -> NodeInfo:
+    def get_node_info(self, address: Address) -> NodeInfo:
         """Best effort node info getter."""
-        return self.network_members.get(address, NodeInfo(address, None, None))
+        return self.network_members.get_node_info(address)
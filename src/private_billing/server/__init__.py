@@ -1,3 +1,35 @@
-from .request_reply import RequestReplyServer, TCPAddress, Message, MessageType
-from .signing import Signature, Signer, TransferablePublicKey
+from .address import (
+    Address,
+    HostedAddress,
+    InprocAddress,
+    IPCAddress,
+    TCPAddress,
+    get_endpoint,
+    parse_address,
+)
+from .connections import (
+    BUSY,
+    REJECTED,
+    ConnectionClosedException,
+    ConnectionManager,
+    RequestRejectedException,
+    RequestTimeoutException,
+    ServerBusyException,
+)
+from .lanes import Lane, LaneDispatcher, LaneFullException, LaneStats
+from .fanout import Delivery, DeliveryTimeoutException, fan_out
+from .pubsub import Publisher, Subscriber
+from .request_reply import RequestReplyServer, Message, MessageType
+from .aio import AsyncConnectionPool, AsyncRequestReplyServer
+from .signing import ECDSA, ED25519, Signature, Signer, TransferablePublicKey
 from .encoding import Encoder, PickleEncoder
+from .envelope import Envelope, MalformedEnvelopeException
+from .session import (
+    NoSessionKeyException,
+    authenticate,
+    decrypt,
+    derive_session_key,
+    encrypt,
+    generate_key,
+    verify_authentication,
+)
@@ -0,0 +1,122 @@
+from dataclasses import dataclass
+from typing import Union
+
+
+@dataclass
+class TCPAddress:
+    interface: str
+    port: int
+
+    def __str__(self) -> str:
+        return f"tcp://{self.interface}:{self.port}"
+
+    def __hash__(self) -> int:
+        return hash((self.interface, self.port))
+
+    @property
+    def bind_endpoint(self) -> str:
+        """Endpoint to bind to, to listen on this address."""
+        return str(TCPAddress("*", self.port))
+
+
+@dataclass
+class IPCAddress:
+    """
+    Address of a node on the same host, as a Unix domain socket.
+
+    :param path: file system path of the socket.
+    """
+
+    path: str
+
+    def __str__(self) -> str:
+        return f"ipc://{self.path}"
+
+    def __hash__(self) -> int:
+        return hash(("ipc", self.path))
+
+    @property
+    def bind_endpoint(self) -> str:
+        return str(self)
+
+
+@dataclass
+class InprocAddress:
+    """
+    Address of a node in the same process.
+    Both ends must create their sockets in the same `zmq.Context`.
+
+    :param name: name of the endpoint, unique within the context.
+    """
+
+    name: str
+
+    def __str__(self) -> str:
+        return f"inproc://{self.name}"
+
+    def __hash__(self) -> int:
+        return hash(("inproc", self.name))
+
+    @property
+    def bind_endpoint(self) -> str:
+        return str(self)
+
+
+@dataclass
+class HostedAddress:
+    """
+    Address of one of many servers hosted behind a single TCP socket.
+    Messages are sent to the host, and name the hosted server they are for.
+
+    :param host: address of the host.
+    :param name: name of the hosted server, unique within the host, of at
+    most 255 bytes.
+    """
+
+    host: TCPAddress
+    name: str
+
+    def __str__(self) -> str:
+        return f"{self.host}/{self.name}"
+
+    def __hash__(self) -> int:
+        return hash(("hosted", self.host, self.name))
+
+    @property
+    def bind_endpoint(self) -> str:
+        return self.host.bind_endpoint
+
+
+Address = Union[TCPAddress, IPCAddress, InprocAddress, HostedAddress]
+
+
+def get_endpoint(address: Address) -> Address:
+    """Address to connect to, to reach `address`."""
+    if isinstance(address, HostedAddress):
+        return address.host
+    return address
+
+
+def parse_address(endpoint: str) -> Address:
+    """
+    Parse a ZeroMQ endpoint, such as `tcp://localhost:5555`, into an address.
+    Endpoints of hosted servers, such as `tcp://localhost:5555/name`, are
+    parsed as well.
+    :raises ValueError: if the endpoint is not a tcp, ipc or inproc endpoint.
+    """
+    transport, _, location = endpoint.partition("://")
+    if not location:
+        raise ValueError(f"invalid endpoint {endpoint}")
+
+    match transport:
+        case "tcp":
+            location, _, name = location.partition("/")
+            interface, _, port = location.rpartition(":")
+            host = TCPAddress(interface, int(port))
+            return HostedAddress(host, name) if name else host
+        case "ipc":
+            return IPCAddress(location)
+        case "inproc":
+            return InprocAddress(location)
+        case _:
+            raise ValueError(f"unsupported transport {transport}")
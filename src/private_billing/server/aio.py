@@ -0,0 +1,360 @@
+import asyncio
+from abc import ABC
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import count
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import zmq
+import zmq.asyncio
+from .address import Address, TCPAddress, get_endpoint
+from .connections import (
+    BUSY,
+    CORRELATION_ID,
+    REJECTED,
+    ConnectionClosedException,
+    RequestRejectedException,
+    RequestTimeoutException,
+    ServerBusyException,
+)
+from .encoding import Encoder
+from .envelope import Envelope
+from .fanout import Delivery, DeliveryTimeoutException
+from .request_reply import Message, decode_frames
+from ..log import full_stack, logger
+
+
+@dataclass
+class AsyncConnection:
+    """
+    Persistent connection to a single peer, on an event loop.
+
+    :param sock: DEALER socket connected to the peer.
+    :param window: limits the number of in-flight requests.
+    :param in_flight: futures of sent requests, by correlation id.
+    :param last_active: time of the last send or receive on this connection.
+    """
+
+    sock: zmq.asyncio.Socket
+    window: asyncio.Semaphore
+    in_flight: Dict[bytes, asyncio.Future] = field(default_factory=dict)
+    last_active: float = field(default_factory=time.monotonic)
+    receiver: Optional[asyncio.Task] = None
+
+
+class AsyncConnectionPool:
+    """
+    Persistent, pipelined outbound connections on an event loop.
+
+    Counterpart of `ConnectionManager` for `AsyncRequestReplyServer`: it keeps one
+    DEALER socket per peer, with up to `window` requests in flight, and closes
+    connections that have been idle for `idle_timeout` seconds. A request that
+    is not replied to within `request_timeout` seconds fails, freeing its place
+    in the window. Like `ConnectionManager`, it resends requests the peer is
+    too busy for. As all sockets live on the event loop of the server, no I/O
+    thread is needed.
+
+    :param context: context in which to create sockets.
+    :param window: maximum number of in-flight requests per peer.
+    :param idle_timeout: seconds after which an idle connection is closed.
+    :param request_timeout: seconds to wait for the reply to a sent request.
+    :param busy_retries: number of times to retry a request the peer is too
+    busy for.
+    :param busy_backoff: seconds to wait before the first retry.
+    """
+
+    def __init__(
+        self,
+        context: zmq.asyncio.Context,
+        window: int = 16,
+        idle_timeout: float = 30.0,
+        request_timeout: float = 30.0,
+        busy_retries: int = 5,
+        busy_backoff: float = 0.1,
+    ) -> None:
+        self.context = context
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.busy_retries = busy_retries
+        self.busy_backoff = busy_backoff
+        self.connections: Dict[Address, AsyncConnection] = {}
+        self._correlation_ids = count()
+        self._evictor: Optional[asyncio.Task] = None
+
+    async def request(self, frames: List[bytes], target: Address) -> bytes:
+        """
+        Send `frames` to `target`, as a single multipart message.
+
+        A request the peer is too busy for is resent after an exponential backoff.
+        :raises RequestTimeoutException: when no reply arrives in time.
+        :raises ServerBusyException: when the peer stays too busy.
+        :raises RequestRejectedException: when the peer rejects the request.
+        :returns: the raw reply.
+        """
+        for busy_replies in count():
+            reply = await self._request_once(frames, target)
+            if reply == REJECTED:
+                raise RequestRejectedException(str(target))
+            if reply != BUSY:
+                return reply
+            if busy_replies >= self.busy_retries:
+                raise ServerBusyException(str(target))
+            await asyncio.sleep(self.busy_backoff * 2**busy_replies)
+
+    async def _request_once(self, frames: List[bytes], target: Address) -> bytes:
+        """Send `frames` to `target` once, and await the raw reply."""
+        connection = self._get_connection(get_endpoint(target))
+        async with connection.window:
+            correlation_id = CORRELATION_ID.pack(next(self._correlation_ids))
+            reply = asyncio.get_running_loop().create_future()
+            connection.in_flight[correlation_id] = reply
+            connection.last_active = time.monotonic()
+            try:
+                await connection.sock.send_multipart([correlation_id, b"", *frames])
+                return await asyncio.wait_for(reply, self.request_timeout)
+            except asyncio.TimeoutError:
+                raise RequestTimeoutException(str(target))
+            finally:
+                connection.in_flight.pop(correlation_id, None)
+                connection.last_active = time.monotonic()
+
+    async def close(self) -> None:
+        """Close all connections, failing requests that have not been replied to."""
+        if self._evictor is not None:
+            self._evictor.cancel()
+            self._evictor = None
+        for target in list(self.connections):
+            self._disconnect(target)
+
+    def _get_connection(self, target: Address) -> AsyncConnection:
+        if target in self.connections:
+            return self.connections[target]
+
+        sock = self.context.socket(zmq.DEALER)
+        sock.linger = 0
+        sock.connect(str(target))
+        connection = AsyncConnection(sock, asyncio.Semaphore(self.window))
+        connection.receiver = asyncio.create_task(self._receive(connection))
+        self.connections[target] = connection
+
+        if self._evictor is None:
+            self._evictor = asyncio.create_task(self._evict_idle())
+        return connection
+
+    def _disconnect(self, target: Address) -> None:
+        connection = self.connections.pop(target)
+        connection.receiver.cancel()
+        connection.sock.close()
+        for reply in connection.in_flight.values():
+            if not reply.done():
+                reply.set_exception(ConnectionClosedException(str(target)))
+
+    async def _receive(self, connection: AsyncConnection) -> None:
+        """Dispatch replies to the requests awaiting them."""
+        while True:
+            correlation_id, _, reply, *_ = await connection.sock.recv_multipart()
+            connection.last_active = time.monotonic()
+            pending = connection.in_flight.get(correlation_id)
+            if pending is not None and not pending.done():
+                pending.set_result(reply)
+
+    async def _evict_idle(self) -> None:
+        """Periodically close connections that have been idle for too long."""
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            now = time.monotonic()
+            for target, connection in list(self.connections.items()):
+                idle = not connection.in_flight and not connection.window.locked()
+                if idle and now - connection.last_active > self.idle_timeout:
+                    self._disconnect(target)
+
+
+@dataclass
+class AsyncRequestReplyServer(ABC):
+    """
+    Request-Reply Server on an asyncio event loop
+
+    Alternative runtime to `RequestReplyServer`. Requests are received on a
+    ROUTER socket, hence many requests can be handled at once, and each reply
+    is routed back by the identity of its requester. Clients can use plain REQ
+    sockets, or the pipelined connections of either runtime.
+
+    Rather than calling `reply`, handlers return their reply (None for an empty
+    reply). Coroutine handlers run on the event loop; regular handlers are
+    offloaded to `executor`. Outbound connections share the same event loop.
+
+    :param encoder: Encoder used to encode/decode messages to/from bytes.
+    :param window: maximum number of in-flight requests per peer.
+    :param idle_timeout: seconds after which an idle outbound connection is closed.
+    :param request_timeout: seconds to wait for the reply to a sent message.
+    :param busy_retries: number of times to resend a message the target is too
+    busy for.
+    :param busy_backoff: seconds to wait before resending such a message first.
+    :param broadcast_timeout: seconds to wait for each target's reply when
+    broadcasting, no limit if None.
+    :param broadcast_parallelism: maximum number of targets a broadcast awaits at once.
+    :param executor: executor to run regular handlers on, defaults to the
+    event loop's default executor.
+    :param context: context in which to create sockets, a new one if None.
+    Servers that talk over `InprocAddress`es must share a context.
+    """
+
+    encoder: Encoder
+    window: int = 16
+    idle_timeout: float = 30.0
+    request_timeout: float = 30.0
+    busy_retries: int = 5
+    busy_backoff: float = 0.1
+    broadcast_timeout: Optional[float] = None
+    broadcast_parallelism: int = 64
+    executor: Optional[Executor] = None
+    context: Optional[zmq.Context] = None
+
+    def __post_init__(self):
+        if self.context is None:
+            self.context = zmq.asyncio.Context()
+        else:
+            self.context = zmq.asyncio.Context(self.context)
+        self.connections = AsyncConnectionPool(
+            self.context,
+            self.window,
+            self.idle_timeout,
+            self.request_timeout,
+            self.busy_retries,
+            self.busy_backoff,
+        )
+        self.keep_running = True
+
+    def terminate(self) -> None:
+        """Set server terminate flag."""
+        self.keep_running = False
+
+    def start(self, port: int | Address = 5555, interval: int = 1000) -> None:
+        """
+        Run server, on a new event loop.
+        :param port: port on which to run, or address to listen on
+        :param interval: interval at which one checks for the shutdown signal
+        """
+        asyncio.run(self.serve(port, interval))
+
+    async def serve(self, port: int | Address = 5555, interval: int = 1000) -> None:
+        """
+        Run server on the running event loop.
+        :param port: port on which to run, or address to listen on
+        :param interval: interval at which one checks for the shutdown signal
+        """
+        # Setup
+        address = TCPAddress("*", port) if isinstance(port, int) else port
+        self.sock = self.context.socket(zmq.ROUTER)
+        self.sock.linger = 0
+        self.sock.bind(address.bind_endpoint)
+        requests: set[asyncio.Task] = set()
+
+        # Run server
+        while self.keep_running:
+            if not await self.sock.poll(interval):
+                continue
+            try:
+                route, frames = self._split_route(await self.sock.recv_multipart())
+            except ValueError:
+                continue  # not a request, as there is no routing envelope
+            request = asyncio.create_task(self._respond(route, frames))
+            requests.add(request)
+            request.add_done_callback(requests.discard)
+
+        # Finish requests in progress
+        await asyncio.gather(*requests)
+        await self.connections.close()
+        self.sock.close()
+
+    @staticmethod
+    def _split_route(frames: List[bytes]) -> Tuple[List[bytes], List[bytes]]:
+        """
+        Split received frames into the routing envelope and the message frames.
+
+        The routing envelope holds the requester's identity, any frames added
+        by the requester (such as a correlation id), and the empty delimiter.
+        """
+        delimiter = frames.index(b"")
+        return frames[: delimiter + 1], frames[delimiter + 1 :]
+
+    async def _respond(self, route: List[bytes], frames: List[bytes]) -> None:
+        """
+        Handle a request, and route the reply back to its requester.
+        A request that cannot be decoded or handled is rejected.
+        """
+        try:
+            reply = await self._handle_frames(frames)
+            enc = self.encoder.encode("" if reply is None else reply)
+        except Exception as e:
+            logger.error(f"cannot handle message, rejecting: {e!r}")
+            logger.debug(full_stack())
+            enc = REJECTED
+        await self.sock.send_multipart([*route, enc])
+
+    async def run_handler(self, handler: Callable, *args) -> Any:
+        """Run `handler`, on the event loop if it is a coroutine, else on the executor."""
+        if asyncio.iscoroutinefunction(handler):
+            return await handler(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(handler, *args))
+
+    async def send(self, msg: Message, target: Address) -> Any:
+        """Send `msg` to `target`."""
+        enc = self.encoder.encode(msg)
+        return await self.send_frames([enc], target)
+
+    async def send_frames(self, frames: List[bytes], target: Address) -> Any:
+        """Send already encoded `frames` to `target`, as a single multipart message."""
+        return await self.connections.request(frames, target)
+
+    async def broadcast(
+        self, msg: Message, targets: Iterable[Address]
+    ) -> Dict[Address, Delivery]:
+        """
+        Broadcast message
+
+        The message is encoded once, and sent to all targets concurrently.
+
+        :param msg: msg to broadcast
+        :param targets: addresses to broadcast to.
+        :return: delivery outcome per target.
+        """
+        frames = [self.encoder.encode(msg)]
+        limit = asyncio.Semaphore(self.broadcast_parallelism)
+
+        async def deliver(target: Address) -> Delivery:
+            async with limit:
+                started = time.monotonic()
+                delivery = Delivery(target)
+                try:
+                    delivery.reply = await asyncio.wait_for(
+                        self.send_frames(frames, target), self.broadcast_timeout
+                    )
+                except asyncio.TimeoutError:
+                    delivery.error = DeliveryTimeoutException(str(target))
+                except Exception as e:
+                    delivery.error = e
+                delivery.elapsed = time.monotonic() - started
+                return delivery
+
+        deliveries = await asyncio.gather(*map(deliver, targets))
+        return {delivery.target: delivery for delivery in deliveries}
+
+    def decode_frames(self, frames: List[bytes]) -> Message | Envelope:
+        """Decode the frames of a received message, see `decode_frames`."""
+        return decode_frames(self.encoder, frames)
+
+    async def _handle_frames(self, frames: List[bytes]) -> Optional[Message]:
+        """Handle the raw frames of an incoming message."""
+        return await self.run_handler(self._handle, self.decode_frames(frames))
+
+    def _handle(self, msg: Message) -> Optional[Message]:
+        """
+        Handle incoming `msg`. May be a coroutine.
+        :returns: reply to `msg`, if any.
+        """
+        raise NotImplementedError()
@@ -0,0 +1,370 @@
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass, field
+from itertools import count
+import math
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+import zmq
+from .address import Address, get_endpoint
+
+
+CORRELATION_ID = struct.Struct("<Q")
+
+# Raw reply to a request that is rejected, as it cannot be handled
+REJECTED = b"rejected"
+
+# Raw reply to a request that is rejected, as the server is too busy to handle it
+BUSY = b"busy"
+
+
+class ConnectionClosedException(Exception):
+    pass
+
+
+class RequestTimeoutException(Exception):
+    pass
+
+
+class RequestRejectedException(Exception):
+    pass
+
+
+class ServerBusyException(Exception):
+    pass
+
+
+@dataclass
+class Request:
+    """
+    Outbound request.
+
+    :param frames: frames of the request.
+    :param future: future resolving to the reply.
+    :param busy_replies: number of times the peer was too busy to handle it.
+    :param deadline: time by which the request must be replied to, once sent.
+    """
+
+    frames: List[bytes]
+    future: Future
+    busy_replies: int = 0
+    deadline: float = 0.0
+
+
+@dataclass
+class Connection:
+    """
+    Persistent connection to a single peer.
+
+    :param sock: DEALER socket connected to the peer.
+    :param pending: requests waiting for room in the in-flight window.
+    :param in_flight: sent requests, by correlation id.
+    :param backing_off: requests the peer was too busy for, and the time at
+    which to resend them.
+    :param last_active: time of the last send or receive on this connection.
+    """
+
+    sock: zmq.Socket
+    pending: Deque[Tuple[bytes, Request]] = field(default_factory=deque)
+    in_flight: Dict[bytes, Request] = field(default_factory=dict)
+    backing_off: List[Tuple[float, bytes, Request]] = field(default_factory=list)
+    last_active: float = field(default_factory=time.monotonic)
+
+    @property
+    def is_idle(self) -> bool:
+        return not self.pending and not self.in_flight and not self.backing_off
+
+
+class ConnectionManager:
+    """
+    Persistent, pipelined outbound connections.
+
+    Keeps one DEALER socket per peer address, instead of connecting and
+    disconnecting a REQ socket for every message. Servers hosted behind the
+    same socket share a connection. Up to `window` requests can be in flight
+    on a connection at once; requests beyond that are queued.
+
+    Each request is prefixed by a correlation id and an empty delimiter frame.
+    A REP socket echoes all frames up to the delimiter, so replies are matched
+    to their request without changes on the receiving end.
+
+    ZeroMQ sockets are not thread safe, hence all sockets are owned by a single
+    I/O thread. Other threads hand over requests through a queue, and receive
+    their replies through futures.
+
+    A request that is not replied to within `request_timeout` seconds of being
+    sent fails, and a request whose future is cancelled is given up on. Either
+    way, its place in the in-flight window is freed, such that lost replies do
+    not block the connection.
+
+    A peer replies `BUSY` to a request it is too busy to handle. Such a request
+    is sent again after an exponential backoff, starting at `busy_backoff`
+    seconds. After `busy_retries` retries, it fails with `ServerBusyException`.
+    A request the peer replies `REJECTED` to fails with `RequestRejectedException`.
+
+    :param context: context in which to create sockets.
+    :param window: maximum number of in-flight requests per peer.
+    :param idle_timeout: seconds after which an idle connection is closed.
+    :param request_timeout: seconds to wait for the reply to a sent request.
+    :param busy_retries: number of times to retry a request the peer is too
+    busy for.
+    :param busy_backoff: seconds to wait before the first retry.
+    :param interval: interval (ms) at which idle connections are evicted, and
+    overdue requests are failed.
+    """
+
+    def __init__(
+        self,
+        context: zmq.Context,
+        window: int = 16,
+        idle_timeout: float = 30.0,
+        request_timeout: float = 30.0,
+        busy_retries: int = 5,
+        busy_backoff: float = 0.1,
+        interval: int = 1000,
+    ) -> None:
+        self.context = context
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.busy_retries = busy_retries
+        self.busy_backoff = busy_backoff
+        self.interval = interval
+
+        self.connections: Dict[Address, Connection] = {}
+        self._requests: queue.SimpleQueue = queue.SimpleQueue()
+        self._correlation_ids = count()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._keep_running = False
+        self._wake_lock = threading.Lock()
+        self._wake_r: Optional[int] = None
+        self._wake_w: Optional[int] = None
+
+    def request(self, frames: List[bytes], target: Address) -> Future:
+        """
+        Send `frames` to `target`, as a single multipart message.
+        :returns: future resolving to the reply.
+        """
+        future = Future()
+        future.add_done_callback(self._on_done)
+        self._ensure_running()
+        self._requests.put((get_endpoint(target), frames, future))
+        self._wake()
+        return future
+
+    def close(self) -> None:
+        """
+        Close all connections, failing requests that have not been replied to.
+        The manager can still be used afterwards, which opens new connections.
+        """
+        with self._lock:
+            if self._thread is None:
+                return
+            self._keep_running = False
+            self._wake()
+            self._thread.join()
+            self._thread = None
+
+            # Close wake-up pipe
+            with self._wake_lock:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+                self._wake_r = self._wake_w = None
+
+    def _ensure_running(self) -> None:
+        """Start the I/O thread, if it is not running yet."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            with self._wake_lock:
+                self._wake_r, self._wake_w = os.pipe()
+                os.set_blocking(self._wake_r, False)
+            self._keep_running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _wake(self) -> None:
+        """Wake up the I/O thread, if it is running."""
+        with self._wake_lock:
+            if self._wake_w is not None:
+                os.write(self._wake_w, b"\0")
+
+    def _on_done(self, future: Future) -> None:
+        """Wake up the I/O thread to free the window slot of a cancelled request."""
+        if future.cancelled():
+            self._wake()
+
+    def _run(self) -> None:
+        """I/O loop: send queued requests, dispatch replies and evict idle connections."""
+        poller = zmq.Poller()
+        poller.register(self._wake_r, zmq.POLLIN)
+
+        while self._keep_running:
+            events = dict(poller.poll(self._poll_timeout()))
+
+            if self._wake_r in events:
+                self._drain_wake()
+            self._accept_requests(poller)
+
+            for target, connection in self.connections.items():
+                if connection.sock in events:
+                    self._receive(connection, target)
+                self._expire(connection, target)
+                self._flush(connection)
+
+            self._evict_idle(poller)
+
+        self._accept_requests(poller)
+        for target in list(self.connections):
+            self._disconnect(target, poller)
+
+    def _poll_timeout(self) -> int:
+        """Time (ms) to poll for, until the next interval or backed off request."""
+        resends = [
+            resend_at
+            for connection in self.connections.values()
+            for resend_at, *_ in connection.backing_off
+        ]
+        if not resends:
+            return self.interval
+        until_resend = math.ceil((min(resends) - time.monotonic()) * 1000)
+        return max(0, min(self.interval, until_resend))
+
+    def _drain_wake(self) -> None:
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _accept_requests(self, poller: zmq.Poller) -> None:
+        """Move requests from the queue to the connection of their target."""
+        while True:
+            try:
+                target, frames, future = self._requests.get_nowait()
+            except queue.Empty:
+                return
+
+            if target not in self.connections:
+                self._connect(target, poller)
+            correlation_id = CORRELATION_ID.pack(next(self._correlation_ids))
+            request = Request(frames, future)
+            self.connections[target].pending.append((correlation_id, request))
+
+    def _connect(self, target: Address, poller: zmq.Poller) -> None:
+        sock = self.context.socket(zmq.DEALER)
+        sock.linger = 0
+        sock.connect(str(target))
+        poller.register(sock, zmq.POLLIN)
+        self.connections[target] = Connection(sock)
+
+    def _disconnect(self, target: Address, poller: zmq.Poller) -> None:
+        connection = self.connections.pop(target)
+        poller.unregister(connection.sock)
+        connection.sock.close()
+
+        pending = [request for _, request in connection.pending]
+        in_flight = list(connection.in_flight.values())
+        backing_off = [request for *_, request in connection.backing_off]
+        for request in pending + in_flight + backing_off:
+            _resolve(request.future, exception=ConnectionClosedException(str(target)))
+
+    def _flush(self, connection: Connection) -> None:
+        """Send pending requests, as far as the in-flight window allows."""
+        # Backed off requests that are due go first
+        now = time.monotonic()
+        due = [entry for entry in connection.backing_off if entry[0] <= now]
+        if due:
+            connection.backing_off = [e for e in connection.backing_off if e[0] > now]
+            for _, correlation_id, request in reversed(due):
+                connection.pending.appendleft((correlation_id, request))
+
+        while connection.pending and len(connection.in_flight) < self.window:
+            correlation_id, request = connection.pending.popleft()
+            # Requests stay cancellable while in flight, to free their slot
+            if request.future.cancelled():
+                continue
+            connection.sock.send_multipart([correlation_id, b"", *request.frames])
+            now = time.monotonic()
+            request.deadline = now + self.request_timeout
+            connection.in_flight[correlation_id] = request
+            connection.last_active = now
+
+    def _expire(self, connection: Connection, target: Address) -> None:
+        """Give up on in-flight requests that are cancelled or overdue."""
+        now = time.monotonic()
+        for correlation_id, request in list(connection.in_flight.items()):
+            if request.future.cancelled():
+                del connection.in_flight[correlation_id]
+            elif now > request.deadline:
+                del connection.in_flight[correlation_id]
+                _resolve(request.future, exception=RequestTimeoutException(str(target)))
+
+    def _receive(self, connection: Connection, target: Address) -> None:
+        """Dispatch all available replies to their futures."""
+        while True:
+            try:
+                correlation_id, _, reply, *_ = connection.sock.recv_multipart(
+                    zmq.NOBLOCK
+                )
+            except zmq.error.Again:
+                return
+
+            connection.last_active = time.monotonic()
+            request = connection.in_flight.pop(correlation_id, None)
+            if request is None:
+                continue
+            if reply == BUSY:
+                self._back_off(connection, correlation_id, request, target)
+            elif reply == REJECTED:
+                exception = RequestRejectedException(str(target))
+                _resolve(request.future, exception=exception)
+            else:
+                _resolve(request.future, result=reply)
+
+    def _back_off(
+        self,
+        connection: Connection,
+        correlation_id: bytes,
+        request: Request,
+        target: Address,
+    ) -> None:
+        """Schedule a request the peer was too busy for to be sent again."""
+        if request.busy_replies >= self.busy_retries:
+            _resolve(request.future, exception=ServerBusyException(str(target)))
+            return
+
+        delay = self.busy_backoff * 2**request.busy_replies
+        request.busy_replies += 1
+        resend_at = time.monotonic() + delay
+        connection.backing_off.append((resend_at, correlation_id, request))
+
+    def _evict_idle(self, poller: zmq.Poller) -> None:
+        """Close connections that have been idle for longer than the idle timeout."""
+        now = time.monotonic()
+        idle = [
+            target
+            for target, connection in self.connections.items()
+            if connection.is_idle and now - connection.last_active > self.idle_timeout
+        ]
+        for target in idle:
+            self._disconnect(target, poller)
+
+
+def _resolve(
+    future: Future, result: Optional[bytes] = None, exception: Optional[Exception] = None
+) -> None:
+    """Resolve `future`, unless it has been cancelled in the meantime."""
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
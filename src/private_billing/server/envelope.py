@@ -0,0 +1,174 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from enum import IntFlag
+import struct
+from typing import List, Optional
+
+from .address import Address, TCPAddress, parse_address
+from .signing import Signature
+
+
+ENVELOPE_VERSION = 3
+
+
+class EnvelopeFlag(IntFlag):
+    NONE = 0
+    HAS_ORIGIN = 1
+    SIGNED = 2
+    AUTHENTICATED = 4
+    ENDPOINT_ORIGIN = 8
+
+
+class MalformedEnvelopeException(Exception):
+    pass
+
+
+@dataclass
+class Envelope:
+    """
+    Multipart wire format of a message.
+
+    An envelope travels as (up to) three frames:
+    1. a header frame, holding the format version, flags, message type,
+       recipient and origin; TCP origins as interface and port, other origins
+       as endpoint,
+    2. a payload frame, holding the encoded message,
+    3. an authentication frame, holding either a signature or a session MAC
+       over the raw payload bytes.
+
+    The payload is only encoded once, and the signature covers exactly those
+    bytes. A receiver can thus verify the signature before decoding the payload.
+    The header is tiny, and can be parsed to route a message without decoding it.
+
+    :param origin: address of the sending server, if any.
+    :param payload: encoded message.
+    :param signature: signature over `payload`, if signed.
+    :param message_type: value of the type of the enclosed message, if known.
+    :param mac: session MAC over `payload`, if authenticated with a session key.
+    :param recipient: name of the hosted server the message is for, if any.
+    """
+
+    origin: Optional[Address]
+    payload: bytes
+    signature: Optional[Signature] = None
+    message_type: Optional[str] = None
+    mac: Optional[bytes] = None
+    recipient: Optional[str] = None
+
+    HEADER = struct.Struct("<BBHBB")
+
+    @property
+    def is_signed(self) -> bool:
+        """Whether this envelope carries a signature."""
+        return self.signature is not None
+
+    @property
+    def is_authenticated(self) -> bool:
+        """Whether this envelope carries a session MAC."""
+        return self.mac is not None
+
+    @property
+    def flags(self) -> EnvelopeFlag:
+        flags = EnvelopeFlag.NONE
+        if self.origin is not None:
+            flags |= EnvelopeFlag.HAS_ORIGIN
+            if not isinstance(self.origin, TCPAddress):
+                flags |= EnvelopeFlag.ENDPOINT_ORIGIN
+        if self.is_signed:
+            flags |= EnvelopeFlag.SIGNED
+        if self.is_authenticated:
+            flags |= EnvelopeFlag.AUTHENTICATED
+        return flags
+
+    def to_frames(self) -> List[bytes]:
+        """Convert this envelope to a list of frames."""
+        frames = [self._pack_header(), self.payload]
+        if self.is_signed:
+            frames.append(self.signature.to_bytes())
+        elif self.is_authenticated:
+            frames.append(self.mac)
+        return frames
+
+    @classmethod
+    def from_frames(cls, frames: List[bytes]) -> Envelope:
+        """
+        Rebuild an envelope from a list of frames.
+
+        :param frames: frames as received from the socket.
+        :raises MalformedEnvelopeException: when the frames do not form an envelope.
+        :return: the envelope
+        """
+        if len(frames) not in (2, 3):
+            raise MalformedEnvelopeException(f"invalid frame count {len(frames)}")
+
+        header, payload, *auth = frames
+        flags, message_type, recipient, origin = cls._unpack_header(header)
+
+        is_signed = EnvelopeFlag.SIGNED in flags
+        is_authenticated = EnvelopeFlag.AUTHENTICATED in flags
+        if is_signed and is_authenticated:
+            raise MalformedEnvelopeException("both signed and authenticated")
+        if (is_signed or is_authenticated) != bool(auth):
+            raise MalformedEnvelopeException("authentication flag mismatch")
+
+        try:
+            signature = Signature.from_bytes(auth[0]) if is_signed else None
+        except (ValueError, IndexError) as e:
+            raise MalformedEnvelopeException(f"invalid signature: {e}")
+        mac = bytes(auth[0]) if is_authenticated else None
+        return cls(origin, payload, signature, message_type, mac, recipient)
+
+    @staticmethod
+    def is_envelope(frames: List[bytes]) -> bool:
+        """Whether `frames` hold an envelope, rather than a bare encoded message."""
+        return len(frames) > 1
+
+    def _pack_header(self) -> bytes:
+        """Pack the header frame."""
+        message_type = (self.message_type or "").encode()
+        recipient = (self.recipient or "").encode()
+        port, interface = 0, b""
+        if isinstance(self.origin, TCPAddress):
+            port, interface = self.origin.port, self.origin.interface.encode()
+        elif self.origin is not None:
+            interface = str(self.origin).encode()
+        header = self.HEADER.pack(
+            ENVELOPE_VERSION, self.flags, port, len(message_type), len(recipient)
+        )
+        return header + message_type + recipient + interface
+
+    @classmethod
+    def _unpack_header(
+        cls, header: bytes
+    ) -> tuple[EnvelopeFlag, Optional[str], Optional[str], Optional[Address]]:
+        """Unpack the header frame."""
+        if len(header) < cls.HEADER.size:
+            raise MalformedEnvelopeException("header too short")
+
+        version, flags, port, type_len, recipient_len = cls.HEADER.unpack_from(header)
+        if version != ENVELOPE_VERSION:
+            raise MalformedEnvelopeException(f"unsupported envelope {version=}")
+
+        type_end = cls.HEADER.size + type_len
+        recipient_end = type_end + recipient_len
+        try:
+            message_type = bytes(header[cls.HEADER.size : type_end]).decode() or None
+            recipient = bytes(header[type_end:recipient_end]).decode() or None
+        except UnicodeDecodeError as e:
+            raise MalformedEnvelopeException(f"invalid message type or recipient: {e}")
+
+        flags = EnvelopeFlag(flags)
+        if EnvelopeFlag.HAS_ORIGIN not in flags:
+            return flags, message_type, recipient, None
+
+        try:
+            interface = bytes(header[recipient_end:]).decode()
+        except UnicodeDecodeError as e:
+            raise MalformedEnvelopeException(f"invalid origin: {e}")
+        if EnvelopeFlag.ENDPOINT_ORIGIN in flags:
+            try:
+                origin = parse_address(interface)
+            except ValueError as e:
+                raise MalformedEnvelopeException(str(e))
+            return flags, message_type, recipient, origin
+        return flags, message_type, recipient, TCPAddress(interface, port)
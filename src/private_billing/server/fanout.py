@@ -0,0 +1,102 @@
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, wait
+from dataclasses import dataclass
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+
+class DeliveryTimeoutException(Exception):
+    pass
+
+
+@dataclass
+class Delivery:
+    """
+    Outcome of sending a message to a single target.
+
+    :param target: target the message was sent to.
+    :param reply: raw reply of the target, if any.
+    :param error: reason the message could not be delivered, if any.
+    :param elapsed: seconds between sending and the outcome.
+    """
+
+    target: Any
+    reply: Any = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """Whether the message was delivered and replied to."""
+        return self.error is None
+
+
+def fan_out(
+    send: Callable[[Any], Future],
+    targets: Iterable[Hashable],
+    timeout: Optional[float] = None,
+    max_parallel: Optional[int] = None,
+) -> Dict[Any, Delivery]:
+    """
+    Send to many targets concurrently.
+
+    :param send: starts sending to a target, returning a future for the reply.
+    :param targets: targets to send to.
+    :param timeout: seconds to wait for each target's reply, no limit if None.
+    :param max_parallel: maximum number of targets awaiting a reply at once,
+    no limit if None.
+    :return: delivery outcome per target. A failing or slow target does not
+    hold up delivery to the others.
+    """
+    deliveries: Dict[Any, Delivery] = {}
+    waiting: Dict[Future, tuple[Any, float]] = {}
+    targets = iter(targets)
+    end = object()
+
+    def finish(future: Future, error: Optional[BaseException] = None) -> None:
+        target, started = waiting.pop(future)
+        delivery = Delivery(target, elapsed=time.monotonic() - started)
+        if error is not None:
+            delivery.error = error
+        elif future.cancelled():
+            delivery.error = CancelledError(str(target))
+        elif future.exception() is not None:
+            delivery.error = future.exception()
+        else:
+            delivery.reply = future.result()
+        deliveries[target] = delivery
+
+    exhausted = False
+    while not exhausted or waiting:
+        # Start sending to as many targets as allowed
+        while not exhausted and (max_parallel is None or len(waiting) < max_parallel):
+            target = next(targets, end)
+            if target is end:
+                exhausted = True
+                break
+            started = time.monotonic()
+            try:
+                waiting[send(target)] = (target, started)
+            except Exception as e:
+                deliveries[target] = Delivery(target, error=e)
+
+        if not waiting:
+            continue
+
+        # Wait until a reply arrives, or the first deadline passes
+        wait_time = None
+        if timeout is not None:
+            first_deadline = min(started for _, started in waiting.values()) + timeout
+            wait_time = max(first_deadline - time.monotonic(), 0)
+        done, _ = wait(waiting, wait_time, return_when=FIRST_COMPLETED)
+        for future in done:
+            finish(future)
+
+        # Give up on targets whose deadline has passed
+        if timeout is not None:
+            now = time.monotonic()
+            for future, (target, started) in list(waiting.items()):
+                if now - started >= timeout:
+                    future.cancel()
+                    finish(future, DeliveryTimeoutException(str(target)))
+
+    return deliveries
@@ -0,0 +1,170 @@
+from dataclasses import dataclass
+import queue
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+from ..log import full_stack, logger
+
+
+class LaneFullException(Exception):
+    pass
+
+
+@dataclass
+class LaneStats:
+    """
+    Snapshot of the load on a lane.
+
+    :param name: name of the lane.
+    :param depth: number of tasks waiting to start.
+    :param submitted: number of tasks submitted so far.
+    :param completed: number of tasks finished so far.
+    :param mean_wait: mean seconds a task waited before starting.
+    :param max_wait: most seconds a task waited before starting.
+    :param rejected: number of tasks rejected, as the lane was full.
+    """
+
+    name: str
+    depth: int
+    submitted: int
+    completed: int
+    mean_wait: float
+    max_wait: float
+    rejected: int = 0
+
+
+class Lane:
+    """
+    Executor lane: worker threads taking tasks from a bounded queue.
+
+    With a single worker, tasks run in order of submission.
+    Submitting to a full lane blocks, pushing back on the submitter, or is
+    rejected if the submitter cannot wait. A failing task is logged, and does
+    not stop its worker.
+
+    :param name: name of the lane.
+    :param workers: number of worker threads.
+    :param max_queue: maximum number of waiting tasks, unbounded if 0.
+    """
+
+    def __init__(self, name: str, workers: int = 1, max_queue: int = 0) -> None:
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._started = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._threads: List[threading.Thread] = []
+
+    def submit(self, func: Callable, *args, block: bool = True) -> None:
+        """
+        Queue `func(*args)` for execution on this lane.
+        :param block: whether to wait for room in a full lane.
+        :raises LaneFullException: if the lane is full, and not `block`.
+        """
+        self._ensure_running()
+        with self._lock:
+            self._submitted += 1
+        try:
+            self._queue.put((time.monotonic(), func, args), block)
+        except queue.Full:
+            with self._lock:
+                self._submitted -= 1
+                self._rejected += 1
+            raise LaneFullException(self.name)
+
+    def stats(self) -> LaneStats:
+        with self._lock:
+            mean_wait = self._total_wait / self._started if self._started else 0.0
+            return LaneStats(
+                self.name,
+                self._queue.qsize(),
+                self._submitted,
+                self._completed,
+                mean_wait,
+                self._max_wait,
+                self._rejected,
+            )
+
+    def close(self) -> None:
+        """Stop the workers, once all queued tasks have run."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _ensure_running(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work, name=f"{self.name}-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self) -> None:
+        while (task := self._queue.get()) is not None:
+            submitted_at, func, args = task
+            wait = time.monotonic() - submitted_at
+            with self._lock:
+                self._started += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"task on lane {self.name} failed: {str(e)}")
+                logger.debug(full_stack())
+            finally:
+                with self._lock:
+                    self._completed += 1
+
+
+class LaneDispatcher:
+    """
+    Routes tasks to lanes by key, such as the type of the message they handle.
+
+    Slow tasks on one lane do not hold up tasks on other lanes.
+
+    :param lanes: available lanes.
+    :param routes: name of the lane to use, per key.
+    :param default: name of the lane to use for keys without a route.
+    """
+
+    def __init__(
+        self, lanes: List[Lane], routes: Dict[Hashable, str], default: str
+    ) -> None:
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in lanes}
+        self.routes = routes
+        self.default = default
+
+    def lane_for(self, key: Optional[Hashable]) -> Lane:
+        """Lane that tasks for `key` run on."""
+        return self.lanes[self.routes.get(key, self.default)]
+
+    def submit(
+        self, key: Optional[Hashable], func: Callable, *args, block: bool = True
+    ) -> None:
+        """
+        Queue `func(*args)` for execution on the lane for `key`.
+        :param block: whether to wait for room in a full lane.
+        :raises LaneFullException: if the lane is full, and not `block`.
+        """
+        self.lane_for(key).submit(func, *args, block=block)
+
+    def stats(self) -> Dict[str, LaneStats]:
+        """Load per lane."""
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def close(self) -> None:
+        for lane in self.lanes.values():
+            lane.close()
@@ -0,0 +1,150 @@
+from collections import deque
+import struct
+import threading
+from typing import Callable, Deque, List, Optional, Tuple
+
+import zmq
+from .address import Address, TCPAddress
+
+
+SEQUENCE = struct.Struct("<Q")
+
+
+class Publisher:
+    """
+    Publishes messages to all subscribers at once, on a PUB socket.
+
+    Each message is sent as a topic frame, a sequence number frame and the
+    message frames. Sequence numbers increase by one per message, such that
+    subscribers can detect messages they missed. The last `history` messages
+    are kept, to replay them to subscribers that missed them.
+
+    :param context: context in which to create the socket.
+    :param port: port on which to publish, or address to publish on.
+    :param history: number of published messages to keep for replay.
+    :param host: interface on which to publish on `port`, all interfaces by default.
+    """
+
+    def __init__(
+        self,
+        context: zmq.Context,
+        port: int | Address,
+        history: int = 1024,
+        host: str = "*",
+    ) -> None:
+        if isinstance(port, int):
+            endpoint = str(TCPAddress(host, port))
+        else:
+            endpoint = port.bind_endpoint
+        self.sock = context.socket(zmq.PUB)
+        self.sock.linger = 0
+        self.sock.bind(endpoint)
+        self.sequence = 0
+        self.history: Deque[Tuple[int, List[bytes]]] = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def publish(self, topic: bytes, frames: List[bytes]) -> int:
+        """
+        Publish `frames` under `topic`.
+        :returns: the sequence number of the message.
+        """
+        with self._lock:
+            self.sequence += 1
+            self.history.append((self.sequence, frames))
+            self.sock.send_multipart([topic, SEQUENCE.pack(self.sequence), *frames])
+            return self.sequence
+
+    def replay(self, first: int, last: int) -> List[Tuple[int, List[bytes]]]:
+        """
+        Messages with sequence numbers from `first` up to and including `last`,
+        as far as they are still kept.
+        """
+        with self._lock:
+            return [(seq, msg) for seq, msg in self.history if first <= seq <= last]
+
+    def close(self) -> None:
+        with self._lock:
+            self.sock.close()
+
+
+class Subscriber:
+    """
+    Receives the messages of a `Publisher`, on a thread of its own.
+
+    Messages are passed to `on_message` in order of publication. When the
+    sequence numbers skip, `on_gap` is called with the first and last sequence
+    number missed, before the message after the gap is passed on.
+
+    A subscription only receives messages once it is connected. Pass the
+    sequence number the publisher announced before subscribing as
+    `last_sequence`, such that messages published in the meantime are reported
+    as a gap too.
+
+    :param context: context in which to create the socket.
+    :param address: address of the publisher.
+    :param on_message: called with the topic, sequence number and frames of
+    each message.
+    :param on_gap: called with the first and last missed sequence number.
+    :param topics: topics to subscribe to, all if empty.
+    :param interval: interval (ms) at which one checks for the shutdown signal.
+    :param last_sequence: sequence number of the last message published before
+    subscribing, if known.
+    """
+
+    def __init__(
+        self,
+        context: zmq.Context,
+        address: Address,
+        on_message: Callable[[bytes, int, List[bytes]], None],
+        on_gap: Callable[[int, int], None],
+        topics: Tuple[bytes, ...] = (),
+        interval: int = 1000,
+        last_sequence: Optional[int] = None,
+    ) -> None:
+        self.address = address
+        self.on_message = on_message
+        self.on_gap = on_gap
+        self.interval = interval
+        self.last_sequence = last_sequence
+
+        self.sock = context.socket(zmq.SUB)
+        self.sock.linger = 0
+        for topic in topics or (b"",):
+            self.sock.setsockopt(zmq.SUBSCRIBE, topic)
+        self.sock.connect(str(address))
+
+        self._keep_running = True
+        self._thread = threading.Thread(
+            target=self._run, name=f"subscriber-{address}", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop receiving, and close the socket."""
+        self._keep_running = False
+        if self._thread.is_alive():
+            self._thread.join()
+        self.sock.close()
+
+    def receive(self, topic: bytes, sequence: int, frames: List[bytes]) -> None:
+        """Pass on a received message, after reporting any gap before it."""
+        last = self.last_sequence
+        if last is not None and sequence > last + 1:
+            self.on_gap(last + 1, sequence - 1)
+
+        # A lower sequence number means the publisher restarted
+        self.last_sequence = sequence
+        self.on_message(topic, sequence, frames)
+
+    def _run(self) -> None:
+        while self._keep_running:
+            if not self.sock.poll(self.interval):
+                continue
+            try:
+                topic, sequence, *frames = self.sock.recv_multipart()
+                (sequence,) = SEQUENCE.unpack(sequence)
+            except (ValueError, struct.error):
+                continue  # not a published message
+            self.receive(topic, sequence, frames)
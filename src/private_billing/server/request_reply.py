@@ -1,90 +1,172 @@
 from abc import ABC
+from concurrent.futures import Future
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Iterable, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 import zmq
+from .address import Address, TCPAddress
+from .connections import BUSY, REJECTED, ConnectionManager
 from .encoding import Encoder
+from .envelope import Envelope
+from .fanout import Delivery, fan_out
+from ..log import full_stack, logger
 
 
 class MessageType(Enum):
     pass
 
 
-@dataclass
-class TCPAddress:
-    interface: str
-    port: int
-
-    def __str__(self) -> str:
-        return f"tcp://{self.interface}:{self.port}"
-
-    def __hash__(self) -> int:
-        return hash((self.interface, self.port))
-
-
 @dataclass
 class Message:
-    reply_address: TCPAddress
+    reply_address: Address
 
     @property
     def type(self) -> MessageType:
         raise NotImplementedError()
 
 
+def decode_frames(encoder: Encoder, frames: List[bytes]) -> Message | Envelope:
+    """
+    Decode the frames of a received message.
+
+    Bare encoded messages and unsigned envelopes are decoded directly.
+    Signed and authenticated envelopes are returned as is, such that the
+    signature or MAC can be verified before the payload is decoded.
+    """
+    if not Envelope.is_envelope(frames):
+        return encoder.decode(frames[0])
+
+    envelope = Envelope.from_frames(frames)
+    if envelope.is_signed or envelope.is_authenticated:
+        return envelope
+    return encoder.decode(envelope.payload)
+
+
 @dataclass
 class RequestReplyServer(ABC):
     """
     Request-Reply Server
 
     :param encoder: Encoder used to encode/decode messages to/from bytes.
+    :param window: maximum number of in-flight requests per peer.
+    :param idle_timeout: seconds after which an idle outbound connection is closed.
+    :param request_timeout: seconds to wait for the reply to a sent message.
+    :param busy_retries: number of times to resend a message the target is too
+    busy for.
+    :param busy_backoff: seconds to wait before resending such a message first.
+    :param broadcast_timeout: seconds to wait for each target's reply when
+    broadcasting, no limit if None.
+    :param broadcast_parallelism: maximum number of targets a broadcast awaits at once.
+    :param context: context in which to create sockets, a new one if None.
+    Servers that talk over `InprocAddress`es must share a context.
+    :param sock: socket to receive requests on, a new REP socket if None.
+    :param connections: outbound connections to send over, new ones if None.
+    Servers hosted behind the socket of another server share its socket
+    and connections.
     """
 
     encoder: Encoder
+    window: int = 16
+    idle_timeout: float = 30.0
+    request_timeout: float = 30.0
+    busy_retries: int = 5
+    busy_backoff: float = 0.1
+    broadcast_timeout: Optional[float] = None
+    broadcast_parallelism: int = 64
+    context: Optional[zmq.Context] = None
+    sock: Optional[zmq.Socket] = None
+    connections: Optional[ConnectionManager] = None
 
     def __post_init__(self):
-        self.context = zmq.Context()
-        self.sock = self.context.socket(zmq.REP)
-        self.send_sock = self.context.socket(zmq.REQ)
+        if self.context is None:
+            self.context = zmq.Context()
+        if self.sock is None:
+            self.sock = self.context.socket(zmq.REP)
+        if self.connections is None:
+            self.connections = ConnectionManager(
+                self.context,
+                self.window,
+                self.idle_timeout,
+                self.request_timeout,
+                self.busy_retries,
+                self.busy_backoff,
+            )
         self.keep_running = True
 
     def terminate(self) -> None:
-        """Set server terminate flag."""
+        """Set server terminate flag, and close outbound connections."""
         self.keep_running = False
+        self.connections.close()
 
-    def start(self, port: int = 5555, interval: int = 1000) -> None:
+    def start(self, port: int | Address = 5555, interval: int = 1000) -> None:
         """
         Run server.
-        :param port: port on which to run
+        :param port: port on which to run, or address to listen on
         :param interval: interval at which one checks for the shutdown signal
         """
         # Setup
+        address = TCPAddress("*", port) if isinstance(port, int) else port
         self.sock.RCVTIMEO = interval
-        self.sock.bind(str(TCPAddress("*", port)))
+        self.sock.bind(address.bind_endpoint)
 
-        # Run server
+        # Run server. A message that cannot be decoded or handled is rejected,
+        # and does not stop the server.
         self.keep_running = True
         while self.keep_running:
-            msg = self.recv()
-            if msg:
-                self._handle(msg)
-
-    def send(self, msg: Message, target: TCPAddress) -> Any:
+            try:
+                frames = self.recv_frames()
+                if frames:
+                    self._handle_frames(frames)
+            except Exception as e:
+                logger.error(f"cannot handle message, rejecting: {e!r}")
+                logger.debug(full_stack())
+                self.reject()
+
+    def send(self, msg: Message, target: Address) -> Any:
         """Send `msg` to `target`."""
-        with self.send_sock.connect(str(target)):
-            enc = self.encoder.encode(msg)
-            self.send_sock.send(enc)
-            return self.send_sock.recv()
+        return self.send_async(msg, target).result()
+
+    def send_async(self, msg: Message, target: Address) -> Future:
+        """
+        Send `msg` to `target`, without waiting for the reply.
+        :returns: future resolving to the raw reply.
+        """
+        enc = self.encoder.encode(msg)
+        return self.send_frames_async([enc], target)
 
-    def broadcast(self, msg: Message, targets: Iterable[TCPAddress]) -> None:
+    def send_frames(self, frames: List[bytes], target: Address) -> Any:
+        """Send already encoded `frames` to `target`, as a single multipart message."""
+        return self.send_frames_async(frames, target).result()
+
+    def send_frames_async(self, frames: List[bytes], target: Address) -> Future:
+        """
+        Send already encoded `frames` to `target`, without waiting for the reply.
+
+        Messages are sent over a persistent connection to `target`, on which
+        multiple messages can be in flight at once.
+        :returns: future resolving to the raw reply.
+        """
+        return self.connections.request(frames, target)
+
+    def broadcast(
+        self, msg: Message, targets: Iterable[Address]
+    ) -> Dict[Address, Delivery]:
         """
         Broadcast message
 
+        The message is sent to all targets concurrently, see `fan_out`.
+
         :param msg: msg to broadcast
         :param targets: addresses to broadcast to.
+        :return: delivery outcome per target.
         """
-        for target in targets:
-            self.send(msg, target)
+        return fan_out(
+            lambda target: self.send_async(msg, target),
+            targets,
+            self.broadcast_timeout,
+            self.broadcast_parallelism,
+        )
 
     def reply(self, msg: Message) -> Any:
         """
@@ -94,17 +176,51 @@ class RequestReplyServer(ABC):
         enc = self.encoder.encode(msg)
         return self.sock.send(enc)
 
-    def recv(self) -> Optional[Message]:
+    def reply_busy(self) -> Any:
+        """Reply that the current request is rejected, as we are too busy."""
+        return self.sock.send(BUSY)
+
+    def reject(self) -> None:
+        """Reply that the current request is rejected, unless it was replied to."""
+        try:
+            self.sock.send(REJECTED)
+        except zmq.ZMQError:
+            pass  # already replied to
+
+    def recv(self) -> Optional[Message | Envelope]:
         """
         Attempt to receive a message.
         :returns: message, or None if no message was received before timeout.
         """
+        frames = self.recv_frames()
+        if frames is None:
+            return None
+        return self.decode_frames(frames)
+
+    def recv_frames(self) -> Optional[List[bytes]]:
+        """
+        Attempt to receive the raw frames of a message.
+        :returns: frames, or None if no message was received before timeout.
+        """
         try:
-            enc: bytes = self.sock.recv()
-            return self.encoder.decode(enc)
+            return self.sock.recv_multipart()
         except zmq.error.Again:
             return None
 
+    def decode_frames(self, frames: List[bytes]) -> Message | Envelope:
+        """Decode the frames of a received message, see `decode_frames`."""
+        return decode_frames(self.encoder, frames)
+
+    def _handle_frames(self, frames: List[bytes]) -> None:
+        """Handle the raw frames of an incoming message. Malformed ones are rejected."""
+        try:
+            msg = self.decode_frames(frames)
+        except Exception as e:
+            logger.warning(f"rejecting malformed message: {e!r}")
+            self.reject()
+            return
+        self._handle(msg)
+
     def _handle(self, msg: Message) -> None:
         """Handle incoming `msg`"""
         raise NotImplementedError()
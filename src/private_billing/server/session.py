@@ -0,0 +1,86 @@
+import hmac
+import hashlib
+import os
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .signing import ECDSA, Signer, TransferablePublicKey
+
+
+SESSION_KEY_SIZE = 32
+SESSION_KEY_INFO = b"private-billing session key"
+NONCE_SIZE = 12
+
+
+class NoSessionKeyException(Exception):
+    pass
+
+
+def derive_session_key(signer: Signer, peer_key: TransferablePublicKey) -> bytes:
+    """
+    Derive a symmetric session key with a peer, via ECDH over the signers' EC keys.
+
+    Both parties derive the same key: the HKDF info binds the key to the
+    (sorted) pair of public keys.
+
+    :param signer: own signer, holding an ECDSA key
+    :param peer_key: the peer's ECDSA public key
+    :raises NoSessionKeyException: when either party has no usable EC key
+    :return: session key
+    """
+    if ECDSA not in signer.private_keys:
+        raise NoSessionKeyException("own signer has no EC key")
+    peer_public_key = peer_key.public_key
+    if not isinstance(peer_public_key, ec.EllipticCurvePublicKey):
+        raise NoSessionKeyException("peer key is not an EC key")
+
+    private_key = signer.private_keys[ECDSA]
+    shared_secret = private_key.exchange(ec.ECDH(), peer_public_key)
+
+    own_key = signer.get_transferable_public_key(scheme=ECDSA)
+    key_pair = b"".join(sorted((own_key.public_key_bytes, peer_key.public_key_bytes)))
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=SESSION_KEY_SIZE,
+        salt=None,
+        info=SESSION_KEY_INFO + key_pair,
+    )
+    return hkdf.derive(shared_secret)
+
+
+def authenticate(session_key: bytes, payload: bytes) -> bytes:
+    """Compute the HMAC-SHA256 of `payload` under `session_key`."""
+    return hmac.new(session_key, payload, hashlib.sha256).digest()
+
+
+def verify_authentication(session_key: bytes, payload: bytes, mac: bytes) -> bool:
+    """Verify the HMAC-SHA256 `mac` of `payload` under `session_key`."""
+    return hmac.compare_digest(authenticate(session_key, payload), mac)
+
+
+def generate_key() -> bytes:
+    """Generate a random symmetric key, to encrypt payloads with."""
+    return AESGCM.generate_key(bit_length=8 * SESSION_KEY_SIZE)
+
+
+def encrypt(key: bytes, payload: bytes, associated_data: bytes = b"") -> bytes:
+    """
+    Encrypt and authenticate `payload` under `key`, with AES-GCM.
+    :param associated_data: data that is authenticated, but not encrypted.
+    :return: random nonce, followed by the ciphertext.
+    """
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + AESGCM(key).encrypt(nonce, payload, associated_data)
+
+
+def decrypt(key: bytes, ciphertext: bytes, associated_data: bytes = b"") -> bytes:
+    """
+    Decrypt `ciphertext`, as produced by `encrypt`.
+    :raises InvalidTag: when the ciphertext or associated data was tampered
+    with, or encrypted under another key.
+    """
+    nonce, ciphertext = ciphertext[:NONCE_SIZE], ciphertext[NONCE_SIZE:]
+    return AESGCM(key).decrypt(nonce, ciphertext, associated_data)
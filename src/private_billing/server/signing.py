@@ -1,15 +1,120 @@
+from __future__ import annotations
+from abc import ABC
 from dataclasses import dataclass
+from functools import lru_cache
 import pickle
-from typing import Any
+from typing import Any, Dict, Sequence, Tuple
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
-from cryptography.hazmat.primitives.asymmetric import ec, utils
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, utils
+
+
+HASH_ALGORITHMS = {
+    alg.name: alg for alg in (hashes.SHA256, hashes.SHA384, hashes.SHA512)
+}
+
+ECDSA = "ecdsa"
+ED25519 = "ed25519"
 
 
 @dataclass
 class Signature:
     signature: bytes
     hash_alg: hashes.HashAlgorithm
+    scheme: str = ECDSA
+
+    def to_bytes(self) -> bytes:
+        """
+        Convert signature to bytes: scheme name and hash algorithm name, each
+        length-prefixed, followed by the signature.
+        """
+        scheme = self.scheme.encode()
+        name = self.hash_alg.name.encode()
+        return bytes([len(scheme)]) + scheme + bytes([len(name)]) + name + self.signature
+
+    @classmethod
+    def from_bytes(cls, encoding: bytes) -> Signature:
+        """
+        Rebuild signature from bytes.
+        :raises ValueError: if the scheme or hash algorithm is unknown.
+        """
+        scheme_len = encoding[0]
+        scheme = bytes(encoding[1 : 1 + scheme_len]).decode()
+        offset = 1 + scheme_len
+        name_len = encoding[offset]
+        name = bytes(encoding[offset + 1 : offset + 1 + name_len]).decode()
+        if scheme not in SIGNATURE_SCHEMES:
+            raise ValueError(f"unknown signature scheme {scheme}")
+        if name not in HASH_ALGORITHMS:
+            raise ValueError(f"unknown hash algorithm {name}")
+        hash_alg = HASH_ALGORITHMS[name]()
+        return cls(bytes(encoding[offset + 1 + name_len :]), hash_alg, scheme)
+
+
+class SignatureScheme(ABC):
+    """Algorithm used to sign and verify messages."""
+
+    name: str
+
+    def generate_private_key(self):
+        raise NotImplementedError()
+
+    def sign(self, private_key, obj: bytes, hash_alg: hashes.HashAlgorithm) -> bytes:
+        raise NotImplementedError()
+
+    def verify(
+        self, public_key, signature: bytes, obj: bytes, hash_alg: hashes.HashAlgorithm
+    ) -> None:
+        """:raises: InvalidSignature when signature is invalid."""
+        raise NotImplementedError()
+
+
+class EcdsaScheme(SignatureScheme):
+    """ECDSA over a prehashed object."""
+
+    name = ECDSA
+
+    def __init__(self, curve=ec.SECP256K1()) -> None:
+        self.curve = curve
+
+    def generate_private_key(self) -> ec.EllipticCurvePrivateKey:
+        return ec.generate_private_key(self.curve)
+
+    def sign(self, private_key, obj: bytes, hash_alg: hashes.HashAlgorithm) -> bytes:
+        digest = _hash_obj(obj, hash_alg)
+        return private_key.sign(digest, ec.ECDSA(utils.Prehashed(hash_alg)))
+
+    def verify(
+        self, public_key, signature: bytes, obj: bytes, hash_alg: hashes.HashAlgorithm
+    ) -> None:
+        digest = _hash_obj(obj, hash_alg)
+        public_key.verify(signature, digest, ec.ECDSA(utils.Prehashed(hash_alg)))
+
+
+class Ed25519Scheme(SignatureScheme):
+    """
+    Ed25519, considerably faster to sign and verify than ECDSA.
+    Ed25519 hashes internally, so `hash_alg` is not used.
+    """
+
+    name = ED25519
+
+    def generate_private_key(self) -> ed25519.Ed25519PrivateKey:
+        return ed25519.Ed25519PrivateKey.generate()
+
+    def sign(self, private_key, obj: bytes, hash_alg: hashes.HashAlgorithm) -> bytes:
+        return private_key.sign(obj)
+
+    def verify(
+        self, public_key, signature: bytes, obj: bytes, hash_alg: hashes.HashAlgorithm
+    ) -> None:
+        public_key.verify(signature, obj)
+
+
+SIGNATURE_SCHEMES: Dict[str, SignatureScheme] = {
+    ECDSA: EcdsaScheme(),
+    ED25519: Ed25519Scheme(),
+}
 
 
 @dataclass
@@ -20,25 +125,42 @@ class TransferablePublicKey:
 
     def __init__(
         self,
-        public_key: ec.EllipticCurvePublicKey,
+        public_key: ec.EllipticCurvePublicKey | ed25519.Ed25519PublicKey,
         encoding: Encoding = Encoding.PEM,
         format: PublicFormat = PublicFormat.SubjectPublicKeyInfo,
     ):
         self.public_key_bytes = public_key.public_bytes(encoding, format)
         self.encoding = encoding
         self.format = format
+        self._public_key = public_key
+
+    @classmethod
+    def from_bytes(
+        cls,
+        public_key_bytes: bytes,
+        encoding: Encoding = Encoding.PEM,
+        format: PublicFormat = PublicFormat.SubjectPublicKeyInfo,
+    ) -> TransferablePublicKey:
+        """Rebuild a transferable key from its serialized public key bytes."""
+        tpk = cls.__new__(cls)
+        tpk.public_key_bytes = public_key_bytes
+        tpk.encoding = encoding
+        tpk.format = format
+        return tpk
 
     @property
     def public_key(self):
-        match self.encoding:
-            case Encoding.PEM:
-                return serialization.load_pem_public_key(self.public_key_bytes)
-            case Encoding.OpenSSH:
-                return serialization.load_ssh_public_key(self.public_key_bytes)
-            case Encoding.DER:
-                return serialization.load_der_public_key(self.public_key_bytes)
-            case _:
-                return NotImplementedError("")
+        """
+        Parsed public key.
+
+        Parsing happens once per key: the result is cached on this object,
+        and shared with all equal keys through `load_public_key`.
+        """
+        public_key = self.__dict__.get("_public_key")
+        if public_key is None:
+            public_key = load_public_key(self.public_key_bytes, self.encoding)
+            self._public_key = public_key
+        return public_key
 
     def verify_signature(self, obj: Any, signature) -> bool:
         """Verify a signature on an object under this key."""
@@ -51,40 +173,121 @@ class TransferablePublicKey:
     def __hash__(self) -> int:
         return hash((self.public_key_bytes, self.encoding, self.format))
 
+    def __getstate__(self) -> Dict[str, Any]:
+        """Prepare for pickling: parsed keys do not pickle, and are rebuilt on demand."""
+        state = self.__dict__.copy()
+        state.pop("_public_key", None)
+        return state
+
+
+@lru_cache(maxsize=4096)
+def load_public_key(public_key_bytes: bytes, encoding: Encoding):
+    """
+    Parse serialized public key bytes.
+
+    Serves as intern table for parsed keys: equal key bytes share one parsed key.
+    """
+    match encoding:
+        case Encoding.PEM:
+            return serialization.load_pem_public_key(public_key_bytes)
+        case Encoding.OpenSSH:
+            return serialization.load_ssh_public_key(public_key_bytes)
+        case Encoding.DER:
+            return serialization.load_der_public_key(public_key_bytes)
+        case _:
+            raise NotImplementedError(f"cannot load public key with {encoding=}")
+
 
 class Signer:
+    """
+    Signs objects, under one private key per supported signature scheme.
 
-    def __init__(self, curve=ec.SECP256K1()) -> None:
-        self.private_key = ec.generate_private_key(curve)
+    :param curve: curve used for ECDSA keys
+    :param schemes: names of the supported signature schemes, in order of
+    preference. The key of the first scheme is this signer's primary key.
+    """
+
+    def __init__(self, curve=ec.SECP256K1(), schemes: Sequence[str] = (ECDSA,)) -> None:
+        self.schemes = tuple(schemes)
+        self._schemes: Dict[str, SignatureScheme] = {
+            ECDSA: EcdsaScheme(curve),
+            ED25519: Ed25519Scheme(),
+        }
+        self.private_keys = {
+            name: self._schemes[name].generate_private_key() for name in self.schemes
+        }
+        self._transferable_public_keys: Dict[
+            Tuple[str, Encoding, PublicFormat], TransferablePublicKey
+        ] = {}
+
+    @property
+    def primary_scheme(self) -> str:
+        return self.schemes[0]
+
+    @property
+    def private_key(self):
+        """Primary private key."""
+        return self.private_keys[self.primary_scheme]
 
     @property
-    def public_key(self) -> ec.EllipticCurvePublicKey:
+    def public_key(self):
+        """Primary public key."""
         return self.private_key.public_key()
 
     def get_transferable_public_key(
         self,
         encoding: Encoding = Encoding.PEM,
         format: PublicFormat = PublicFormat.SubjectPublicKeyInfo,
+        scheme: str = None,
     ) -> TransferablePublicKey:
-        return TransferablePublicKey(self.public_key, encoding, format)
+        scheme = scheme or self.primary_scheme
+        key = (scheme, encoding, format)
+        if key not in self._transferable_public_keys:
+            public_key = self.private_keys[scheme].public_key()
+            tpk = TransferablePublicKey(public_key, encoding, format)
+            self._transferable_public_keys[key] = tpk
+        return self._transferable_public_keys[key]
+
+    def get_transferable_public_keys(self) -> Dict[str, TransferablePublicKey]:
+        """Transferable public keys for all supported schemes, in order of preference."""
+        return {
+            scheme: self.get_transferable_public_key(scheme=scheme)
+            for scheme in self.schemes
+        }
+
+    def select_scheme(self, accepted_schemes: Sequence[str]) -> str:
+        """
+        Negotiate a signature scheme.
+
+        :param accepted_schemes: schemes accepted by the verifying party
+        :return: the most preferred scheme supported by both parties,
+        or the primary scheme when there is none.
+        """
+        for scheme in self.schemes:
+            if scheme in accepted_schemes:
+                return scheme
+        return self.primary_scheme
 
     def sign(
         self,
         obj: Any | bytes,
         hash_alg: hashes.HashAlgorithm = hashes.SHA256(),
+        scheme: str = None,
     ) -> Signature:
         """
         Sign object under this Signer's private key
 
         :param obj: object to sign
         :param hash_alg: algorithm used to hash obj to usable size
+        :param scheme: signature scheme to use, defaults to the primary scheme
         :return: signature for obj
         """
+        scheme = scheme or self.primary_scheme
         if not isinstance(obj, bytes):
             obj = pickle.dumps(obj)
-        digest = self._hash_obj(obj, hash_alg)
-        signature = self.private_key.sign(digest, ec.ECDSA(utils.Prehashed(hash_alg)))
-        return Signature(signature, hash_alg)
+        private_key = self.private_keys[scheme]
+        signature = self._schemes[scheme].sign(private_key, obj, hash_alg)
+        return Signature(signature, hash_alg, scheme)
 
     @classmethod
     def verify(
@@ -106,13 +309,11 @@ class Signer:
         if not isinstance(obj, bytes):
             obj = pickle.dumps(obj)
 
-        digest = cls._hash_obj(obj, sig.hash_alg)
-        public_key.verify(
-            sig.signature, digest, ec.ECDSA(utils.Prehashed(sig.hash_alg))
-        )
+        scheme = SIGNATURE_SCHEMES[sig.scheme]
+        scheme.verify(public_key, sig.signature, obj, sig.hash_alg)
+
 
-    @staticmethod
-    def _hash_obj(obj: bytes, hash_alg: hashes.HashAlgorithm) -> bytes:
-        hasher = hashes.Hash(hash_alg)
-        hasher.update(obj)
-        return hasher.finalize()
+def _hash_obj(obj: bytes, hash_alg: hashes.HashAlgorithm) -> bytes:
+    hasher = hashes.Hash(hash_alg)
+    hasher.update(obj)
+    return hasher.finalize()
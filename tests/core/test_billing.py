@@ -1,4 +1,5 @@
-from src.private_billing.core import SharedBilling, HiddenData, vector
+import pytest
+from src.private_billing.core import BillingPool, SharedBilling, HiddenData, vector
 from .tools import MockedHidingContext, get_test_cycle_context
 
 
@@ -172,3 +173,56 @@ class TestSharedBillingComputeBills:
             hd.masked_individual_deviations * (cyc.feed_in_tarifs - cyc.trading_prices)
         )
         # Note: not checking bills, since this is a producer
+
+
+@pytest.fixture(scope="module")
+def billing_pool():
+    pool = BillingPool(processes=2, shard_size=2)
+    yield pool
+    pool.close()
+
+
+class TestSharedBillingParallel:
+
+    def get_billing(self, cycle_length: int, clients: int, pool=None) -> SharedBilling:
+        mhc = MockedHidingContext("cc", "mg")
+        sb = SharedBilling(pool)
+        sb.record_contexts(get_test_cycle_context(1, cycle_length))
+        for client in range(clients):
+            sb.record_data(
+                HiddenData(
+                    client,
+                    1,
+                    consumptions=vector.new(cycle_length, 0.05 * client),
+                    supplies=vector.new(cycle_length, 0.01 * client),
+                    accepted_consumer_flags=vector.new(cycle_length, client % 2),
+                    accepted_producer_flags=vector.new(cycle_length, 1 - client % 2),
+                    positive_deviation_flags=vector.new(cycle_length, 1),
+                    masked_individual_deviations=vector.new(cycle_length, 0.1),
+                    masked_p2p_consumer_flags=vector.new(cycle_length, client % 2),
+                    masked_p2p_producer_flags=vector.new(cycle_length, 1 - client % 2),
+                    phc=mhc.get_public_hiding_context(),
+                )
+            )
+            sb.include_client(client)
+        return sb
+
+    def test_compute_bills_parallel(self, billing_pool):
+        expected = self.get_billing(16, 7).compute_bills(1)
+        bills = self.get_billing(16, 7, billing_pool).compute_bills(1)
+
+        assert bills.keys() == expected.keys()
+        for client, bill in bills.items():
+            assert bill.hidden_bill == expected[client].hidden_bill
+            assert bill.hidden_reward == expected[client].hidden_reward
+
+    def test_iter_bills_parallel(self, billing_pool):
+        # Run consecutive cycles on the same workers
+        for _ in range(2):
+            sb = self.get_billing(16, 5, billing_pool)
+            clients = [client for client, _ in sb.iter_bills(1)]
+            assert sorted(clients) == list(range(5))
+
+    def test_threads_per_process(self):
+        pool = BillingPool(processes=2, threads_per_process=3)
+        assert pool.threads_per_process == 3
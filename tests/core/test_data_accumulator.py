@@ -0,0 +1,67 @@
+import pytest
+from src.private_billing.core import (
+    Data,
+    DataAccumulator,
+    HidingContext,
+    Int64ToFloatConvertor,
+    SharedMaskGenerator,
+    vector,
+)
+
+
+@pytest.fixture
+def hc():
+    conv = Int64ToFloatConvertor(4, 4)
+    g1, g2 = SharedMaskGenerator(conv), SharedMaskGenerator(conv)
+    g1.consume_foreign_seed(g2.get_seed_for_peer(0), 1)
+    g2.consume_foreign_seed(g1.get_seed_for_peer(1), 0)
+    return HidingContext(8, g1)
+
+
+PROMISES = vector([1.0, -2.0, 0.5, 0.0, -1.0, 3.0, 2.0, -0.5])
+UTILIZATIONS = vector([1.5, -1.0, 0.5, 0.25, -2.0, 2.0, 0.0, 0.5])
+
+
+def accumulate(hc, slots: int) -> DataAccumulator:
+    acc = DataAccumulator(hc, 0, 1)
+    for promise, utilization in zip(PROMISES[:slots], UTILIZATIONS[:slots]):
+        acc.append(promise, utilization)
+    return acc
+
+
+class TestDataAccumulator:
+
+    def test_hide_matches_data(self, hc):
+        data = Data(0, 1, vector(PROMISES), vector(UTILIZATIONS))
+        expected = data.hide(hc)
+        hd = accumulate(hc, 8).hide()
+
+        assert (hd.client, hd.cycle_id) == (0, 1)
+        assert hd.masked_individual_deviations == expected.masked_individual_deviations
+        assert hd.masked_p2p_consumer_flags == expected.masked_p2p_consumer_flags
+        assert hd.masked_p2p_producer_flags == expected.masked_p2p_producer_flags
+        for name in ("consumptions", "supplies", "positive_deviation_flags"):
+            values = hc.decrypt(getattr(hd, name))
+            assert values == pytest.approx(getattr(data, name), abs=1e-6)
+
+    def test_incomplete(self, hc):
+        acc = accumulate(hc, 5)
+        assert acc.slots == 5 and not acc.is_complete
+        with pytest.raises(ValueError):
+            acc.hide()
+
+    def test_complete(self, hc):
+        acc = accumulate(hc, 8)
+        assert acc.is_complete
+        with pytest.raises(ValueError):
+            acc.append(0.0, 0.0)
+
+    def test_seeds_changed(self, hc):
+        acc = accumulate(hc, 8)
+        hc.mask_generator.consume_foreign_seed(42, 2)
+
+        # Masks are drawn anew from the current seeds
+        data = Data(0, 1, vector(PROMISES), vector(UTILIZATIONS))
+        expected = data.hide(hc)
+        hd = acc.hide()
+        assert hd.masked_individual_deviations == expected.masked_individual_deviations
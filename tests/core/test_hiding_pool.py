@@ -0,0 +1,71 @@
+import pytest
+from src.private_billing.core import (
+    Data,
+    HidingContext,
+    HidingPool,
+    Int64ToFloatConvertor,
+    SharedMaskGenerator,
+    vector,
+)
+
+
+@pytest.fixture(scope="module")
+def hiding_pool():
+    pool = HidingPool(processes=1, chunk_size=2, max_in_flight=2)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(scope="module")
+def hc():
+    conv = Int64ToFloatConvertor(4, 4)
+    g1, g2 = SharedMaskGenerator(conv), SharedMaskGenerator(conv)
+    g1.consume_foreign_seed(g2.get_seed_for_peer(0), 1)
+    g2.consume_foreign_seed(g1.get_seed_for_peer(1), 0)
+    return HidingContext(16, g1)
+
+
+def get_data(cycle_id: int) -> Data:
+    return Data(
+        client=0,
+        cycle_id=cycle_id,
+        utilization_promises=vector.new(16, 0.5 * cycle_id),
+        utilizations=vector.new(16, 0.25 * cycle_id),
+    )
+
+
+class TestHidingPool:
+
+    def test_hide(self, hiding_pool, hc):
+        data = [get_data(cycle_id) for cycle_id in range(5)]
+        hidden = list(hiding_pool.hide(hc, data))
+
+        # Hidden in order, under the context of the caller
+        assert [hd.cycle_id for hd in hidden] == list(range(5))
+        for d, hd in zip(data, hidden):
+            expected = d.hide(hc)
+            assert hd.phc is not None
+            assert hc.decrypt(hd.consumptions)[:16] == pytest.approx(d.consumptions)
+            assert hc.decrypt(hd.supplies)[:16] == pytest.approx(d.supplies)
+            assert hd.masked_individual_deviations == expected.masked_individual_deviations
+            assert hd.masked_p2p_consumer_flags == expected.masked_p2p_consumer_flags
+
+    def test_hide_consecutive(self, hiding_pool, hc):
+        # Workers keep the context, and pick up a new mask generator per call
+        for cycle_id in range(2):
+            [hd] = hiding_pool.hide(hc, [get_data(cycle_id)])
+            assert hd.cycle_id == cycle_id
+
+    def test_bounded_in_flight(self, hiding_pool, hc):
+        consumed = []
+
+        def stream():
+            for cycle_id in range(10):
+                consumed.append(cycle_id)
+                yield get_data(cycle_id)
+
+        hidden = hiding_pool.hide(hc, stream())
+        next(hidden)
+        # At most two chunks of two are taken from the stream
+        assert len(consumed) <= 4
+        hidden.close()
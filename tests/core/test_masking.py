@@ -65,6 +65,11 @@ class TestSharedMaskGenerator:
         masks = [g.generate_masks(iv, 1024) for g in gg.values()]
         assert sum(masks, vector.new(1024)) == vector.new(1024)
 
+    def test_iter_masks_matches_generate_masks(self):
+        g = self.get_generator_group()[0]
+        masks = list(itertools.islice(g.iter_masks(42), 16))
+        assert masks == g.generate_masks(42, 16)
+
 
 class TestSharedMaskingAndConversion:
 
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from src.private_billing.core import Data, MeterStore, vector
+
+
+def get_data(cycle_id: int) -> Data:
+    return Data(
+        None,
+        cycle_id,
+        vector.new(4, 0.5 * cycle_id),
+        vector([0.25 * cycle_id, -1.0, 0.0, 2.0]),
+    )
+
+
+class TestMeterStore:
+
+    def test_from_data(self, tmp_path):
+        data = [get_data(cycle_id) for cycle_id in (3, 1, 2)]
+        store = MeterStore.from_data(tmp_path, data)
+
+        assert len(store) == 3
+        assert store.cycle_length == 4
+        assert list(store) == data
+        assert store.get(1) == data[1]
+        assert 2 in store and 4 not in store
+        with pytest.raises(KeyError):
+            store.get(4)
+
+    def test_read_range(self, tmp_path):
+        MeterStore.from_data(tmp_path, [get_data(c) for c in (3, 1, 2, 5)])
+
+        # Reopened stores attribute data to the given client
+        store = MeterStore(tmp_path, client=7)
+        cycles = list(store.read(2, 5))
+        assert [d.cycle_id for d in cycles] == [2, 3]
+        assert all(d.client == 7 for d in cycles)
+        assert isinstance(cycles[0].utilizations, vector)
+
+    def test_columns_are_memory_mapped(self, tmp_path):
+        store = MeterStore.create(
+            tmp_path, np.arange(2), np.zeros((2, 4)), np.ones((2, 4))
+        )
+        assert isinstance(store.columns["utilizations"], np.memmap)
+        assert store.get(1).utilizations == [1.0] * 4
+
+    def test_create_invalid(self, tmp_path):
+        with pytest.raises(ValueError):
+            MeterStore.create(tmp_path, [1, 1], np.zeros((2, 4)), np.zeros((2, 4)))
+        with pytest.raises(ValueError):
+            MeterStore.create(tmp_path, [1, 2], np.zeros((2, 4)), np.zeros((2, 3)))
+        with pytest.raises(ValueError):
+            MeterStore.create(tmp_path, [1, 2, 3], np.zeros((2, 4)), np.zeros((2, 4)))
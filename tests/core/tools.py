@@ -97,6 +97,9 @@ class MockedPublicHidingContext(PublicHidingContext):
     def activate_keys(self) -> None:
         pass
 
+    def __setstate__(self, state):
+        self.__dict__ = state
+
 def get_mock_public_hiding_context():
     return MockedPublicHidingContext("cyc", "cc", "pk")
 
@@ -0,0 +1,136 @@
+import asyncio
+from threading import Thread
+import time
+
+import pytest
+import zmq.asyncio
+from src.private_billing.server import (
+    AsyncConnectionPool,
+    AsyncRequestReplyServer,
+    Message,
+    PickleEncoder,
+    RequestRejectedException,
+    RequestReplyServer,
+    RequestTimeoutException,
+    TCPAddress,
+)
+
+
+class AsyncRequestReplyServerTester(AsyncRequestReplyServer):
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.messages = []
+
+    async def _handle(self, msg: Message) -> Message:
+        self.messages.append(msg)
+        await asyncio.sleep(0.1)
+        return msg
+
+
+class BlockingAsyncRequestReplyServerTester(AsyncRequestReplyServer):
+
+    def _handle(self, msg: Message) -> Message:
+        time.sleep(0.1)
+        return msg
+
+
+def serve(server, port):
+    thread = Thread(target=server.start, args=(port, 100))
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def async_server():
+    # start server
+    server = AsyncRequestReplyServerTester(PickleEncoder)
+    thread = serve(server, 5580)
+
+    yield server, TCPAddress("localhost", 5580)
+
+    # terminate server
+    server.terminate()
+    thread.join(3)
+
+
+class TestAsyncRequestReplyServer:
+
+    def test_terminate(self):
+        server = AsyncRequestReplyServerTester(PickleEncoder)
+        thread = serve(server, 5581)
+        server.terminate()
+        thread.join(3.0)
+        assert not thread.is_alive()
+
+    def test_reply(self, async_server):
+        server, target = async_server
+        client = RequestReplyServer(PickleEncoder)
+
+        reply = client.send("hello!", target)
+
+        assert PickleEncoder.decode(reply) == "hello!"
+        assert server.messages == ["hello!"]
+
+    def test_concurrent_requests(self, async_server):
+        _, target = async_server
+        client = RequestReplyServer(PickleEncoder)
+
+        # Handlers take 0.1s each, but run concurrently
+        started = time.monotonic()
+        futures = [client.send_frames_async([PickleEncoder.encode(i)], target) for i in range(10)]
+        replies = [PickleEncoder.decode(f.result(3)) for f in futures]
+
+        assert replies == list(range(10))
+        assert time.monotonic() - started < 0.5
+
+    def test_blocking_handler_offloaded(self):
+        server = BlockingAsyncRequestReplyServerTester(PickleEncoder)
+        thread = serve(server, 5582)
+        target = TCPAddress("localhost", 5582)
+        client = RequestReplyServer(PickleEncoder)
+
+        started = time.monotonic()
+        futures = [client.send_frames_async([PickleEncoder.encode(i)], target) for i in range(4)]
+        replies = [PickleEncoder.decode(f.result(3)) for f in futures]
+
+        server.terminate()
+        thread.join(3)
+        assert replies == list(range(4))
+        assert time.monotonic() - started < 0.35
+
+    def test_send_and_broadcast(self, async_server):
+        _, target = async_server
+        unreachable = TCPAddress("localhost", 5599)
+
+        async def run(client: AsyncRequestReplyServer):
+            reply = await client.send("hello!", target)
+            deliveries = await client.broadcast("hi!", [target, unreachable])
+            await client.connections.close()
+            return reply, deliveries
+
+        client = AsyncRequestReplyServerTester(PickleEncoder, broadcast_timeout=0.5)
+        reply, deliveries = asyncio.run(run(client))
+
+        assert PickleEncoder.decode(reply) == "hello!"
+        assert deliveries[target].ok
+        assert not deliveries[unreachable].ok
+
+    def test_rejects_malformed_frames(self, async_server):
+        server, target = async_server
+        client = RequestReplyServer(PickleEncoder)
+
+        with pytest.raises(RequestRejectedException):
+            client.send_frames([b"garbage"], target)
+        assert server.messages == []
+
+    def test_request_timeout(self):
+        async def run(pool: AsyncConnectionPool):
+            try:
+                await pool.request([b"hello"], TCPAddress("localhost", 5599))
+            finally:
+                await pool.close()
+
+        pool = AsyncConnectionPool(zmq.asyncio.Context(), request_timeout=0.1)
+        with pytest.raises(RequestTimeoutException):
+            asyncio.run(run(pool))
@@ -0,0 +1,227 @@
+from threading import Thread
+import time
+
+import pytest
+import zmq
+from src.private_billing.server import (
+    BUSY,
+    REJECTED,
+    ConnectionManager,
+    RequestRejectedException,
+    RequestTimeoutException,
+    ServerBusyException,
+    TCPAddress,
+)
+
+
+@pytest.fixture
+def echo_server():
+    # start a REP server that echoes requests, after a short delay
+    context = zmq.Context()
+    sock = context.socket(zmq.REP)
+    sock.RCVTIMEO = 100
+    sock.bind("tcp://*:5570")
+    state = {"keep_running": True, "received": 0}
+
+    def run():
+        while state["keep_running"]:
+            try:
+                frames = sock.recv_multipart()
+            except zmq.error.Again:
+                continue
+            state["received"] += 1
+            time.sleep(0.01)
+            sock.send(b"".join(frames))
+
+    thread = Thread(target=run)
+    thread.start()
+
+    yield TCPAddress("localhost", 5570), state
+
+    # terminate server
+    state["keep_running"] = False
+    thread.join(3)
+    sock.close(0)
+
+
+@pytest.fixture
+def lossy_server():
+    # start a ROUTER server that drops the first two requests, and echoes the rest
+    context = zmq.Context()
+    sock = context.socket(zmq.ROUTER)
+    sock.RCVTIMEO = 100
+    sock.bind("tcp://*:5572")
+    state = {"keep_running": True, "received": 0}
+
+    def run():
+        while state["keep_running"]:
+            try:
+                identity, correlation_id, empty, *frames = sock.recv_multipart()
+            except zmq.error.Again:
+                continue
+            state["received"] += 1
+            if state["received"] > 2:
+                sock.send_multipart([identity, correlation_id, empty, b"".join(frames)])
+
+    thread = Thread(target=run)
+    thread.start()
+
+    yield TCPAddress("localhost", 5572), state
+
+    # terminate server
+    state["keep_running"] = False
+    thread.join(3)
+    sock.close(0)
+
+
+@pytest.fixture
+def busy_server():
+    # start a REP server that gives the queued raw replies, and echoes afterwards
+    context = zmq.Context()
+    sock = context.socket(zmq.REP)
+    sock.RCVTIMEO = 100
+    sock.bind("tcp://*:5573")
+    state = {"keep_running": True, "received": 0, "replies": []}
+
+    def run():
+        while state["keep_running"]:
+            try:
+                frames = sock.recv_multipart()
+            except zmq.error.Again:
+                continue
+            state["received"] += 1
+            replies = state["replies"]
+            sock.send(replies.pop(0) if replies else b"".join(frames))
+
+    thread = Thread(target=run)
+    thread.start()
+
+    yield TCPAddress("localhost", 5573), state
+
+    # terminate server
+    state["keep_running"] = False
+    thread.join(3)
+    sock.close(0)
+
+
+class TestConnectionManager:
+
+    def test_request(self, echo_server):
+        target, _ = echo_server
+        manager = ConnectionManager(zmq.Context())
+        assert manager.request([b"hello"], target).result(3) == b"hello"
+        manager.close()
+
+    def test_request_multipart(self, echo_server):
+        target, _ = echo_server
+        manager = ConnectionManager(zmq.Context())
+        assert manager.request([b"a", b"b", b"c"], target).result(3) == b"abc"
+        manager.close()
+
+    def test_pipelined_replies_are_correlated(self, echo_server):
+        target, state = echo_server
+        manager = ConnectionManager(zmq.Context(), window=4)
+
+        futures = [manager.request([str(i).encode()], target) for i in range(20)]
+
+        assert [f.result(3) for f in futures] == [str(i).encode() for i in range(20)]
+        assert state["received"] == 20
+        manager.close()
+
+    def test_connection_is_reused(self, echo_server):
+        target, _ = echo_server
+        manager = ConnectionManager(zmq.Context())
+
+        manager.request([b"first"], target).result(3)
+        connection = manager.connections[target]
+        manager.request([b"second"], target).result(3)
+
+        assert manager.connections[target] is connection
+        manager.close()
+
+    def test_idle_connection_is_evicted(self, echo_server):
+        target, _ = echo_server
+        manager = ConnectionManager(zmq.Context(), idle_timeout=0.05, interval=10)
+
+        manager.request([b"hello"], target).result(3)
+        time.sleep(0.3)
+
+        assert target not in manager.connections
+
+        # A new connection is made on demand
+        assert manager.request([b"again"], target).result(3) == b"again"
+        manager.close()
+
+    def test_close_cancels_unanswered_requests(self):
+        manager = ConnectionManager(zmq.Context())
+        future = manager.request([b"hello"], TCPAddress("localhost", 5571))
+        manager.close()
+        assert future.done()
+
+    def test_close_releases_wake_pipe(self, echo_server):
+        target, _ = echo_server
+        manager = ConnectionManager(zmq.Context())
+        manager.request([b"hello"], target).result(3)
+        manager.close()
+        assert manager._wake_r is None and manager._wake_w is None
+
+        # The manager can be used again
+        assert manager.request([b"again"], target).result(3) == b"again"
+        manager.close()
+
+    def test_cancelled_requests_free_window(self, lossy_server):
+        target, state = lossy_server
+        manager = ConnectionManager(zmq.Context(), window=2, interval=10)
+
+        lost = [manager.request([b"lost"], target) for _ in range(2)]
+        time.sleep(0.1)
+        for future in lost:
+            assert future.cancel()
+
+        # The window is free again, hence the next request is sent
+        assert manager.request([b"hello"], target).result(3) == b"hello"
+        assert state["received"] == 3
+        manager.close()
+
+    def test_overdue_requests_fail(self, lossy_server):
+        target, state = lossy_server
+        manager = ConnectionManager(
+            zmq.Context(), window=2, request_timeout=0.1, interval=10
+        )
+
+        lost = [manager.request([b"lost"], target) for _ in range(2)]
+        for future in lost:
+            with pytest.raises(RequestTimeoutException):
+                future.result(3)
+
+        assert manager.request([b"hello"], target).result(3) == b"hello"
+        assert manager.connections[target].is_idle
+        manager.close()
+
+    def test_busy_request_is_retried(self, busy_server):
+        target, state = busy_server
+        state["replies"] = [BUSY, BUSY]
+        manager = ConnectionManager(zmq.Context(), busy_backoff=0.01)
+
+        assert manager.request([b"hello"], target).result(3) == b"hello"
+        assert state["received"] == 3
+        manager.close()
+
+    def test_busy_request_fails_after_retries(self, busy_server):
+        target, state = busy_server
+        state["replies"] = [BUSY] * 3
+        manager = ConnectionManager(zmq.Context(), busy_retries=2, busy_backoff=0.01)
+
+        with pytest.raises(ServerBusyException):
+            manager.request([b"hello"], target).result(3)
+        assert state["received"] == 3
+        manager.close()
+
+    def test_rejected_request_fails(self, busy_server):
+        target, state = busy_server
+        state["replies"] = [REJECTED]
+        manager = ConnectionManager(zmq.Context())
+
+        with pytest.raises(RequestRejectedException):
+            manager.request([b"hello"], target).result(3)
+        manager.close()
@@ -0,0 +1,78 @@
+import pytest
+from src.private_billing.server import (
+    Envelope,
+    HostedAddress,
+    InprocAddress,
+    IPCAddress,
+    MalformedEnvelopeException,
+    Signer,
+    TCPAddress,
+)
+
+
+class TestEnvelope:
+
+    def test_frames_unsigned(self):
+        envelope = Envelope(TCPAddress("localhost", 5555), b"payload", None, "seed")
+        frames = envelope.to_frames()
+        assert len(frames) == 2
+        assert Envelope.from_frames(frames) == envelope
+
+    def test_frames_signed(self):
+        signer = Signer()
+        payload = b"payload"
+        envelope = Envelope(
+            TCPAddress("localhost", 5555), payload, signer.sign(payload), "seed"
+        )
+        rebuilt = Envelope.from_frames(envelope.to_frames())
+
+        assert rebuilt.origin == envelope.origin
+        assert rebuilt.payload == payload
+        assert rebuilt.message_type == "seed"
+        signer.verify(payload, rebuilt.signature, signer.get_transferable_public_key())
+
+    def test_frames_authenticated(self):
+        envelope = Envelope(TCPAddress("localhost", 5555), b"payload", mac=b"m" * 32)
+        frames = envelope.to_frames()
+        assert len(frames) == 3
+        assert Envelope.from_frames(frames) == envelope
+
+    def test_frames_without_origin(self):
+        envelope = Envelope(None, b"payload")
+        assert Envelope.from_frames(envelope.to_frames()) == envelope
+
+    @pytest.mark.parametrize(
+        "origin", (IPCAddress("/tmp/core.sock"), InprocAddress("core-1"))
+    )
+    def test_frames_local_origin(self, origin):
+        envelope = Envelope(origin, b"payload", None, "seed")
+        assert Envelope.from_frames(envelope.to_frames()) == envelope
+
+    def test_frames_recipient(self):
+        envelope = Envelope(
+            HostedAddress(TCPAddress("localhost", 5555), "a"),
+            b"payload",
+            None,
+            "seed",
+            recipient="b",
+        )
+        assert Envelope.from_frames(envelope.to_frames()) == envelope
+
+    def test_payload_frame_is_untouched(self):
+        payload = bytes(range(256)) * 100
+        envelope = Envelope(TCPAddress("localhost", 5555), payload)
+        assert envelope.to_frames()[1] is payload
+
+    @pytest.mark.parametrize(
+        "frames",
+        (
+            [b"single"],
+            [b"", b"payload"],
+            [b"a"] * 4,
+            # header of the previous envelope version
+            [bytes([1, 1]) + (5555).to_bytes(2, "little") + b"localhost", b"payload"],
+        ),
+    )
+    def test_malformed(self, frames):
+        with pytest.raises(MalformedEnvelopeException):
+            Envelope.from_frames(frames)
@@ -0,0 +1,72 @@
+from concurrent.futures import Future
+from threading import Timer
+
+from src.private_billing.server import DeliveryTimeoutException, fan_out
+
+
+def replied(reply) -> Future:
+    future = Future()
+    future.set_result(reply)
+    return future
+
+
+def replied_later(reply, delay: float) -> Future:
+    future = Future()
+    Timer(delay, future.set_result, (reply,)).start()
+    return future
+
+
+class TestFanOut:
+
+    def test_fan_out(self):
+        deliveries = fan_out(lambda target: replied(target * 2), range(5))
+        assert {t: d.reply for t, d in deliveries.items()} == {i: i * 2 for i in range(5)}
+        assert all(d.ok for d in deliveries.values())
+
+    def test_fan_out_is_concurrent(self):
+        deliveries = fan_out(lambda target: replied_later(target, 0.2), range(10))
+        assert max(d.elapsed for d in deliveries.values()) < 1.0
+        assert all(d.ok for d in deliveries.values())
+
+    def test_fan_out_timeout(self):
+        def send(target):
+            return Future() if target == "slow" else replied_later(target, 0.01)
+
+        deliveries = fan_out(send, ["a", "slow", "b"], timeout=0.2)
+
+        assert deliveries["a"].ok and deliveries["b"].ok
+        assert isinstance(deliveries["slow"].error, DeliveryTimeoutException)
+
+    def test_fan_out_failure(self):
+        def send(target):
+            if target == "broken":
+                raise ConnectionError()
+            future = Future()
+            if target == "failing":
+                future.set_exception(ValueError())
+            else:
+                future.set_result(target)
+            return future
+
+        deliveries = fan_out(send, ["a", "broken", "failing"])
+
+        assert deliveries["a"].ok
+        assert isinstance(deliveries["broken"].error, ConnectionError)
+        assert isinstance(deliveries["failing"].error, ValueError)
+
+    def test_fan_out_max_parallel(self):
+        outstanding = []
+        max_outstanding = 0
+
+        def send(target):
+            nonlocal max_outstanding
+            outstanding.append(target)
+            max_outstanding = max(max_outstanding, len(outstanding))
+            future = replied_later(target, 0.01)
+            future.add_done_callback(lambda _: outstanding.remove(target))
+            return future
+
+        deliveries = fan_out(send, range(12), max_parallel=3)
+
+        assert len(deliveries) == 12
+        assert max_outstanding <= 3
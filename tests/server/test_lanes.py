@@ -0,0 +1,115 @@
+from threading import Event, Thread
+import time
+
+import pytest
+from src.private_billing.server import Lane, LaneDispatcher, LaneFullException
+
+
+def wait_for(condition, timeout: float = 3.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+class TestLane:
+
+    def test_in_order(self):
+        lane = Lane("test")
+        results = []
+        for i in range(50):
+            lane.submit(results.append, i)
+        lane.close()
+        assert results == list(range(50))
+
+    def test_stats(self):
+        lane = Lane("test")
+        release = Event()
+        lane.submit(release.wait)
+        lane.submit(lambda: None)
+        lane.submit(lambda: None)
+        wait_for(lambda: lane.stats().depth == 2)
+
+        stats = lane.stats()
+        assert stats.depth == 2
+        assert stats.submitted == 3
+        assert stats.completed == 0
+
+        time.sleep(0.05)
+        release.set()
+        lane.close()
+
+        stats = lane.stats()
+        assert stats.depth == 0
+        assert stats.completed == 3
+        assert stats.max_wait >= 0.05
+        assert 0 < stats.mean_wait <= stats.max_wait
+
+    def test_bounded_queue_blocks(self):
+        lane = Lane("test", max_queue=1)
+        release = Event()
+        lane.submit(release.wait)
+        wait_for(lambda: lane.stats().depth == 0)
+        lane.submit(lambda: None)
+
+        # The queue is full, hence the next submit blocks
+        submitter = Thread(target=lane.submit, args=(lambda: None,))
+        submitter.start()
+        submitter.join(0.1)
+        assert submitter.is_alive()
+
+        release.set()
+        submitter.join(3)
+        assert not submitter.is_alive()
+        lane.close()
+
+    def test_bounded_queue_rejects(self):
+        lane = Lane("test", max_queue=1)
+        release = Event()
+        lane.submit(release.wait)
+        wait_for(lambda: lane.stats().depth == 0)
+        lane.submit(lambda: None)
+
+        # The queue is full, hence a submit that cannot wait is rejected
+        with pytest.raises(LaneFullException):
+            lane.submit(lambda: None, block=False)
+
+        release.set()
+        lane.close()
+        stats = lane.stats()
+        assert (stats.submitted, stats.completed, stats.rejected) == (2, 2, 1)
+
+    def test_failing_task_does_not_stop_lane(self):
+        lane = Lane("test")
+        results = []
+        lane.submit(lambda: 1 / 0)
+        lane.submit(results.append, 1)
+        lane.close()
+
+        assert results == [1]
+        assert lane.stats().completed == 2
+
+
+class TestLaneDispatcher:
+
+    def test_routing(self):
+        dispatcher = LaneDispatcher(
+            [Lane("fast"), Lane("slow")], {"heavy": "slow"}, "fast"
+        )
+        assert dispatcher.lane_for("heavy").name == "slow"
+        assert dispatcher.lane_for("other").name == "fast"
+        assert dispatcher.lane_for(None).name == "fast"
+
+    def test_slow_lane_does_not_block_fast_lane(self):
+        dispatcher = LaneDispatcher(
+            [Lane("fast"), Lane("slow")], {"heavy": "slow"}, "fast"
+        )
+        release, done = Event(), Event()
+        dispatcher.submit("heavy", release.wait)
+        dispatcher.submit("light", done.set)
+
+        assert done.wait(1)
+        assert dispatcher.stats()["slow"].completed == 0
+
+        release.set()
+        dispatcher.close()
+        assert dispatcher.stats()["slow"].completed == 1
@@ -0,0 +1,92 @@
+import time
+
+import zmq
+from src.private_billing.server import Publisher, Subscriber, TCPAddress
+
+
+class TestPubSub:
+
+    def test_publish_receive(self):
+        context = zmq.Context()
+        publisher = Publisher(context, 5590)
+        received = []
+        subscriber = Subscriber(
+            context,
+            TCPAddress("localhost", 5590),
+            lambda topic, seq, frames: received.append((topic, seq, frames)),
+            lambda first, last: None,
+            interval=10,
+        )
+        subscriber.start()
+
+        # Wait for the subscription to be set up
+        deadline = time.monotonic() + 5
+        while not received and time.monotonic() < deadline:
+            publisher.publish(b"ping", [b"payload"])
+            time.sleep(0.05)
+
+        subscriber.close()
+        publisher.close()
+        context.term()
+
+        topic, seq, frames = received[0]
+        assert topic == b"ping"
+        assert seq >= 1
+        assert frames == [b"payload"]
+
+    def test_replay(self):
+        context = zmq.Context()
+        publisher = Publisher(context, 5591, history=2)
+        for i in range(3):
+            publisher.publish(b"", [bytes([i])])
+        publisher.close()
+        context.term()
+
+        assert publisher.sequence == 3
+        assert publisher.replay(1, 3) == [(2, [b"\x01"]), (3, [b"\x02"])]
+
+    def test_publish_on_host(self):
+        context = zmq.Context()
+        publisher = Publisher(context, 5593, host="localhost")
+        endpoint = publisher.sock.getsockopt_string(zmq.LAST_ENDPOINT)
+        publisher.close()
+        context.term()
+
+        assert endpoint == "tcp://127.0.0.1:5593"
+
+    def test_gap_detection(self):
+        context = zmq.Context()
+        received, gaps = [], []
+        subscriber = Subscriber(
+            context,
+            TCPAddress("localhost", 5592),
+            lambda topic, seq, frames: received.append(seq),
+            lambda first, last: gaps.append((first, last)),
+        )
+
+        for seq in (4, 5, 8, 9, 1):
+            subscriber.receive(b"", seq, [])
+        subscriber.close()
+        context.term()
+
+        assert received == [4, 5, 8, 9, 1]
+        assert gaps == [(6, 7)]
+
+    def test_gap_detection_from_announced_sequence(self):
+        context = zmq.Context()
+        received, gaps = [], []
+        subscriber = Subscriber(
+            context,
+            TCPAddress("localhost", 5592),
+            lambda topic, seq, frames: received.append(seq),
+            lambda first, last: gaps.append((first, last)),
+            last_sequence=3,
+        )
+
+        # Messages 4 and 5 were published while subscribing
+        subscriber.receive(b"", 6, [])
+        subscriber.close()
+        context.term()
+
+        assert received == [6]
+        assert gaps == [(4, 5)]
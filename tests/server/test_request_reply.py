@@ -1,5 +1,6 @@
 # import socket
 import pytest
+import zmq
 from src.private_billing.messages import DataMessage, HiddenDataMessage
 from src.private_billing.core import (
     Data,
@@ -9,11 +10,18 @@ from src.private_billing.core import (
     SharedMaskGenerator,
     vector,
 )
+import zmq
 from src.private_billing.server import (
+    HostedAddress,
+    InprocAddress,
+    IPCAddress,
     RequestReplyServer,
     TCPAddress,
     Message,
     PickleEncoder,
+    REJECTED,
+    get_endpoint,
+    parse_address,
 )
 from tests.core.tools import are_equal_ciphertexts
 from threading import Thread
@@ -37,6 +45,39 @@ class TestTCPAddress:
         assert hash1 == hash2
 
 
+class TestAddress:
+
+    @pytest.mark.parametrize(
+        "address",
+        (
+            TCPAddress("localhost", 5555),
+            IPCAddress("/tmp/private-billing.sock"),
+            InprocAddress("core-1"),
+            HostedAddress(TCPAddress("localhost", 5555), "household-1"),
+        ),
+    )
+    def test_parse(self, address):
+        assert parse_address(str(address)) == address
+
+    @pytest.mark.parametrize("endpoint", ("localhost:5555", "udp://localhost:5555"))
+    def test_parse_invalid(self, endpoint):
+        with pytest.raises(ValueError):
+            parse_address(endpoint)
+
+    def test_transports_differ(self):
+        assert IPCAddress("core") != InprocAddress("core")
+        assert len({IPCAddress("core"), InprocAddress("core")}) == 2
+
+    def test_bind_endpoint(self):
+        assert TCPAddress("localhost", 5555).bind_endpoint == "tcp://*:5555"
+        assert InprocAddress("core").bind_endpoint == "inproc://core"
+
+    def test_endpoint(self):
+        host = TCPAddress("localhost", 5555)
+        assert get_endpoint(HostedAddress(host, "core")) == host
+        assert get_endpoint(host) == host
+
+
 class TestRequestReplyServerTerminate:
 
     def test_terminate(self):
@@ -47,6 +88,13 @@ class TestRequestReplyServerTerminate:
         thread.join(3.0)
         assert not thread.is_alive()
 
+    def test_terminate_closes_connections(self):
+        server = RequestReplyServer(None)
+        closed = []
+        server.connections.close = lambda: closed.append(True)
+        server.terminate()
+        assert closed == [True]
+
 
 class RequestReplyServerTester(RequestReplyServer):
 
@@ -110,6 +158,57 @@ class TestRequestReplyServerSend:
         receiving_server.messages = [msg]
 
 
+class TestRequestReplyServerMalformed:
+
+    @pytest.mark.parametrize(
+        "frames",
+        [
+            [b"garbage"],  # bare message that cannot be decoded
+            [b"\x01", b"payload"],  # truncated header
+            [b"\x09\x00\x00\x00", b"payload"],  # unsupported version
+            [b"\x01\x00\x00\x00", b"payload", b"signature"],  # flag mismatch
+            [b"\x01\x02\x00\x00", b"payload", b"\x03md7xyz"],  # unknown hash
+            [b"a", b"b", b"c", b"d"],  # too many frames
+        ],
+    )
+    def test_rejects_malformed_frames(self, receiving_server, frames):
+        receiving_server, target = receiving_server
+
+        # Send garbage, which is rejected
+        context = zmq.Context()
+        sock = context.socket(zmq.REQ)
+        sock.setsockopt(zmq.RCVTIMEO, 3000)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(str(target))
+        sock.send_multipart(frames)
+        assert sock.recv() == REJECTED
+        sock.close()
+        context.term()
+
+        # Server is still alive
+        sending_server = RequestReplyServerTester(PickleEncoder)
+        sending_server.send("hello!", target)
+        assert receiving_server.messages == ["hello!"]
+
+
+class TestRequestReplyServerBroadcast:
+
+    def test_broadcast(self, receiving_server):
+        receiving_server, target = receiving_server
+
+        # Setup sending server
+        server = RequestReplyServerTester(PickleEncoder)
+
+        # Broadcast to a live and an unreachable target
+        server.broadcast_timeout = 1.0
+        unreachable = TCPAddress("localhost", 5599)
+        deliveries = server.broadcast("hello!", [target, unreachable])
+
+        assert deliveries[target].ok
+        assert not deliveries[unreachable].ok
+        assert receiving_server.messages == ["hello!"]
+
+
 class TestSendIntegration:
     def test_send_large_message(self, receiving_server):
         receiving_server, target = receiving_server
@@ -154,3 +253,30 @@ class TestSendIntegration:
         assert are_equal_ciphertexts(
             rcvd_hd.positive_deviation_flags, hd.positive_deviation_flags, hc
         )
+
+
+class TestLocalTransports:
+
+    @pytest.mark.parametrize("transport", ("ipc", "inproc"))
+    def test_send(self, transport, tmp_path):
+        if transport == "ipc":
+            target = IPCAddress(str(tmp_path / "receiver.sock"))
+        else:
+            target = InprocAddress("receiver")
+
+        # In-process servers share a context
+        context = zmq.Context()
+        receiving_server = RequestReplyServerTester(PickleEncoder, context=context)
+        thread = Thread(target=receiving_server.start, args=(target, 100))
+        thread.start()
+
+        sending_server = RequestReplyServerTester(PickleEncoder, context=context)
+        sending_server.send("hello!", target)
+        assert receiving_server.messages == ["hello!"]
+
+        receiving_server.terminate()
+        thread.join(3)
+        for server in (sending_server, receiving_server):
+            server.connections.close()
+            server.sock.close()
+        context.term()
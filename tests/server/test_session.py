@@ -0,0 +1,63 @@
+from cryptography.exceptions import InvalidTag
+import pytest
+from src.private_billing.server import (
+    ECDSA,
+    ED25519,
+    NoSessionKeyException,
+    Signer,
+    authenticate,
+    decrypt,
+    derive_session_key,
+    encrypt,
+    generate_key,
+    verify_authentication,
+)
+
+
+class TestSession:
+
+    def test_derive_session_key_is_symmetric(self):
+        alice, bob = Signer(), Signer()
+        alice_key = derive_session_key(alice, bob.get_transferable_public_key())
+        bob_key = derive_session_key(bob, alice.get_transferable_public_key())
+        assert alice_key == bob_key
+
+    def test_derive_session_key_differs_per_pair(self):
+        alice, bob, carol = Signer(), Signer(), Signer()
+        key1 = derive_session_key(alice, bob.get_transferable_public_key())
+        key2 = derive_session_key(alice, carol.get_transferable_public_key())
+        assert key1 != key2
+
+    def test_derive_session_key_requires_ec_keys(self):
+        alice, bob = Signer(schemes=(ED25519,)), Signer()
+        with pytest.raises(NoSessionKeyException):
+            derive_session_key(alice, bob.get_transferable_public_key())
+        with pytest.raises(NoSessionKeyException):
+            derive_session_key(bob, alice.get_transferable_public_key())
+
+    def test_derive_session_key_secondary_ec_key(self):
+        alice, bob = Signer(schemes=(ED25519, ECDSA)), Signer()
+        alice_key = derive_session_key(alice, bob.get_transferable_public_key())
+        bob_key = derive_session_key(
+            bob, alice.get_transferable_public_key(scheme=ECDSA)
+        )
+        assert alice_key == bob_key
+
+    def test_authenticate(self):
+        key = derive_session_key(Signer(), Signer().get_transferable_public_key())
+        payload = b"some bytes"
+        mac = authenticate(key, payload)
+        assert verify_authentication(key, payload, mac)
+        assert not verify_authentication(key, b"other bytes", mac)
+        assert not verify_authentication(bytes(len(key)), payload, mac)
+
+    def test_encrypt(self):
+        key = generate_key()
+        payload = b"some bytes"
+        ciphertext = encrypt(key, payload, b"topic")
+        assert payload not in ciphertext
+        assert decrypt(key, ciphertext, b"topic") == payload
+        with pytest.raises(InvalidTag):
+            decrypt(generate_key(), ciphertext, b"topic")
+        with pytest.raises(InvalidTag):
+            decrypt(key, ciphertext, b"other topic")
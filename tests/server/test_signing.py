@@ -1,7 +1,13 @@
 import pickle
 
 import pytest
-from src.private_billing.server.signing import Signer, TransferablePublicKey
+from src.private_billing.server.signing import (
+    ECDSA,
+    ED25519,
+    Signature,
+    Signer,
+    TransferablePublicKey,
+)
 from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.primitives.asymmetric import ec
 
@@ -108,3 +114,67 @@ class TestSigner:
 
         # Verify signature
         signer.verify(rebuilt_obj, rebuilt_signature, rebuilt_key)
+
+
+class TestPublicKeyCache:
+
+    def test_public_key_parsed_once(self):
+        tpk = Signer().get_transferable_public_key()
+        rebuilt = TransferablePublicKey.from_bytes(tpk.public_key_bytes)
+        assert rebuilt.public_key is rebuilt.public_key
+
+    def test_public_key_shared_across_equal_keys(self):
+        tpk = Signer().get_transferable_public_key()
+        key1 = TransferablePublicKey.from_bytes(tpk.public_key_bytes)
+        key2 = TransferablePublicKey.from_bytes(tpk.public_key_bytes)
+        assert key1 == key2
+        assert key1.public_key is key2.public_key
+
+    def test_pickle_drops_parsed_key(self):
+        signer = Signer()
+        tpk = signer.get_transferable_public_key()
+        state = tpk.__getstate__()
+        assert "_public_key" not in state
+
+        # Rebuilt key still verifies
+        rebuilt = TransferablePublicKey.from_bytes(tpk.public_key_bytes)
+        rebuilt.__dict__.update(state)
+        obj = b"some bytes"
+        assert rebuilt.verify_signature(obj, signer.sign(obj))
+
+
+class TestSignatureSchemes:
+
+    @pytest.mark.parametrize("scheme", (ECDSA, ED25519))
+    def test_sign_verify(self, scheme):
+        obj = b"some bytes"
+        signer = Signer(schemes=(scheme,))
+        signature = signer.sign(obj)
+        assert signature.scheme == scheme
+        signer.verify(obj, signature, signer.get_transferable_public_key())
+
+    def test_signature_bytes_roundtrip(self):
+        signature = Signer(schemes=(ED25519,)).sign(b"some bytes")
+        assert Signature.from_bytes(signature.to_bytes()) == signature
+
+    def test_sign_with_secondary_scheme(self):
+        obj = b"some bytes"
+        signer = Signer(schemes=(ED25519, ECDSA))
+        signature = signer.sign(obj, scheme=ECDSA)
+        key = signer.get_transferable_public_key(scheme=ECDSA)
+        signer.verify(obj, signature, key)
+
+    def test_does_not_verify_under_other_scheme_key(self):
+        obj = b"some bytes"
+        signer = Signer(schemes=(ED25519, ECDSA))
+        signature = signer.sign(obj, scheme=ED25519)
+        key = signer.get_transferable_public_key(scheme=ECDSA)
+        assert not key.verify_signature(obj, signature)
+
+    @pytest.mark.parametrize(
+        "accepted, expected",
+        (((ECDSA, ED25519), ED25519), ((ECDSA,), ECDSA), ((), ED25519)),
+    )
+    def test_select_scheme(self, accepted, expected):
+        signer = Signer(schemes=(ED25519, ECDSA))
+        assert signer.select_scheme(accepted) == expected
@@ -0,0 +1,86 @@
+from threading import Event
+import time
+
+from src.private_billing.billing_scheduler import BillingPriority, BillingScheduler
+
+
+def wait_for(condition, timeout: float = 3.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+class TestBillingScheduler:
+
+    def test_inline(self):
+        billed = []
+        scheduler = BillingScheduler(billed.append, workers=0)
+        scheduler.trigger(1)
+        assert billed == [1]
+        assert scheduler.finished[1].run_time is not None
+
+    def test_order(self):
+        release, billed = Event(), []
+
+        def run(cycle_id):
+            if cycle_id == 0:
+                release.wait()
+            billed.append(cycle_id)
+
+        scheduler = BillingScheduler(run)
+        scheduler.trigger(0)
+        wait_for(lambda: 0 in scheduler.running)
+
+        now = time.monotonic()
+        scheduler.trigger(1, BillingPriority.BACKFILL, deadline=now)
+        scheduler.trigger(3, BillingPriority.LIVE, deadline=now + 20)
+        scheduler.trigger(2, BillingPriority.LIVE, deadline=now + 10)
+        release.set()
+        wait_for(lambda: len(billed) == 4)
+        scheduler.close()
+
+        # Live before backfill, earliest deadline first
+        assert billed == [0, 2, 3, 1]
+        assert scheduler.finished[1].queue_time > scheduler.finished[2].queue_time
+
+    def test_debounce_coalesces_triggers(self):
+        billed = []
+        scheduler = BillingScheduler(billed.append, debounce=0.1)
+        for _ in range(5):
+            scheduler.trigger(1)
+        wait_for(lambda: 1 in scheduler.finished)
+        scheduler.close()
+
+        assert billed == [1]
+        assert scheduler.finished[1].triggers == 5
+        assert scheduler.finished[1].queue_time >= 0.1
+
+    def test_trigger_while_running(self):
+        release, billed = Event(), []
+
+        def run(cycle_id):
+            release.wait()
+            billed.append(cycle_id)
+
+        scheduler = BillingScheduler(run, workers=2)
+        scheduler.trigger(1)
+        wait_for(lambda: 1 in scheduler.running)
+
+        # Triggers during the run result in a single follow-up run
+        scheduler.trigger(1)
+        scheduler.trigger(1)
+        time.sleep(0.05)
+        release.set()
+        wait_for(lambda: len(billed) == 2 and not scheduler.running)
+        time.sleep(0.05)
+        scheduler.close()
+
+        assert billed == [1, 1]
+
+    def test_failed_run(self):
+        def run(cycle_id):
+            raise ValueError()
+
+        scheduler = BillingScheduler(run, workers=0)
+        scheduler.trigger(1)
+        assert scheduler.finished[1].failed
@@ -0,0 +1,107 @@
+from threading import Thread
+
+import pytest
+from src.private_billing.core_host import CoreHost
+from src.private_billing.messages import (
+    BillingMessageType,
+    GetBillMessage,
+    UserType,
+)
+from src.private_billing.server import (
+    Envelope,
+    HostedAddress,
+    PickleEncoder,
+    RequestRejectedException,
+    TCPAddress,
+)
+from src.private_billing import CoreServer
+
+
+class TestCoreHost:
+
+    def get_bill_frames(self, recipient):
+        sender = TCPAddress("localhost", 1234)
+        payload = PickleEncoder.encode(GetBillMessage(sender, 0))
+        message_type = BillingMessageType.GET_BILL.value
+        return Envelope(sender, payload, None, message_type, recipient=recipient)
+
+    def test_add_core(self):
+        host = CoreHost(TCPAddress("localhost", 5594))
+        a, b = host.add_core("a"), host.add_core("b")
+
+        assert a.address == HostedAddress(host.address, "a")
+        assert a.role == UserType.CORE
+        assert a.id != b.id
+        for core in (a, b):
+            assert core.sock is host.sock
+            assert core.connections is host.connections
+            assert core.context is host.context
+            assert core.decode_pool is host.decode_pool
+            assert core.lanes is host.lanes
+
+    def test_routes_by_recipient(self):
+        host = CoreHost(TCPAddress("localhost", 5594))
+        replies = {name: [] for name in ("a", "b")}
+        for name, handled in replies.items():
+            host.add_core(name).reply = handled.append
+
+        host._handle_frames(self.get_bill_frames("b").to_frames())
+
+        assert replies["a"] == []
+        [reply] = replies["b"]
+        assert reply.reply_address == HostedAddress(host.address, "b")
+
+    def test_rejects_unknown_recipient(self):
+        host = CoreHost(TCPAddress("localhost", 5594))
+        host.add_core("a").reply = lambda msg: None
+        rejected = []
+        host.reject = lambda: rejected.append(True)
+
+        host._handle_frames(self.get_bill_frames("c").to_frames())
+        host._handle_frames(self.get_bill_frames(None).to_frames())
+        assert len(rejected) == 2
+
+    @pytest.mark.parametrize(
+        "frames",
+        [
+            [PickleEncoder.encode(GetBillMessage(None, 0))],
+            [b"garbage"],
+            [b"garbage", b"payload"],
+        ],
+    )
+    def test_rejects_malformed_frames(self, frames):
+        host = CoreHost(TCPAddress("localhost", 5594))
+        host.add_core("a").reply = lambda msg: pytest.fail("routed to core")
+        rejected = []
+        host.reject = lambda: rejected.append(True)
+
+        host._handle_frames(frames)
+        assert rejected == [True]
+
+    def test_send_to_hosted_core(self):
+        host = CoreHost(TCPAddress("localhost", 5595))
+        host.add_core("a")
+        host.add_core("b")
+        # Run the host, without connecting to an edge
+        thread = Thread(target=super(CoreHost, host).start, args=(host.address, 100))
+        thread.start()
+
+        sender = CoreServer(TCPAddress("localhost", 5596))
+        try:
+            target = HostedAddress(TCPAddress("localhost", 5595), "b")
+            msg = GetBillMessage(sender.address, 0)
+            reply = sender.send_async(msg, target).result()
+            assert PickleEncoder.decode(reply).reply_address == target
+
+            # Hosted cores are reached over a single connection
+            assert list(sender.connections.connections) == [target.host]
+
+            # Messages that name no hosted core are rejected
+            with pytest.raises(RequestRejectedException):
+                sender.send_frames([PickleEncoder.encode(msg)], target.host)
+        finally:
+            host.terminate()
+            thread.join()
+            for server in (host, sender):
+                server.connections.close()
+                server.sock.close()
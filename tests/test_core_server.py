@@ -1,18 +1,58 @@
+from concurrent.futures import Future
+from dataclasses import replace
 import random
+from threading import Event, Thread
+from cryptography.exceptions import InvalidTag
 import pytest
-from src.private_billing.network import NodeInfo, NoValidSignatureException
-from src.private_billing.server import TCPAddress, PickleEncoder, Signer
-from src.private_billing.core import Bill
-from src.private_billing import CoreServer
+from src.private_billing.network import (
+    BILLING_LANE,
+    CONTROL_LANE,
+    MembershipRegistry,
+    NodeInfo,
+    NoValidSignatureException,
+    PeerToPeerBillingBaseServer,
+)
+from src.private_billing.server import (
+    BUSY,
+    ECDSA,
+    ED25519,
+    Envelope,
+    HostedAddress,
+    Lane,
+    RequestReplyServer,
+    ServerBusyException,
+    TCPAddress,
+    PickleEncoder,
+    Signer,
+    authenticate,
+    derive_session_key,
+    generate_key,
+)
+from src.private_billing.core import Bill, Data, vector
+from src.private_billing import CoreServer, open_bill
+from src.private_billing.core_server import IngestionProgress
+from src.private_billing.message_encoding import BinaryEncoder
 from src.private_billing.messages import (
+    BatchResultMessage,
+    BillMessage,
+    BillingMessageType,
     ConnectMessage,
+    DataBatchMessage,
+    DataMessage,
+    GetBillMessage,
     HiddenBillMessage,
+    HiddenDataBatchMessage,
+    HiddenDataMessage,
     Message,
+    RosterCompleteMessage,
+    RosterMessage,
     SeedMessage,
-    SignedMessage,
+    SlotDataMessage,
     UserType,
 )
 from tests.core.tools import HiddenBillMock
+from tests.server.test_lanes import wait_for
+from tests.test_edge_server import PublisherMock
 
 
 class BaseCoreServerMock(CoreServer):
@@ -22,12 +62,21 @@ class BaseCoreServerMock(CoreServer):
         # Store responses and sent messages
         self.__replies__ = []
         self.__sent__ = []
+        self.__sent_frames__ = []
 
-    def async_execute(self, handler, *args) -> None:
+    def dispatch(self, message_type, handler, *args) -> None:
         self.execute(handler, *args)
 
-    def send(self, message: Message, target: NodeInfo):
+    def send_async(self, message: Message, target: NodeInfo, sign: bool = True):
         self.__sent__.append((message, target))
+        future = Future()
+        future.set_result(b"")
+        return future
+
+    def send_frames_async(self, frames, target: TCPAddress):
+        self.__sent_frames__.append(frames)
+        envelope = Envelope.from_frames(frames)
+        return self.send_async(self.encoder.decode(envelope.payload), target)
 
     def reply(self, msg: Message) -> None:
         pass
@@ -37,6 +86,18 @@ class BaseCoreServerMock(CoreServer):
         return self.__sent__
 
 
+class LaneCoreServerMock(BaseCoreServerMock):
+    """Handles messages on its lanes, rather than right away."""
+
+    dispatch = CoreServer.dispatch
+
+
+class ServingCoreServerMock(CoreServer):
+    """Serves requests, without connecting to an edge first."""
+
+    start = PeerToPeerBillingBaseServer.start
+
+
 class TestCoreServer:
 
     def random_node(self, role=UserType.CORE):
@@ -88,6 +149,151 @@ class TestCoreServer:
         if role == UserType.CORE:
             assert any(filter(lambda x: x[1].address == other_address, seed_msgs))
 
+    def test_handle_connect_in_sync(self):
+        response_address = TCPAddress("someaddress", 1234)
+        peer = BaseCoreServerMock(response_address)
+
+        # Connecting party already knows all members the target knows
+        address, _, pk, node = self.random_node(UserType.EDGE)
+        view = MembershipRegistry(node)
+        view.register(peer._node_info)
+        msg = ConnectMessage(
+            address, pk, UserType.EDGE, {address: node}, {}, digest=view.digest
+        )
+        peer.handle_connect(msg, node)
+
+        assert peer.network_members[address] == node
+        assert not any(isinstance(m, ConnectMessage) for m, _ in peer._sent)
+
+    def test_handle_connect_sends_missing_members(self):
+        response_address = TCPAddress("someaddress", 1234)
+        peer = BaseCoreServerMock(response_address)
+        other_address, _, _, other_node = self.random_node(UserType.EDGE)
+        peer.register_node(other_node)
+
+        # Connecting party does not know the other member
+        address, _, pk, node = self.random_node(UserType.EDGE)
+        view = MembershipRegistry(node)
+        view.register(peer._node_info)
+        network_state = {address: node, response_address: peer._node_info}
+        msg = ConnectMessage(
+            address, pk, UserType.EDGE, network_state, {}, digest=view.digest
+        )
+        peer.handle_connect(msg, node)
+
+        connect_msgs = [m for m, _ in peer._sent if isinstance(m, ConnectMessage)]
+        assert len(connect_msgs) == 1
+        reply = connect_msgs[0]
+        assert set(reply.network_state) == {response_address, other_address}
+        assert reply.version == peer.network_members.version
+        assert reply.digest == peer.network_members.digest
+
+        # The same views are not synchronized twice
+        peer.handle_connect(msg, node)
+        connect_msgs = [m for m, _ in peer._sent if isinstance(m, ConnectMessage)]
+        assert len(connect_msgs) == 1
+
+    def test_handle_roster(self):
+        response_address = TCPAddress("someaddress", 1234)
+        peer = BaseCoreServerMock(response_address)
+
+        # Roster of an edge and two other cores
+        nodes = [
+            NodeInfo(
+                TCPAddress("localhost", port),
+                Signer().get_transferable_public_key(),
+                role,
+            )
+            for port, role in (
+                (701, UserType.EDGE),
+                (702, UserType.CORE),
+                (703, UserType.CORE),
+            )
+        ]
+        network_state = {node.address: node for node in nodes}
+        network_state[response_address] = peer._node_info
+        edge = nodes[0]
+        msg = RosterMessage(edge.address, network_state, {"cycle_length": 1000})
+        peer.handle_roster(msg, edge)
+
+        # Members are registered, without connecting to them
+        assert peer.network_members.keys() == network_state.keys()
+        assert peer.hc is not None
+        assert peer._sent == []
+
+        # Once all cores hold the roster, seeds are sent to the cores that joined
+        joined = [nodes[1].address, nodes[2].address, response_address]
+        complete = RosterCompleteMessage(edge.address, 1, joined)
+        peer.handle_roster_complete(complete, edge)
+        seeded = [t.address for m, t in peer._sent if isinstance(m, SeedMessage)]
+        assert set(seeded) == {nodes[1].address, nodes[2].address}
+
+        # But only once
+        peer.handle_roster_complete(complete, edge)
+        assert len(peer._sent) == 2
+
+    def test_handle_connect_follows_publisher(self):
+        response_address = TCPAddress("someaddress", 1234)
+        peer = BaseCoreServerMock(response_address)
+
+        address, _, pk, node = self.random_node(UserType.EDGE)
+        billing_state = {"cycle_length": 1000, "publish_port": 5593}
+        msg = ConnectMessage(address, pk, UserType.EDGE, {address: node}, billing_state)
+        peer.handle_connect(msg, node)
+
+        subscription = peer.subscriptions[address]
+        assert subscription.address == TCPAddress(address.interface, 5593)
+        assert subscription.last_sequence is None
+        peer.close_channels()
+        assert peer.subscriptions == {}
+
+    def test_handle_connect_follows_publisher_from_sequence(self):
+        response_address = TCPAddress("someaddress", 1234)
+        peer = BaseCoreServerMock(response_address)
+
+        # The edge announces the last sequence number it published
+        address, _, pk, node = self.random_node(UserType.EDGE)
+        billing_state = {"publish_port": 5593, "publish_sequence": 7}
+        msg = ConnectMessage(address, pk, UserType.EDGE, {address: node}, billing_state)
+        peer.handle_connect(msg, node)
+
+        # Hence, messages published before the subscription connected are replayed
+        subscription = peer.subscriptions[address]
+        gaps = []
+        subscription.on_gap = lambda first, last: gaps.append((first, last))
+        subscription.on_message = lambda *args: None
+        subscription.receive(b"", 10, [])
+        assert gaps == [(8, 9)]
+        peer.close_channels()
+
+    def test_handle_published(self):
+        response_address = TCPAddress("someaddress", 1234)
+        peer = BaseCoreServerMock(response_address)
+        peer.encoder = BinaryEncoder
+        address, signer, pk, edge = self.random_node(UserType.EDGE)
+        peer.register_node(edge)
+
+        # Published messages are handled like any other message
+        core = self.random_node()[3]
+        network_state = {edge.address: edge, core.address: core}
+        msg = RosterMessage(address, network_state, {"cycle_length": 1000})
+        payload = peer.encoder.encode(msg)
+        envelope = Envelope(address, payload, signer.sign(payload), msg.type.value)
+        peer._handle_published(msg.type.value.encode(), 1, envelope.to_frames())
+
+        assert peer.network_members[core.address] == core
+        assert peer.hc is not None
+
+    def test_request_replay(self):
+        response_address = TCPAddress("someaddress", 1234)
+        peer = BaseCoreServerMock(response_address)
+        address = TCPAddress("localhost", 701)
+
+        peer.request_replay(address, 3, 5)
+
+        [(msg, target)] = peer._sent
+        assert (msg.first, msg.last, target) == (3, 5, address)
+
     def test_handle_seed_requires_signature(self):        
         # Create target
         msg = SeedMessage(None, 5)
@@ -104,7 +310,7 @@ class TestCoreServer:
         seed_msg = SeedMessage(address, seed)
         seed_msg_bytes = PickleEncoder.encode(seed_msg)
         sgn = signer.sign(seed_msg_bytes)
-        msg = SignedMessage(seed_msg_bytes, sgn)
+        msg = Envelope(address, seed_msg_bytes, sgn)
 
         # Create target
         response_address = TCPAddress("someaddress", 1234)
@@ -126,6 +332,283 @@ class TestCoreServer:
         assert response.seed != None
         assert target == sender
 
+    def test_handle_seed_frames(self):
+        # Define sending party
+        seed = 123456789101010
+        address, signer, _, sender = self.random_node(UserType.CORE)
+        seed_msg = SeedMessage(address, seed)
+        seed_msg_bytes = PickleEncoder.encode(seed_msg)
+        sgn = signer.sign(seed_msg_bytes)
+        frames = Envelope(address, seed_msg_bytes, sgn, seed_msg.type.value).to_frames()
+
+        # Create target
+        response_address = TCPAddress("someaddress", 1234)
+        peer = BaseCoreServerMock(response_address)
+        peer.network_members[address] = sender
+
+        # Handle raw frames, decoding off the receive loop
+        peer._handle_frames(frames)
+
+        # Check state is properly updated
+        assert peer.mg.foreign_seeds[sender.id] == seed
+
+    def test_handle_seed_frames_invalid_signature(self):
+        # Define sending party, signing with an unknown key
+        address, _, _, sender = self.random_node(UserType.CORE)
+        seed_msg = SeedMessage(address, 5)
+        seed_msg_bytes = PickleEncoder.encode(seed_msg)
+        sgn = Signer().sign(seed_msg_bytes)
+        frames = Envelope(address, seed_msg_bytes, sgn, seed_msg.type.value).to_frames()
+
+        # Create target
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.network_members[address] = sender
+
+        # Handle raw frames
+        peer._handle_frames(frames)
+
+        # Check message is dropped
+        assert not peer.mg.foreign_seeds
+        assert len(peer._sent) == 0
+
+    def test_handle_frames_type_mismatch(self):
+        # Define sending party, naming another message type in the header
+        address, signer, _, sender = self.random_node(UserType.CORE)
+        msg = GetBillMessage(address, 0)
+        msg_bytes = PickleEncoder.encode(msg)
+        sgn = signer.sign(msg_bytes)
+        header_type = BillingMessageType.SEED.value
+        frames = Envelope(address, msg_bytes, sgn, header_type).to_frames()
+
+        # Create target
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.network_members[address] = sender
+        handled = []
+        peer.handle_get_bill = lambda *args: handled.append(args)
+
+        # Handle raw frames
+        peer._handle_frames(frames)
+
+        # Check message is dropped
+        assert handled == []
+
+    def test_handle_frames_malformed(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        rejected = []
+        peer.reject = lambda: rejected.append(True)
+
+        # Handle a truncated header
+        peer._handle_frames([b"\x02", b"payload"])
+
+        # Check message is rejected
+        assert rejected == [True]
+
+    def test_invalid_signature_dropped_before_decoding(self):
+        # Define sending party, signing with another key, and a payload that
+        # cannot be decoded
+        address, _, _, sender = self.random_node(UserType.CORE)
+        payload = b"not a message"
+        sgn = Signer().sign(payload)
+        header_type = BillingMessageType.SEED.value
+        envelope = Envelope(address, payload, sgn, header_type)
+
+        # Create target
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.network_members[address] = sender
+
+        # Check message is dropped without decoding
+        assert peer.verify_signature(envelope) == (None, False)
+        with pytest.raises(NoValidSignatureException):
+            peer._handle(envelope)
+
+    def test_handle_seed_ed25519(self):
+        # Define sending party, signing with its secondary Ed25519 key
+        address = TCPAddress("localhost", 2345)
+        signer = Signer(schemes=(ECDSA, ED25519))
+        keys = signer.get_transferable_public_keys()
+        sender = NodeInfo(address, signer.get_transferable_public_key(), UserType.CORE, keys)
+        seed_msg = SeedMessage(address, 5)
+        seed_msg_bytes = PickleEncoder.encode(seed_msg)
+        sgn = signer.sign(seed_msg_bytes, scheme=ED25519)
+
+        # Create target
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.network_members[address] = sender
+
+        # Handle message
+        peer._handle(Envelope(address, seed_msg_bytes, sgn))
+
+        # Check signature was accepted
+        assert peer.mg.foreign_seeds[sender.id] == 5
+
+    def test_select_scheme(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        signer = Signer(schemes=(ED25519, ECDSA))
+        keys = signer.get_transferable_public_keys()
+        node = NodeInfo(TCPAddress("localhost", 2345), keys[ED25519], UserType.CORE, keys)
+
+        # The peer only has an ECDSA key, which the node accepts
+        assert peer.select_scheme(node) == ECDSA
+
+        # The node prefers Ed25519, which the peer accepts
+        assert signer.select_scheme(peer._node_info.signing_keys) == ECDSA
+        assert signer.select_scheme(node.signing_keys) == ED25519
+
+    def test_lanes(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        for message_type in (BillingMessageType.CONNECT, BillingMessageType.SEED):
+            assert peer.lanes.lane_for(message_type).name == CONTROL_LANE
+        for message_type in (BillingMessageType.DATA, BillingMessageType.HIDDEN_BILL):
+            assert peer.lanes.lane_for(message_type).name == BILLING_LANE
+
+    def test_full_billing_lane_rejects_without_blocking(self):
+        peer = LaneCoreServerMock(TCPAddress("someaddress", 1234))
+        replies = []
+        peer.reply = replies.append
+        peer.reply_busy = lambda: replies.append(BUSY)
+
+        # Fill up the billing lane
+        release = Event()
+        billing = Lane(BILLING_LANE, max_queue=1)
+        peer.lanes.lanes[BILLING_LANE] = billing
+        billing.submit(release.wait)
+        wait_for(lambda: billing.stats().depth == 0)
+        billing.submit(lambda: None)
+
+        # Data is rejected, as the billing lane is full
+        address, signer, _, sender = self.random_node(UserType.CORE)
+        peer.network_members[address] = sender
+        data_msg_bytes = PickleEncoder.encode(DataMessage(address, None))
+        peer._handle_frames(
+            Envelope(address, data_msg_bytes, None, "data").to_frames()
+        )
+        assert replies == [BUSY]
+
+        # Control messages are still handled
+        seed_msg_bytes = PickleEncoder.encode(SeedMessage(address, 5))
+        sgn = signer.sign(seed_msg_bytes)
+        peer._handle_frames(
+            Envelope(address, seed_msg_bytes, sgn, "seed").to_frames()
+        )
+        assert replies == [BUSY, ""]
+        wait_for(lambda: sender.id in peer.mg.foreign_seeds)
+        assert peer.mg.foreign_seeds[sender.id] == 5
+
+        release.set()
+        peer.lanes.close()
+
+    def test_full_billing_lane_rejection_reaches_sender(self):
+        # Run target, with a full billing lane
+        address = TCPAddress("localhost", 5574)
+        peer = ServingCoreServerMock(address)
+        release = Event()
+        billing = Lane(BILLING_LANE, max_queue=1)
+        peer.lanes.lanes[BILLING_LANE] = billing
+        billing.submit(release.wait)
+        wait_for(lambda: billing.stats().depth == 0)
+        billing.submit(lambda: None)
+        thread = Thread(target=peer.start, args=(100,))
+        thread.start()
+
+        # The sender sees the rejection, once its retry is rejected too
+        sender = RequestReplyServer(PickleEncoder, busy_retries=1, busy_backoff=0.01)
+        msg = DataMessage(TCPAddress("localhost", 2345), None)
+        deliveries = sender.broadcast(msg, [address])
+        assert not deliveries[address].ok
+        assert isinstance(deliveries[address].error, ServerBusyException)
+        assert billing.stats().rejected == 2
+
+        release.set()
+        sender.terminate()
+        peer.terminate()
+        thread.join(3)
+        peer.lanes.close()
+
+    def test_broadcast_signs_once(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        nodes = [self.random_node(UserType.EDGE)[3] for _ in range(3)]
+        for node in nodes:
+            peer.register_node(node)
+
+        # Record signing operations
+        signer, signatures = peer.signer, []
+
+        def sign(*args, **kwargs):
+            signatures.append(Signer.sign(signer, *args, **kwargs))
+            return signatures[-1]
+
+        signer.sign = sign
+
+        peer.broadcast(SeedMessage(peer.address, 5), nodes)
+
+        # All targets receive the same bytes, signed once
+        sent_frames = peer.__sent_frames__
+        assert len(signatures) == 1
+        assert len(sent_frames) == 3
+        assert all(frames == sent_frames[0] for frames in sent_frames)
+
+    def test_broadcast_names_hosted_recipients(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        host = TCPAddress("corehost", 1234)
+        nodes = [
+            replace(self.random_node(UserType.CORE)[3], address=address)
+            for address in (HostedAddress(host, "a"), TCPAddress("other", 1234))
+        ]
+        for node in nodes:
+            peer.register_node(node)
+
+        peer.broadcast(SeedMessage(peer.address, 5), nodes)
+
+        recipients = [Envelope.from_frames(f).recipient for f in peer.__sent_frames__]
+        assert set(recipients) == {"a", None}
+
+    def test_handle_seed_session_authenticated(self):
+        # Define sending party
+        address, signer, _, sender = self.random_node(UserType.CORE)
+
+        # Create target
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.network_members[address] = sender
+
+        # Sender authenticates with the shared session key
+        session_key = derive_session_key(signer, peer.pk)
+        seed_msg_bytes = PickleEncoder.encode(SeedMessage(address, 5))
+        mac = authenticate(session_key, seed_msg_bytes)
+        peer._handle(Envelope(address, seed_msg_bytes, mac=mac))
+
+        # Check state is properly updated
+        assert peer.mg.foreign_seeds[sender.id] == 5
+
+    def test_handle_seed_session_invalid_mac(self):
+        # Define sending party
+        address, _, _, sender = self.random_node(UserType.CORE)
+
+        # Create target
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.network_members[address] = sender
+
+        # Authenticate with a key not shared with the target
+        session_key = derive_session_key(Signer(), peer.pk)
+        seed_msg_bytes = PickleEncoder.encode(SeedMessage(address, 5))
+        mac = authenticate(session_key, seed_msg_bytes)
+        with pytest.raises(NoValidSignatureException):
+            peer._handle(Envelope(address, seed_msg_bytes, mac=mac))
+
+    def test_handle_connect_opens_session(self):
+        # Create target, using session authentication
+        response_address = TCPAddress("someaddress", 1234)
+        peer = BaseCoreServerMock(response_address)
+        peer.session_authentication = True
+
+        # Connecting party already knows the target
+        address, _, pk, node = self.random_node(UserType.CORE)
+        network_state = {address: node, response_address: peer._node_info}
+        msg = ConnectMessage(address, pk, UserType.CORE, network_state, {})
+        peer.handle_connect(msg, node)
+
+        assert address in peer.session_peers
+        assert peer.session_keys[address]
+
     def test_handle_receive_bill_requires_signature(self):        
         # Create target
         msg = HiddenBillMessage(None, None)
@@ -145,7 +628,7 @@ class TestCoreServer:
         bill_msg = HiddenBillMessage(address, hidden_bill)
         bill_msg_bytes = PickleEncoder.encode(bill_msg)
         sgn = signer.sign(bill_msg_bytes)
-        signed_msg = SignedMessage(bill_msg_bytes, sgn)
+        signed_msg = Envelope(address, bill_msg_bytes, sgn)
 
         class CoreMock(BaseCoreServerMock):
             def verify_signature(self, msg):
@@ -168,3 +651,196 @@ class TestCoreServer:
 
         # Check signature is verified
         assert peer_server.verify_called
+
+    def test_handle_get_bill(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        replies = []
+        peer.reply = replies.append
+        peer.bills[0] = Bill(0, "test1", "test2")
+
+        peer.handle_get_bill(GetBillMessage(None, 0), None)
+        peer.handle_get_bill(GetBillMessage(None, 1), None)
+
+        assert replies == [
+            BillMessage(peer.address, Bill(0, "test1", "test2")),
+            BillMessage(peer.address, None),
+        ]
+
+    def test_publishes_bill(self):
+        bill_key = generate_key()
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.bill_key = bill_key
+        peer.bill_publisher = PublisherMock()
+        address, _, _, edge = self.random_node(UserType.EDGE)
+
+        hidden_bill = HiddenBillMock(0, "test1", "test2")
+        peer.handle_hidden_bill(HiddenBillMessage(address, hidden_bill), edge)
+
+        # The revealed bill is pushed to subscribers, encrypted
+        [(topic, frames)] = peer.bill_publisher.published
+        assert topic == BillingMessageType.BILL.value.encode()
+        assert b"test1" not in b"".join(frames)
+        bill_msg = open_bill(topic, frames, bill_key)
+        assert bill_msg == BillMessage(peer.address, Bill(0, "test1", "test2"))
+
+        # Only the household can open it
+        with pytest.raises(InvalidTag):
+            open_bill(topic, frames, generate_key())
+
+        # But not announced to peers
+        assert "publish_port" not in peer.billing_state
+
+    def test_bill_channel_requires_key(self):
+        with pytest.raises(ValueError):
+            CoreServer(TCPAddress("someaddress", 1234), bill_port=5600)
+
+    def test_handle_data_batch(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        replies = []
+        peer.reply = replies.append
+        peer.hide_data = lambda data: data
+        self.accept_batches(peer)
+        edge = self.random_node(UserType.EDGE)[3]
+        peer.register_node(edge)
+
+        batch = [
+            Data(None, cycle_id, vector.new(4, 1.0), vector.new(4, 2.0))
+            for cycle_id in range(2)
+        ]
+        invalid = Data(None, 2, vector.new(3, 1.0), vector.new(3, 2.0))
+        msg = DataBatchMessage(None, [batch[0], invalid, batch[1]])
+
+        # Nothing can be hidden before the hiding context is set up
+        peer._handle(msg)
+        [result] = replies
+        assert isinstance(result, BatchResultMessage)
+        assert result.accepted == 0
+        assert peer._sent == []
+
+        # The outcome is reported per record
+        peer.init_hiding_context({"cycle_length": 4})
+        peer._handle(msg)
+        errors = replies[-1].errors
+        assert errors[0] is None and errors[2] is None
+        assert "ValueError" in errors[1]
+
+        # The accepted records are forwarded in a single batch
+        [(sent, target)] = peer._sent
+        assert sent == HiddenDataBatchMessage(peer.address, batch)
+        assert target == edge.address
+
+    def test_record_slots(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        edge = self.random_node(UserType.EDGE)[3]
+        peer.register_node(edge)
+        broadcasts = []
+        peer.broadcast = lambda msg, targets: broadcasts.append((msg, list(targets)))
+
+        # Nothing can be hidden before the hiding context is set up
+        with pytest.raises(ValueError):
+            peer.record_slots(1, 0, [1.0], [1.0])
+
+        peer.init_hiding_context({"cycle_length": 4})
+        peer._handle(SlotDataMessage(None, 1, 0, [1.0, -1.0], [0.5, -1.0]))
+        assert peer.open_cycles[1].slots == 2
+        assert broadcasts == []
+
+        # Readings must continue the open cycle
+        with pytest.raises(ValueError):
+            peer.record_slots(1, 3, [1.0], [1.0])
+        with pytest.raises(ValueError):
+            peer.record_slots(1, 2, [1.0, 1.0, 1.0], [1.0, 1.0, 1.0])
+
+        # The completed cycle is hidden, and forwarded to the edges
+        peer._handle(SlotDataMessage(None, 1, 2, [0.0, 2.0], [0.0, 2.5]))
+        assert 1 not in peer.open_cycles
+        [(msg, targets)] = broadcasts
+        assert isinstance(msg, HiddenDataMessage)
+        assert (msg.data.client, msg.data.cycle_id) == (peer.id, 1)
+        assert msg.data.masked_p2p_consumer_flags == [1, 0, 0, 1]
+        assert targets == [edge]
+
+    def accept_batches(self, peer, reject=lambda data: False):
+        """Reply to batches like an edge, rejecting the records `reject` holds for."""
+        sent, encoder = peer.__sent__, peer.encoder
+
+        def send_async(message, target, sign=True):
+            sent.append((message, target))
+            errors = ["ValueError()" if reject(data) else None for data in message.data]
+            future = Future()
+            future.set_result(encoder.encode(BatchResultMessage(target, errors)))
+            return future
+
+        peer.send_async = send_async
+
+    def test_ingest(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.hide_data = lambda data: data
+        self.accept_batches(peer)
+        edge = self.random_node(UserType.EDGE)[3]
+        peer.register_node(edge)
+
+        data = [
+            Data(None, cycle_id, vector.new(4, 1.0), vector.new(4, 2.0))
+            for cycle_id in range(5)
+        ]
+        reports = []
+        state = peer.ingest(
+            data, batch_size=2, progress=lambda p: reports.append(p.hidden)
+        )
+
+        # Data is streamed to the edge in batches, reporting progress per batch
+        sent = [msg.data for msg, _ in peer._sent]
+        assert sent == [data[0:2], data[2:4], data[4:5]]
+        assert reports == [2, 4, 5]
+        assert state == IngestionProgress(hidden=5, delivered=5, failed=0, total=5)
+
+    def test_ingest_requeues_rejected_records(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.hide_data = lambda data: data
+        edges = [self.random_node(UserType.EDGE)[3] for _ in range(2)]
+        for edge in edges:
+            peer.register_node(edge)
+
+        # The first edge rejects cycle 1 once, and cycle 2 always
+        rejections = {(edges[0].address, 1): 1, (edges[0].address, 2): 4}
+
+        sent = peer._sent
+
+        def reject(data):
+            key = (sent[-1][1], data.cycle_id)
+            rejections[key] = rejections.get(key, 0) - 1
+            return rejections[key] >= 0
+
+        self.accept_batches(peer, reject)
+        data = [
+            Data(None, cycle_id, vector.new(4, 1.0), vector.new(4, 2.0))
+            for cycle_id in range(3)
+        ]
+        state = peer.ingest(data, batch_size=3, backoff=0)
+
+        # Only the rejected records are resent, and only to the rejecting edge
+        retries = [(msg.data, target) for msg, target in peer._sent[2:]]
+        assert retries[0] == ([data[1], data[2]], edges[0].address)
+        assert retries[1:] == [([data[2]], edges[0].address)] * 2
+        assert state == IngestionProgress(
+            hidden=3, delivered=2, failed=1, retried=4, total=3
+        )
+
+    def test_ingest_reports_failed_batches(self):
+        peer = BaseCoreServerMock(TCPAddress("someaddress", 1234))
+        peer.hide_data = lambda data: data
+        peer.register_node(self.random_node(UserType.EDGE)[3])
+
+        def fail(message, target, sign=True):
+            future = Future()
+            future.set_exception(TimeoutError())
+            return future
+
+        peer.send_async = fail
+        data = (
+            Data(None, cycle_id, vector.new(4, 1.0), vector.new(4, 2.0))
+            for cycle_id in range(3)
+        )
+        state = peer.ingest(data, batch_size=2, retries=1, backoff=0)
+        assert state == IngestionProgress(hidden=3, delivered=0, failed=3, retried=3)
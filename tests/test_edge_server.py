@@ -1,4 +1,7 @@
+from concurrent.futures import Future
 import random
+from threading import Event
+import time
 import pytest
 from private_billing.core import CycleID
 from src.private_billing.core.cycle import CycleContext
@@ -8,35 +11,53 @@ from src.private_billing.core.hiding import HidingContext
 from src.private_billing.core.masking import Int64ToFloatConvertor, SharedMaskGenerator
 from src.private_billing.core.utils import vector
 from src.private_billing.network import NoValidSignatureException, NodeInfo
-from src.private_billing.server import TCPAddress, PickleEncoder, Signer
+from src.private_billing.server import Envelope, TCPAddress, PickleEncoder, Signer
 from src.private_billing.core import Bill
 from src.private_billing import EdgeServer
+from src.private_billing.billing_scheduler import BillingScheduler
+from src.private_billing.message_encoding import BinaryEncoder
 from src.private_billing.messages import (
+    BillingMessageType,
     ConnectMessage,
+    ContextBatchMessage,
     ContextMessage,
     HiddenBillMessage,
+    HiddenDataBatchMessage,
     HiddenDataMessage,
     Message,
+    ReplayMessage,
+    RosterCompleteMessage,
+    RosterMessage,
     SeedMessage,
-    SignedMessage,
     UserType,
 )
 from tests.core.tools import HiddenBillMock
+from tests.server.test_lanes import wait_for
 
 
 class BaseEdgeServerMock(EdgeServer):
     def __init__(self, response_address: TCPAddress, cycle_length: int) -> None:
         super().__init__(response_address, cycle_length)
 
+        # Run billing in the triggering thread
+        self.billing_scheduler = BillingScheduler(self.bill_cycle, workers=0)
+
         # Store responses and sent messages
         self.__replies__ = []
         self.__sent__ = []
 
-    def async_execute(self, handler, *args) -> None:
+    def dispatch(self, message_type, handler, *args) -> None:
         handler(*args)
 
-    def send(self, message: Message, target: NodeInfo):
+    def send_async(self, message: Message, target: NodeInfo, sign: bool = True):
         self.__sent__.append((message, target))
+        future = Future()
+        future.set_result(b"")
+        return future
+
+    def send_frames_async(self, frames, target: TCPAddress):
+        envelope = Envelope.from_frames(frames)
+        return self.send_async(self.encoder.decode(envelope.payload), target)
 
     def reply(self, msg: Message) -> None:
         pass
@@ -46,6 +67,26 @@ class BaseEdgeServerMock(EdgeServer):
         return self.__sent__
 
 
+class PublisherMock:
+    def __init__(self) -> None:
+        self.published = []
+
+    @property
+    def sequence(self):
+        return len(self.published)
+
+    def publish(self, topic, frames):
+        self.published.append((topic, frames))
+        return len(self.published)
+
+    def replay(self, first, last):
+        return [
+            (seq, frames)
+            for seq, (_, frames) in enumerate(self.published, 1)
+            if first <= seq <= last
+        ]
+
+
 class TestEdgeServer:
 
     def random_node(self, role=UserType.CORE):
@@ -73,6 +114,44 @@ class TestEdgeServer:
 
         assert node.id in edge.shared_biller.clients
 
+    def test_onboarding(self):
+        response_address = TCPAddress("someaddress", 1234)
+        edge = BaseEdgeServerMock(response_address, 1024)
+        edge.encoder = BinaryEncoder
+        edge.onboarding_window = 60
+
+        def join(port: int) -> NodeInfo:
+            pk = Signer().get_transferable_public_key()
+            node = NodeInfo(TCPAddress("localhost", port), pk, UserType.CORE)
+            msg = ConnectMessage(node.address, pk, node.role, {node.address: node}, {})
+            edge.handle_connect(msg, edge.get_node_info(node.address))
+            return node
+
+        # Joins are collected, without connecting to anyone
+        nodes = [join(port) for port in range(701, 704)]
+        assert edge._sent == []
+        assert edge.joining == {node.address for node in nodes}
+
+        # The roster holds all members, and is sent to all of them
+        edge.publish_roster()
+        rosters = [(m, t) for m, t in edge._sent if isinstance(m, RosterMessage)]
+        assert {t for _, t in rosters} == {node.address for node in nodes}
+        for roster, _ in rosters:
+            assert roster.network_state.keys() == edge.network_members.keys()
+            assert roster.billing_state["cycle_length"] == 1024
+        completes = [t for m, t in edge._sent if isinstance(m, RosterCompleteMessage)]
+        assert set(completes) == {node.address for node in nodes}
+        assert edge.joining == set()
+
+        # Later joiners get all members; the others only the new member
+        edge.__sent__.clear()
+        late = join(704)
+        edge.publish_roster()
+        rosters = {t: m for m, t in edge._sent if isinstance(m, RosterMessage)}
+        assert len(rosters[late.address].network_state) == 5
+        for node in nodes:
+            assert rosters[node.address].network_state == {late.address: late}
+
     def test_handle_context_data(self):
         class EdgeServerMock(BaseEdgeServerMock):
             def try_run_billing(self, msg):
@@ -112,6 +191,166 @@ class TestEdgeServer:
         )
         assert len(sent_context_msg) == 3
 
+    def test_handle_context_batch(self):
+        edge = BaseEdgeServerMock(TCPAddress("someaddress", 1234), 4)
+        replies = []
+        edge.reply = replies.append
+        for _ in range(3):
+            edge.register_node(self.random_node()[3])
+
+        contexts = [
+            CycleContext(
+                cycle_id,
+                4,
+                vector.new(4, 0.21),
+                vector.new(4, 0.05),
+                vector.new(4, 0.11),
+            )
+            for cycle_id in range(3)
+        ]
+        contexts[1].retail_prices = vector.new(3, 0.21)
+        edge._handle(ContextBatchMessage(None, contexts))
+
+        # The outcome is reported per record
+        [result] = replies
+        assert result.errors[0] is None and result.errors[2] is None
+        assert "AssertionError" in result.errors[1]
+        assert edge.shared_biller.cycle_contexts.keys() == {0, 2}
+
+        # The accepted contexts are forwarded in a single batch to each peer
+        assert len(edge._sent) == 3
+        for sent, _ in edge._sent:
+            assert sent == ContextBatchMessage(edge.address, [contexts[0], contexts[2]])
+
+    def test_handle_hidden_data_batch(self):
+        class EdgeServerMock(BaseEdgeServerMock):
+            def try_run_billing(self, cycle_id):
+                self.triggered.append(cycle_id)
+
+        edge = EdgeServerMock(TCPAddress("someaddress", 1234), 4)
+        edge.triggered = []
+        replies = []
+        edge.reply = replies.append
+        node = self.random_node()[3]
+        edge.register_node(node)
+
+        def hidden_data(client, cycle_id):
+            masked = vector.new(4, 0.0)
+            ciphertexts = [None] * 5
+            return HiddenData(client, cycle_id, *ciphertexts, masked, masked, masked, None)
+
+        batch = [
+            hidden_data(node.id, 0),
+            hidden_data(node.id + 1, 0),
+            hidden_data(node.id, 1),
+        ]
+        edge.handle_hidden_data_batch(HiddenDataBatchMessage(node.address, batch), node)
+
+        # Data of unknown clients is rejected
+        [result] = replies
+        assert result.errors[0] is None and result.errors[2] is None
+        assert "unknown client" in result.errors[1]
+
+        # The accepted data is recorded, before billing of each cycle is attempted
+        assert edge.shared_biller.client_data == {
+            0: {node.id: batch[0]},
+            1: {node.id: batch[2]},
+        }
+        assert edge.triggered == [0, 1]
+
+    def test_bills_by_deadline(self):
+        class EdgeServerMock(BaseEdgeServerMock):
+            def __init__(self, response_address, cycle_length) -> None:
+                super().__init__(response_address, cycle_length)
+                self.billing_scheduler = BillingScheduler(self.bill_cycle)
+                self.billed, self.release = [], Event()
+
+            def bill_cycle(self, cycle_id):
+                self.billed.append(cycle_id)
+                self.release.wait()
+
+        edge = EdgeServerMock(TCPAddress("someaddress", 1234), 4)
+        ready = set()
+        edge.shared_biller.is_ready = ready.__contains__
+
+        # Contexts of cycles 0, 1 and 2 arrive in order
+        for cycle_id in range(3):
+            cyc = CycleContext(
+                cycle_id,
+                4,
+                vector.new(4, 0.21),
+                vector.new(4, 0.05),
+                vector.new(4, 0.11),
+            )
+            edge.handle_context_data(ContextMessage(None, cyc), None)
+        assert edge.get_billing_deadline(0) < edge.get_billing_deadline(1)
+
+        # While the live cycle is billed, backfill cycles become ready
+        for cycle_id in (2, 1, 0):
+            ready.add(cycle_id)
+            edge.try_run_billing(cycle_id)
+            time.sleep(0.05)
+        edge.release.set()
+        wait_for(lambda: len(edge.billed) == 3)
+        edge.billing_scheduler.close()
+
+        # Older cycles are due earlier, hence are billed first
+        assert edge.billed == [2, 0, 1]
+
+    def test_publishes_context_data(self):
+        response_address = TCPAddress("someaddress", 1234)
+        edge = BaseEdgeServerMock(response_address, 1024)
+        edge.publisher = PublisherMock()
+        for _ in range(3):
+            edge.register_node(self.random_node()[3])
+
+        cyclen = 4
+        cyc = CycleContext(
+            0,
+            cyclen,
+            vector.new(cyclen, 0.21),
+            vector.new(cyclen, 0.05),
+            vector.new(cyclen, 0.11),
+        )
+        edge.broadcast_context_data(cyc)
+
+        # Published once, as a signed envelope, instead of sent to each peer
+        assert edge._sent == []
+        [(topic, frames)] = edge.publisher.published
+        assert topic == BillingMessageType.CYCLE_CONTEXT.value.encode()
+        envelope = Envelope.from_frames(frames)
+        assert envelope.is_signed
+        assert edge.encoder.decode(envelope.payload).context == cyc
+
+    def test_announces_publish_sequence(self):
+        response_address = TCPAddress("someaddress", 1234)
+        edge = BaseEdgeServerMock(response_address, 1024)
+        edge.publish_port = 5594
+        edge.billing_state["publish_port"] = 5594
+
+        # Before publishing
+        assert edge.get_connect_message().billing_state["publish_sequence"] == 0
+
+        # After publishing
+        edge.publisher = PublisherMock()
+        for i in range(3):
+            edge.publish(ReplayMessage(edge.address, i, i))
+        assert edge.get_connect_message().billing_state["publish_sequence"] == 3
+        assert edge.get_roster_message(0).billing_state["publish_sequence"] == 3
+
+    def test_handle_replay(self):
+        response_address = TCPAddress("someaddress", 1234)
+        edge = BaseEdgeServerMock(response_address, 1024)
+        edge.publisher = PublisherMock()
+        for i in range(3):
+            edge.publish(ReplayMessage(edge.address, i, i))
+
+        node = self.random_node()[3]
+        edge.handle_replay(ReplayMessage(node.address, 2, 3), node)
+
+        replayed = [(m.first, t) for m, t in edge._sent]
+        assert replayed == [(1, node.address), (2, node.address)]
+
     def test_handle_hidden_data_requires_signature(self):
         # Create target
         msg = HiddenDataMessage(None, None)
@@ -141,7 +380,7 @@ class TestEdgeServer:
         msg = HiddenDataMessage(address, hd)
         msg_bytes = PickleEncoder.encode(msg)
         sgn = signer.sign(msg_bytes)
-        msg = SignedMessage(msg_bytes, sgn)
+        msg = Envelope(address, msg_bytes, sgn)
 
         # Handle message
         edge._handle(msg)
@@ -183,7 +422,7 @@ class TestEdgeServer:
             msg = HiddenDataMessage(address, hd)
             msg_bytes = PickleEncoder.encode(msg)
             sgn = signer.sign(msg_bytes)
-            msg = SignedMessage(msg_bytes, sgn)
+            msg = Envelope(address, msg_bytes, sgn)
 
             # Handle message
             edge._handle(msg)
@@ -208,3 +447,20 @@ class TestEdgeServer:
             filter(lambda x: isinstance(x[0], HiddenBillMessage), edge._sent)
         )
         assert len(sent_bill_msg) == 3
+
+    def test_streams_bills(self):
+        edge = BaseEdgeServerMock(TCPAddress("someaddress", 1234), 1024)
+        nodes = [self.random_node()[3] for _ in range(3)]
+        for node in nodes:
+            edge.register_node(node)
+
+        def compute_bills():
+            for i, node in enumerate(nodes):
+                # Earlier bills are sent before the next bill is computed
+                assert len(edge._sent) == i
+                yield node.id, HiddenBillMock(0, vector.new(4, 1), vector.new(4, 2))
+
+        edge.stream_hidden_bills(compute_bills())
+
+        assert [target for _, target in edge._sent] == nodes
+        assert all(isinstance(msg, HiddenBillMessage) for msg, _ in edge._sent)
@@ -0,0 +1,190 @@
+import pickle
+
+import pytest
+from src.private_billing.core import (
+    Bill,
+    CycleContext,
+    Data,
+    HidingContext,
+    Int64ToFloatConvertor,
+    SharedMaskGenerator,
+    vector,
+)
+from src.private_billing.message_encoding import BinaryEncoder, DecodingException
+from src.private_billing.messages import (
+    BatchResultMessage,
+    BillMessage,
+    ConnectMessage,
+    ContextBatchMessage,
+    ContextMessage,
+    DataBatchMessage,
+    DataMessage,
+    GetBillMessage,
+    HiddenDataBatchMessage,
+    HiddenDataMessage,
+    ReplayMessage,
+    RosterCompleteMessage,
+    RosterMessage,
+    SeedMessage,
+    SlotDataMessage,
+    UserType,
+)
+from src.private_billing.network import NodeInfo
+from src.private_billing.server import (
+    ECDSA,
+    HostedAddress,
+    InprocAddress,
+    IPCAddress,
+    PickleEncoder,
+    Signer,
+    TCPAddress,
+)
+from tests.core.tools import are_equal_ciphertexts
+
+
+ADDRESS = TCPAddress("localhost", 5555)
+
+
+class TestBinaryEncoder:
+
+    @pytest.mark.parametrize(
+        "msg",
+        (
+            SeedMessage(ADDRESS, 2**127 + 12345),
+            RosterMessage(ADDRESS, {}, {"cycle_length": 672}, 3, b"digest"),
+            RosterCompleteMessage(ADDRESS, 3, [ADDRESS, TCPAddress("otherhost", 1234)]),
+            RosterCompleteMessage(
+                IPCAddress("/tmp/edge.sock"), 3, [InprocAddress("core-1")]
+            ),
+            RosterCompleteMessage(
+                ADDRESS, 3, [HostedAddress(TCPAddress("localhost", 5556), "core-1")]
+            ),
+            ReplayMessage(ADDRESS, 3, 2**40),
+            GetBillMessage(ADDRESS, 3),
+            BillMessage(ADDRESS, None),
+            BillMessage(ADDRESS, Bill(1, vector([0.5, 1.5]), vector([0.0, 2.25]))),
+            DataMessage(None, Data(None, 0, vector([1.0, -2.0]), vector([3.5, 4.0]))),
+            DataMessage(ADDRESS, Data(2**64 - 1, 7, vector([1.0]), vector([-1.0]))),
+            ContextMessage(
+                None,
+                CycleContext(
+                    0, 2, vector([0.21, 0.21]), vector([0.05, 0.05]), vector([0.11, 0.11])
+                ),
+            ),
+            DataBatchMessage(
+                ADDRESS,
+                [
+                    Data(1, 0, vector([1.0, -2.0]), vector([3.5, 4.0])),
+                    Data(None, 1, vector([1.0]), vector([-1.0])),
+                ],
+            ),
+            DataBatchMessage(None, []),
+            ContextBatchMessage(
+                None,
+                [
+                    CycleContext(i, 1, vector([0.21]), vector([0.05]), vector([0.11]))
+                    for i in range(3)
+                ],
+            ),
+            BatchResultMessage(ADDRESS, [None, "ValueError('invalid')", None]),
+            SlotDataMessage(ADDRESS, 3, 94, [1.0, -2.0], [0.5, -1.5]),
+        ),
+    )
+    def test_encode_decode_consistent(self, msg):
+        enc = BinaryEncoder.encode(msg)
+        assert BinaryEncoder.decode(enc) == msg
+
+    def test_encode_decode_connect(self):
+        pk = Signer().get_transferable_public_key()
+        other = TCPAddress("otherhost", 1234)
+        network_state = {
+            ADDRESS: NodeInfo(ADDRESS, pk, UserType.EDGE),
+            other: NodeInfo(other, None, None),
+        }
+        billing_state = {"cycle_length": 672, "name": "test", "rate": 0.5}
+        signing_keys = {ECDSA: pk}
+        msg = ConnectMessage(
+            ADDRESS,
+            pk,
+            UserType.EDGE,
+            network_state,
+            billing_state,
+            signing_keys,
+            version=5,
+            known_version=3,
+            digest=b"digest",
+        )
+
+        dec = BinaryEncoder.decode(BinaryEncoder.encode(msg))
+
+        assert dec.pk == pk
+        assert dec.role == UserType.EDGE
+        assert dec.network_state == network_state
+        assert dec.billing_state == billing_state
+        assert dec.signing_keys == signing_keys
+        assert (dec.version, dec.known_version, dec.digest) == (5, 3, b"digest")
+
+    def test_encode_decode_hidden_data(self):
+        cycle_length = 16
+        mg = SharedMaskGenerator(Int64ToFloatConvertor(4, 4))
+        hc = HidingContext(cycle_length, mg)
+        data = Data(5, 1, vector.new(cycle_length, 1), vector.new(cycle_length, 2))
+        hd = data.hide(hc)
+        hd.phc = None
+        msg = HiddenDataMessage(ADDRESS, hd)
+
+        dec = BinaryEncoder.decode(BinaryEncoder.encode(msg)).data
+
+        assert dec.client == hd.client
+        assert dec.cycle_id == hd.cycle_id
+        assert dec.masked_individual_deviations == hd.masked_individual_deviations
+        assert are_equal_ciphertexts(dec.consumptions, hd.consumptions, hc)
+        assert are_equal_ciphertexts(dec.supplies, hd.supplies, hc)
+
+    def test_encode_decode_hidden_data_batch(self):
+        cycle_length = 16
+        mg = SharedMaskGenerator(Int64ToFloatConvertor(4, 4))
+        hc = HidingContext(cycle_length, mg)
+        batch = []
+        for cycle_id in range(2):
+            promises = vector.new(cycle_length, 1)
+            utilizations = vector.new(cycle_length, 2)
+            batch.append(Data(5, cycle_id, promises, utilizations).hide(hc))
+            batch[-1].phc = None
+        msg = HiddenDataBatchMessage(ADDRESS, batch)
+
+        dec = BinaryEncoder.decode(BinaryEncoder.encode(msg)).data
+
+        assert [hd.cycle_id for hd in dec] == [0, 1]
+        for dec_hd, hd in zip(dec, batch):
+            assert dec_hd.masked_p2p_consumer_flags == hd.masked_p2p_consumer_flags
+            assert are_equal_ciphertexts(dec_hd.consumptions, hd.consumptions, hc)
+
+    def test_empty_reply(self):
+        assert BinaryEncoder.encode("") == b""
+        assert BinaryEncoder.decode(b"") is None
+
+    def test_smaller_than_pickle(self):
+        data = Data(0, 0, vector.new(672, 1.5), vector.new(672, 2.5))
+        msg = DataMessage(ADDRESS, data)
+        assert len(BinaryEncoder.encode(msg)) < len(PickleEncoder.encode(msg))
+
+    def test_rejects_pickle(self):
+        with pytest.raises(DecodingException):
+            BinaryEncoder.decode(pickle.dumps(GetBillMessage(ADDRESS, 3)))
+
+    def test_rejects_truncated(self):
+        enc = BinaryEncoder.encode(GetBillMessage(ADDRESS, 3))
+        with pytest.raises(DecodingException):
+            BinaryEncoder.decode(enc[:-1])
+
+    def test_rejects_unknown_billing_state_tag(self):
+        pk = Signer().get_transferable_public_key()
+        msg = ConnectMessage(ADDRESS, pk, UserType.CORE, {}, {"cycle_length": 672})
+        enc = bytearray(BinaryEncoder.encode(msg))
+
+        # Corrupt the value tag, which follows the key
+        tag_index = enc.index(b"cycle_length") + len("cycle_length")
+        enc[tag_index] = 0xFF
+        with pytest.raises(DecodingException):
+            BinaryEncoder.decode(bytes(enc))
@@ -0,0 +1,111 @@
+from src.private_billing.network import MembershipRegistry, NodeInfo
+from src.private_billing.server import Signer, TCPAddress
+from src.private_billing.messages import UserType
+
+
+def make_node(port: int, role: UserType = UserType.CORE) -> NodeInfo:
+    pk = Signer().get_transferable_public_key()
+    return NodeInfo(TCPAddress("localhost", port), pk, role)
+
+
+class TestMembershipRegistry:
+
+    def test_owner_is_member_not_peer(self):
+        owner = make_node(5555, UserType.EDGE)
+        registry = MembershipRegistry(owner)
+
+        assert registry[owner.address] is owner
+        assert len(registry) == 1
+        assert registry.peers == ()
+        assert registry.edges == ()
+
+    def test_views_by_role(self):
+        owner = make_node(5555, UserType.EDGE)
+        registry = MembershipRegistry(owner)
+        core = make_node(5556, UserType.CORE)
+        edge = make_node(5557, UserType.EDGE)
+        registry.register(core)
+        registry.register(edge)
+
+        assert set(registry.peers) == {core, edge}
+        assert registry.cores == (core,)
+        assert registry.edges == (edge,)
+
+    def test_views_invalidated_on_register(self):
+        registry = MembershipRegistry(make_node(5555, UserType.EDGE))
+        assert registry.cores == ()
+        assert registry.cores is registry.cores
+
+        core = make_node(5556)
+        registry[core.address] = core
+        assert registry.cores == (core,)
+
+        del registry[core.address]
+        assert registry.cores == ()
+
+    def test_get_by_id(self):
+        registry = MembershipRegistry(make_node(5555, UserType.EDGE))
+        core = make_node(5556)
+        registry.register(core)
+
+        assert registry.get_by_id(core.id, UserType.CORE) is core
+        assert registry.get_by_id(core.id, UserType.EDGE) is None
+
+        # Replacing a member drops its old id
+        replacement = make_node(5556)
+        registry.register(replacement)
+        assert registry.get_by_id(core.id, UserType.CORE) is None
+        assert registry.get_by_id(replacement.id, UserType.CORE) is replacement
+
+    def test_changes_since(self):
+        owner = make_node(5555, UserType.EDGE)
+        registry = MembershipRegistry(owner)
+        start = registry.version
+        core = make_node(5556)
+        edge = make_node(5557, UserType.EDGE)
+        registry.register(core)
+        registry.register(edge)
+
+        delta = registry.changes_since(start)
+        assert delta.members == {core.address: core, edge.address: edge}
+        assert delta.version == registry.version
+        assert delta.digest == registry.digest
+
+        assert registry.changes_since(0).members.keys() == registry.keys()
+        assert registry.changes_since(start, exclude=[core.address]).members == {
+            edge.address: edge
+        }
+        assert registry.changes_since(registry.version).members == {}
+
+    def test_digest(self):
+        owner = make_node(5555, UserType.EDGE)
+        core = make_node(5556)
+        registry = MembershipRegistry(owner)
+        before = registry.digest
+        registry.register(core)
+        assert registry.digest != before
+
+        # Independent of the order of registration
+        other = MembershipRegistry(core)
+        other.register(owner)
+        assert other.digest == registry.digest
+
+    def test_get_node_info_of_unknown(self):
+        registry = MembershipRegistry(make_node(5555))
+        address = TCPAddress("localhost", 6000)
+
+        node = registry.get_node_info(address)
+        assert node.address == address
+        assert node.pk is None
+        assert address not in registry
+
+
+class TestNodeInfo:
+
+    def test_id_follows_pk(self):
+        node = make_node(5555)
+        first = node.id
+        assert node.id == first
+
+        node.pk = Signer().get_transferable_public_key()
+        assert node.id != first